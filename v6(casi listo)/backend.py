@@ -10,6 +10,12 @@ from collections import deque
 from queue import Queue, Empty
 from PyQt6.QtCore import QThread, pyqtSignal
 from PyQt6.QtWidgets import QMessageBox
+from storage import (SegmentedCsvWriter, CompressedCsvWriter, MmapRecordingWriter,
+                     EventLogWriter, PyramidWriter)
+from historian import HistorianWriter
+from codec import CodecWriter
+from tsstore import TSStore, TSStoreWriter
+from edf import EdfWriter, EDF_FILE
 
 
 MAX_QUEUE_SIZE = 5000  # protección contra sobrecarga de cola
@@ -24,11 +30,72 @@ class ErrorWindow(QMessageBox):
         self.setWindowTitle("Error")
 
 
+class FlushWorker(threading.Thread):
+    """
+    Hilo de E/S del doble buffer: escribe el buffer de respaldo mientras
+    WriterThread sigue llenando el otro. Mide la latencia de cada escritura.
+    """
+
+    def __init__(self, write_fn):
+        super().__init__(daemon=True)
+        self.write_fn = write_fn
+        self.back = None
+        self.retry = []             # filas de una escritura fallida, se reintentan
+        self.ready = threading.Event()
+        self.idle = threading.Event()
+        self.idle.set()
+        self.stop_flag = False
+
+        self.busy_since = None
+        self.last_latency = 0.0
+        self.mean_latency = 0.0     # media móvil exponencial
+        self.max_latency = 0.0
+        self.rows_written = 0
+
+    def submit(self, rows):
+        """Entrega un buffer lleno. Solo llamar cuando idle está activo."""
+        self.back = self.retry + rows
+        self.retry = []
+        self.idle.clear()
+        self.busy_since = time.time()
+        self.ready.set()
+
+    def run(self):
+        while True:
+            self.ready.wait()
+            self.ready.clear()
+            if self.back is not None:
+                rows, self.back = self.back, None
+                t0 = time.perf_counter()
+                if self.write_fn(rows):
+                    self.rows_written += len(rows)
+                else:
+                    self.retry = rows
+                latency = time.perf_counter() - t0
+                self.last_latency = latency
+                self.mean_latency = latency if not self.mean_latency else 0.8 * self.mean_latency + 0.2 * latency
+                self.max_latency = max(self.max_latency, latency)
+                self.busy_since = None
+                self.idle.set()
+            if self.stop_flag:
+                break
+
+    def stop(self):
+        self.stop_flag = True
+        self.ready.set()
+
+
 class WriterThread(threading.Thread):
-    """Hilo dedicado a escribir datos a disco (CSV o Parquet)."""
+    """
+    Hilo dedicado a vaciar la cola de datos. El formateo y la escritura a disco
+    (CSV, CSV comprimido, binario mapeado o Parquet) corren en un FlushWorker con doble buffer,
+    así una escritura lenta (USB, red) no detiene el vaciado de la cola.
+    """
 
     def __init__(self, file_path, unit, data_queue, flush_interval=1.0, max_buffer_size=100,
-                 file_format="csv", temp_dir="temp"):
+                 file_format="csv", temp_dir="temp", segment_duration=None, segment_max_bytes=None,
+                 pyramid_levels=None, on_warning=None, stall_timeout=None, warn_interval=60,
+                 historian_tolerances=None, tsstore_root=None, device=None, edf_manifest=None):
         super().__init__(daemon=True)
         self.file_path = file_path
         self.unit = unit
@@ -39,15 +106,73 @@ class WriterThread(threading.Thread):
         self.buffer = []
         self.last_flush = time.time()
         self.stop_flag = False
-        self.header_written = False
         self.temp_dir = temp_dir
         self.block_count = 0
 
+        # Segmentos rotativos por duración (s) o tamaño (bytes) + segments.json
+        self.segment_duration = segment_duration
+        self.segment_max_bytes = segment_max_bytes
+        self.csv_writer = None  # SegmentedCsvWriter, CompressedCsvWriter, MmapRecordingWriter, CodecWriter o HistorianWriter
+        self.events = None
+        self.historian_tolerances = historian_tolerances
+        self.raw = False  # modo historiador: guardar cada muestra tal cual
+
+        # Niveles decimados min/max/media para visualizar sesiones largas
+        self.pyramid_levels = pyramid_levels
+        self.pyramid = None
+
+        # Almacén de series compartido por todas las sesiones (tsstore.py)
+        self.tsstore_root = tsstore_root
+        self.device = device
+        self.tsstore = None
+
+        # Copia EDF+ en vivo (data.edf) para herramientas de señales biomédicas
+        self.edf_manifest = edf_manifest
+        self.edf = None
+
+        # Doble buffer + detección de disco lento
+        self.io_worker = FlushWorker(self._flush)
+        self.on_warning = on_warning
+        self.stall_timeout = stall_timeout or 5 * flush_interval
+        self.warn_interval = warn_interval
+        self.last_warning = 0.0
+
         #if self.file_format == "parquet":
         #    os.makedirs(self.temp_dir, exist_ok=True)
 
     def run(self):
         try:
+            if self.file_format == "csv":
+                self.csv_writer = SegmentedCsvWriter(self.file_path,
+                                                     segment_duration=self.segment_duration,
+                                                     segment_max_bytes=self.segment_max_bytes)
+            elif self.file_format in ("csv.gz", "csv.zst"):
+                # Frames comprimidos con tabla de saltos; comprime el hilo de E/S, no el de adquisición
+                self.csv_writer = CompressedCsvWriter(self.file_path,
+                                                      codec=self.file_format.split(".")[1])
+            elif self.file_format == "bin":
+                # data.bin preasignado por extents y escrito vía mmap
+                self.csv_writer = MmapRecordingWriter(self.file_path, self._columns()[:4])
+            elif self.file_format == "qdc":
+                # data.qdc: tiempo en delta de delta, canales x10 en delta, zigzag + varint por bloques
+                self.csv_writer = CodecWriter(os.path.splitext(self.file_path)[0] + ".qdc", self._columns())
+            elif self.file_format == "hist":
+                # Solo puntos de quiebre por canal (swinging door) con tolerancia por canal
+                self.csv_writer = HistorianWriter(os.path.dirname(self.file_path) or ".",
+                                                  self._columns()[:4], self.historian_tolerances)
+                self.csv_writer.set_raw(self.raw)
+            self.events = EventLogWriter(os.path.dirname(self.file_path) or ".")
+            if self.tsstore_root:
+                store = TSStore(self.tsstore_root)
+                self.tsstore = TSStoreWriter(store, store.session_key(os.path.dirname(os.path.abspath(self.file_path))),
+                                             self.device)
+            if self.edf_manifest is not None:
+                self.edf = EdfWriter(os.path.join(os.path.dirname(self.file_path) or ".", EDF_FILE),
+                                     self.edf_manifest)
+            if self.pyramid_levels:
+                self.pyramid = PyramidWriter(os.path.dirname(self.file_path) or ".",
+                                             levels=self.pyramid_levels)
+            self.io_worker.start()
             while not self.stop_flag:
                 try:
                     item = self.data_queue.get(timeout=self.flush_interval)
@@ -57,39 +182,112 @@ class WriterThread(threading.Thread):
 
                 now = time.time()
                 if len(self.buffer) >= self.max_buffer_size or (now - self.last_flush) >= self.flush_interval:
-                    self._flush()
+                    self._swap_buffers(now)
         except Exception as e:
             print(f"[WriterThread] Error inesperado: {e}")
         finally:
             try:
-                self._flush()  # Flush final
+                # Lo que quedó en la cola también se guarda
+                while True:
+                    try:
+                        self.buffer.append(self.data_queue.get_nowait())
+                    except Empty:
+                        break
+                if self.io_worker.is_alive():
+                    self.io_worker.idle.wait()
+                    self.io_worker.stop()
+                    self.io_worker.join()
+                self._flush(self.io_worker.retry + self.buffer)  # Flush final
+                if self.csv_writer:
+                    self.csv_writer.close()
+                if self.events:
+                    self.events.close()
+                if self.pyramid:
+                    self.pyramid.close()
+                if self.tsstore:
+                    self.tsstore.close()
+                if self.edf:
+                    self.edf.close()
                 #if self.file_format == "parquet":
                 #    self._merge_parquet_files()
                 print("[WriterThread] Cerrado correctamente.")
             except Exception as e:
                 print(f"[WriterThread] Error en cierre: {e}")
 
-    def _flush(self):
-        if not self.buffer:
-            return
+    def _swap_buffers(self, now):
+        """Entrega el buffer lleno al hilo de E/S si está libre; si no, sigue llenando."""
+        if self.io_worker.idle.is_set():
+            if self.buffer or self.io_worker.retry:
+                self.io_worker.submit(self.buffer)
+                self.buffer = []
+            self.last_flush = now
+        self._check_stall(now)
+
+    def set_raw(self, enabled):
+        """Modo historiador: guarda todas las muestras desde el próximo bloque."""
+        self.raw = bool(enabled)
+        if isinstance(self.csv_writer, HistorianWriter):
+            self.csv_writer.set_raw(enabled)
+
+    def flush_stats(self):
+        """Latencias de escritura (s) y filas aún en memoria."""
+        worker = self.io_worker
+        busy_for = time.time() - worker.busy_since if worker.busy_since else 0.0
+        return {
+            "last_latency": worker.last_latency,
+            "mean_latency": worker.mean_latency,
+            "max_latency": worker.max_latency,
+            "busy_for": busy_for,
+            "pending_rows": len(self.buffer) + len(worker.retry),
+            "rows_written": worker.rows_written,
+        }
+
+    def _check_stall(self, now):
+        """Avisa si el disco no alcanza el ritmo de llegada, antes de perder datos."""
+        stats = self.flush_stats()
+        msg = None
+        if stats["busy_for"] > self.stall_timeout:
+            msg = (f"El disco no responde hace {stats['busy_for']:.1f} s; "
+                   f"{stats['pending_rows']} muestras esperan en memoria.")
+        elif self.io_worker.retry:
+            msg = f"Fallo al escribir en disco; {stats['pending_rows']} muestras esperan en memoria."
+        elif stats["mean_latency"] > 0.8 * self.flush_interval:
+            msg = (f"Escritura lenta: {stats['mean_latency'] * 1000:.0f} ms por bloque "
+                   f"(intervalo {self.flush_interval * 1000:.0f} ms). El disco podría no dar abasto.")
+        if msg and now - self.last_warning >= self.warn_interval:
+            self.last_warning = now
+            print(f"[WriterThread] Advertencia: {msg}")
+            if self.on_warning:
+                self.on_warning(msg)
+
+    def _columns(self):
+        return ["Time", f"Pressure ({self.unit})", "Temperature[°C]", "Flow[mL/min]", "Events"]
+
+    def _flush(self, rows):
+        """Formatea y escribe un buffer (corre en el FlushWorker). True si se escribió."""
+        if not rows:
+            return True
 
         try:
-            df = pd.DataFrame(
-                self.buffer,
-                columns=["Time", f"Pressure ({self.unit})", "Temperature[°C]", "Flow[mL/min]", "Events"]
-            )
+            df = pd.DataFrame(rows, columns=self._columns())
 
-            if self.file_format == "csv":
-                df.to_csv(self.file_path, mode='a', index=False, header=not self.header_written)
-                self.header_written = True
+            if self.file_format in ("csv", "csv.gz", "csv.zst", "bin", "qdc", "hist"):
+                self.csv_writer.write_block(df)
 
             #elif self.file_format == "parquet":
             #    self.block_count += 1
             #    block_name = f"{self.temp_dir}/block_{self.block_count:04d}.parquet"
             #    df.to_parquet(block_name, index=False)
 
-            self.buffer.clear()
-            self.last_flush = time.time()
+            # Sumideros secundarios: el bloque ya está en disco, un error acá no debe reintentarlo (y duplicarlo)
+            for sink, what in ((self.events, "los hitos"), (self.pyramid, "la pirámide"),
+                               (self.tsstore, "en el almacén"), (self.edf, "el EDF")):
+                if sink is not None:
+                    try:
+                        sink.write_block(df)
+                    except Exception as e:
+                        print(f"[WriterThread] Error al escribir {what}: {e}")
+            return True
 
         except PermissionError:
             print(f"[WriterThread] Error: permiso denegado al escribir {self.file_path}.")
@@ -97,6 +295,7 @@ class WriterThread(threading.Thread):
             print(f"[WriterThread] Error de disco: {e}")
         except Exception as e:
             print(f"[WriterThread] Error inesperado en _flush: {e}")
+        return False
 
     def _merge_parquet_files(self):
         """Combina todos los bloques parquet temporales en un solo archivo final."""
@@ -120,9 +319,12 @@ class WriterThread(threading.Thread):
 class SerialReader(QThread):
     readings = pyqtSignal(str)
     warning_signal = pyqtSignal(str)  # <-- para mostrar popups seguros
+    disk_warning_signal = pyqtSignal(str)  # avisos del escritor (disco lento): no son fatales, sin popup
 
     def __init__(self, port, file_path, unit="mmHg", flush_interval=1.0,
-                 max_buffer_size=100, file_format="csv"):
+                 max_buffer_size=100, file_format="csv", segment_duration=None,
+                 segment_max_bytes=None, pyramid_levels=None, historian_tolerances=None,
+                 tsstore_root=None, record_edf=False, manifest=None):
         super().__init__()
         self.data_queue = Queue()
         self.port = port
@@ -131,13 +333,24 @@ class SerialReader(QThread):
                                    data_queue=self.data_queue,
                                    flush_interval=flush_interval,
                                    max_buffer_size=max_buffer_size,
-                                   file_format=file_format)
+                                   file_format=file_format,
+                                   segment_duration=segment_duration,
+                                   segment_max_bytes=segment_max_bytes,
+                                   pyramid_levels=pyramid_levels,
+                                   on_warning=self.disk_warning_signal.emit,
+                                   historian_tolerances=historian_tolerances,
+                                   tsstore_root=tsstore_root, device=port,
+                                   edf_manifest=manifest if record_edf else None)
+        self.manifest = manifest  # SessionManifest: registra cada cambio de ajustes
 
         self.n_flow = 0.0
         self.n_pressure = 0.0
         self.flow_direction = 1
         self.temp_last_5 = deque(maxlen=25)
         self.pending_hito = None
+        self.device_banner = []  # primeras líneas no numéricas del equipo (firmware, etc.)
+        self.samples = 0         # filas encoladas; ubica cada cambio de ajustes en los datos
+        self.last_t = None
         self.stop = False
 
         self.serialCom = None
@@ -237,6 +450,8 @@ class SerialReader(QThread):
     def _process_line(self, line):
         """Parsea texto y guarda en la cola."""
         if not line or not line[0].isdigit():
+            if line and len(self.device_banner) < 5:
+                self.device_banner.append(line)
             return None
         parts = line.split(" ")
         if len(parts) < 4:
@@ -263,6 +478,8 @@ class SerialReader(QThread):
                     pass
 
             self.data_queue.put([t, pressure, temp, flow, event])
+            self.samples += 1
+            self.last_t = t
 
             return {
                 "time": t,
@@ -280,15 +497,44 @@ class SerialReader(QThread):
         print(f"[SerialReader] Realizando tare a {type} con valor {data}...")
         data = float(data)
         if type == "pressure":
+            old = self.n_pressure
             self.n_pressure -= data
+            self._log_setting("pressure_offset", old, self.n_pressure, value=data, raw=data - old)
         else:
+            old = self.n_flow
             self.n_flow -= data
+            self._log_setting("flow_offset", old, self.n_flow, value=data,
+                              raw=data / self.flow_direction - old)
         print(f"[SerialReader] Tare realizado a {type}. Nuevo offset: {-data}")
     
     def set_direction_flow(self):
+        old = self.flow_direction
         self.flow_direction = -self.flow_direction
+        self._log_setting("flow_direction", old, self.flow_direction)
         print(f"[SerialReader] Dirección de flujo cambiada. Nueva dirección: {self.flow_direction}")
 
+    def set_raw_storage(self, enabled):
+        """Modo historiador: guardar (o no) cada muestra sin comprimir."""
+        old = self.writer.raw
+        self.writer.set_raw(enabled)
+        if old != bool(enabled):
+            self._log_setting("raw_storage", old, bool(enabled))
+        print(f"[SerialReader] Registro crudo {'activado' if enabled else 'desactivado'}.")
+
+    def _log_setting(self, setting, old, new, value=None, raw=None):
+        """
+        Guarda el cambio en el historial de la sesión. `sample` es la primera
+        fila grabada con el ajuste nuevo; `value` es la lectura usada para el
+        tare y `raw` la misma lectura sin transformar.
+        """
+        if self.manifest is None:
+            return
+        try:
+            self.manifest.log_setting(setting, old, new, t=self.last_t, sample=self.samples,
+                                      value=value, raw=raw)
+        except Exception as e:
+            print(f"[SerialReader] No se pudo registrar el cambio de {setting}: {e}")
+
     def queue(self, type, value):
         if type == "temperature":
             self.temp_last_5.append(value)
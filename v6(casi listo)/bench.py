@@ -0,0 +1,352 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")  # sin pantalla: se pinta igual, en memoria
+
+import numpy as np
+import pandas as pd
+from PyQt6.QtWidgets import QApplication
+from PyQt6.QtCore import QThread, QTimer, QEventLoop, pyqtSignal
+
+from frontend import RecordingWindow, MAX_POINTS
+from storage import SegmentedCsvWriter
+
+
+BENCH_RATES = (20, 200, 2000)      # Hz de la fuente sintética
+BENCH_WINDOWS = (10, 240, None)    # segundos en ventana (None: sesión completa)
+BENCH_SECONDS = 10                 # duración medida de cada escenario
+PREFILL_MAX_SAMPLES = 100000       # datos previos cargados antes de medir (ventana llena)
+EVENT_SECONDS = 60                 # un hito sintético cada tanto
+BASELINE_FILE = "bench_baseline.json"
+REGRESSION_TOLERANCE = 0.25        # +25 % sobre la línea base ...
+REGRESSION_SLACK = {               # ... más un margen absoluto, para no marcar ruido en valores chicos
+    "frame_p50_ms": 0.5,
+    "frame_p95_ms": 2.0,
+    "frame_p99_ms": 4.0,
+    "panel_p50_ms": 0.5,
+    "cpu_percent": 5.0,
+    "gui_cpu_percent": 5.0,
+    "missed_ticks": 2,
+}
+
+
+# ===========================================================
+# ===                 FUENTE SINTÉTICA                    ===
+# ===========================================================
+
+class SyntheticReader(QThread):
+    """
+    Reemplaza a SerialReader: emite lecturas JSON a `rate` Hz desde su
+    propio hilo, en ráfagas como llegan por el puerto. No graba nada.
+    """
+    readings = pyqtSignal(str)
+    warning_signal = pyqtSignal(str)
+    disk_warning_signal = pyqtSignal(str)
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+        self.sent = 0
+        self.stop = False
+        self.device_banner = []
+        self.pending_hito = None
+
+    def sample(self, i):
+        t = i / self.rate
+        event = ""
+        if self.pending_hito:
+            event, self.pending_hito = self.pending_hito, None
+        elif i and i % (EVENT_SECONDS * self.rate) == 0:
+            event = f"hito {i // (EVENT_SECONDS * self.rate)}"
+        return {
+            "time": round(t, 3),
+            "pressure": round(80 + 20 * np.sin(2 * np.pi * 1.2 * t) + np.random.normal(0, 0.5), 1),
+            "temp": round(37 + 0.2 * np.sin(2 * np.pi * t / 600), 1),
+            "flow": round(150 + 30 * np.sin(2 * np.pi * 0.3 * t), 1),
+            "event": event,
+        }
+
+    def run(self):
+        first, start = self.sent, time.perf_counter()
+        while not self.stop:
+            due = first + int((time.perf_counter() - start) * self.rate)
+            while self.sent < due:
+                self.readings.emit(json.dumps(self.sample(self.sent)))
+                self.sent += 1
+            time.sleep(0.001)
+
+    # --- misma interfaz que SerialReader ---
+    def add_hito(self, event_text):
+        self.pending_hito = event_text
+
+    def tare(self, type, data):
+        pass
+
+    def set_direction_flow(self):
+        pass
+
+    def set_raw_storage(self, enabled):
+        pass
+
+    def end_reading(self):
+        self.stop = True
+
+
+# ===========================================================
+# ===                    ESCENARIOS                       ===
+# ===========================================================
+
+def _timed(fn, out):
+    def wrapper(*args):
+        t0 = time.perf_counter()
+        fn(*args)
+        out.append((time.perf_counter() - t0) * 1000)
+    return wrapper
+
+
+def _percentile(values, q):
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def scenario_name(rate, window):
+    return f"{rate}Hz-{'completo' if window is None else f'{window:g}s'}"
+
+
+def run_scenario(rate, window, seconds=BENCH_SECONDS, paint=False):
+    """
+    Una RecordingWindow con fuente sintética: tiempos de cuadro, CPU y ticks
+    perdidos. Sin `paint` no se pintan los gráficos: en offscreen no hay GL y
+    el pintado por software (líneas anchas con antialias) tapa todo lo demás.
+    """
+    folder = tempfile.mkdtemp(prefix="bench_")
+    reader = SyntheticReader(rate)
+    w = RecordingWindow("BENCH", os.path.join(folder, "data.csv"), reader=reader)
+    w.update_catalog = lambda: None  # no es una sesión real: sin catálogo
+    if QApplication.platformName() == "offscreen":
+        w.graphs_widget.useOpenGL(False)  # sin contexto GL
+        w.graphs_widget.setUpdatesEnabled(paint)  # mantiene su tamaño (y la decimación por píxel)
+
+    if window is None:
+        w.scale_drop.setCurrentIndex(0)
+    else:
+        w.scale_drop.setCurrentIndex(1)
+        w.seconds_box.setText(f"{window:g}")
+    w.adjust_time()
+
+    # Ventana llena antes de medir (por el mismo camino que las lecturas en vivo)
+    prefill = PREFILL_MAX_SAMPLES if window is None else min(int(window * rate) + rate, PREFILL_MAX_SAMPLES)
+    for i in range(prefill):
+        w.process_new_data(json.dumps(reader.sample(i)))
+    reader.sent = prefill
+
+    # --- instrumentación: cuadros, panel y ticks del temporizador ---
+    frames, panels, ticks = [], [], []
+    w.update_graphs = _timed(w.update_graphs, frames)  # render_frame la busca en la instancia
+    w.summary.timer.timeout.disconnect()
+    w.summary.timer.timeout.connect(_timed(w.summary.update_panel, panels))
+    w.update_timer.timeout.disconnect()
+
+    def tick():
+        ticks.append((time.perf_counter(), w.frame_interval))
+        w.render_frame()
+    w.update_timer.timeout.connect(tick)
+
+    loop = QEventLoop()
+    QTimer.singleShot(int(seconds * 1000), loop.quit)
+    cpu0, gui0, wall0 = time.process_time(), time.thread_time(), time.perf_counter()
+    received0 = w.buffer.count
+    w.start_recording()
+    loop.exec()
+    wall = time.perf_counter() - wall0
+    cpu, gui = time.process_time() - cpu0, time.thread_time() - gui0
+
+    reader.end_reading()
+    reader.wait()
+    received = w.buffer.count - received0
+    w.update_timer.stop()
+    w.summary.timer.stop()
+    w.close()
+    w.deleteLater()
+    shutil.rmtree(folder, ignore_errors=True)
+
+    # Tick perdido: el temporizador llegó una o más veces su intervalo tarde (event loop ocupado)
+    missed = 0
+    for (t_prev, interval), (t_next, _) in zip(ticks, ticks[1:]):
+        missed += max(0, int((t_next - t_prev) * 1000 / interval + 0.5) - 1)
+
+    return {
+        "frames": len(frames),
+        "frame_p50_ms": _percentile(frames, 50),
+        "frame_p95_ms": _percentile(frames, 95),
+        "frame_p99_ms": _percentile(frames, 99),
+        "frame_max_ms": max(frames, default=0.0),
+        "panel_p50_ms": _percentile(panels, 50),
+        "panel_max_ms": max(panels, default=0.0),
+        "cpu_percent": 100 * cpu / wall,
+        "gui_cpu_percent": 100 * gui / wall,  # hilo de la interfaz: cuadros, pintado y lecturas
+        "missed_ticks": missed,
+        "frame_interval_ms": float(w.frame_interval),
+        "samples_sent": reader.sent - prefill,
+        "samples_received": received,
+    }
+
+
+def check_disk_scrollback(rate=20):
+    """
+    En pausa, una vista más vieja que el buffer crudo se lee del disco: graba
+    una sesión segmentada más larga que el buffer, la pasa por la ventana y
+    comprueba que el tramo inicial vuelve con sus filas. Devuelve las fallas.
+    """
+    folder = tempfile.mkdtemp(prefix="check_")
+    reader = SyntheticReader(rate)
+    w = RecordingWindow("CHECK", os.path.join(folder, "data.csv"), reader=reader)
+    w.update_catalog = lambda: None
+    failures = []
+    try:
+        samples = [reader.sample(i) for i in range(2 * MAX_POINTS)]
+        writer = SegmentedCsvWriter(os.path.join(folder, "data.csv"), segment_duration=60)
+        writer.write_block(pd.DataFrame([(s["time"], s["pressure"], s["temp"], s["flow"], s["event"])
+                                         for s in samples],
+                                        columns=["Time", "Pressure (mmHg)", "Temperature[°C]",
+                                                 "Flow[mL/min]", "Events"]))
+        for s in samples:
+            w.process_new_data(json.dumps(s))
+
+        t_min, t_max = 10.0, 20.0  # el buffer empieza en MAX_POINTS / rate segundos
+        expected = sum(t_min <= s["time"] <= t_max for s in samples)
+        for name, (t, v) in zip(("presión", "flujo", "temperatura"), w._paused_data(t_min, t_max)):
+            if len(t) != expected or (len(t) and (t[0] < t_min or t[-1] > t_max)):
+                failures.append(f"{name}: {len(t)} muestras en [{t_min:g}, {t_max:g}], se esperaban {expected}")
+    finally:
+        w.close()
+        w.deleteLater()
+        shutil.rmtree(folder, ignore_errors=True)
+    return failures
+
+
+# ===========================================================
+# ===                  LÍNEA BASE                         ===
+# ===========================================================
+
+def machine_info():
+    return {"node": platform.node(), "machine": platform.machine(),
+            "python": platform.python_version(), "platform": platform.platform()}
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(path, results, paint=False):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"machine": machine_info(), "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+                   "paint": paint, "results": results}, f, indent=2)
+
+
+def compare(results, baseline, tolerance=REGRESSION_TOLERANCE):
+    """Lista de regresiones: métrica nueva > base * (1 + tolerancia) + margen absoluto."""
+    regressions = []
+    for name, res in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        for metric, slack in REGRESSION_SLACK.items():
+            old, new = base.get(metric), res.get(metric)
+            if old is not None and new is not None and new > old * (1 + tolerance) + slack:
+                regressions.append(f"{name} {metric}: {old:.2f} -> {new:.2f}")
+    return regressions
+
+
+def print_results(results, baseline=None):
+    print(f"{'escenario':<16}{'cuadros':>8}{'p50':>8}{'p95':>8}{'p99':>8}{'panel':>8}"
+          f"{'CPU %':>8}{'GUI %':>8}{'perdidos':>9}{'recibidas':>11}")
+    for name, r in results.items():
+        print(f"{name:<16}{r['frames']:>8}{r['frame_p50_ms']:>8.2f}{r['frame_p95_ms']:>8.2f}"
+              f"{r['frame_p99_ms']:>8.2f}{r['panel_p50_ms']:>8.2f}{r['cpu_percent']:>8.1f}"
+              f"{r['gui_cpu_percent']:>8.1f}{r['missed_ticks']:>9}"
+              f"{r['samples_received']:>6}/{r['samples_sent']}")
+        base = baseline["results"].get(name) if baseline else None
+        if base:
+            print(f"{'  (base)':<16}{base['frames']:>8}{base['frame_p50_ms']:>8.2f}{base['frame_p95_ms']:>8.2f}"
+                  f"{base['frame_p99_ms']:>8.2f}{base['panel_p50_ms']:>8.2f}{base['cpu_percent']:>8.1f}"
+                  f"{base['gui_cpu_percent']:>8.1f}{base['missed_ticks']:>9}")
+
+
+# ===========================================================
+# ===                       CLI                           ===
+# ===========================================================
+
+if __name__ == "__main__":
+    # python bench.py [--seconds s] [--rates 20,200,2000] [--windows 10,240,completo]
+    #                 [--baseline archivo.json] [--save] [--tolerance 0.25] [--paint]
+    # python bench.py --check   -> solo verifica la lectura del disco en pausa
+    args = sys.argv[1:]
+    seconds, rates, windows = BENCH_SECONDS, BENCH_RATES, BENCH_WINDOWS
+    baseline_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), BASELINE_FILE)
+    save, tolerance, paint, check = False, REGRESSION_TOLERANCE, False, False
+    it = iter(args)
+    for arg in it:
+        if arg == "--seconds":
+            seconds = float(next(it))
+        elif arg == "--rates":
+            rates = [int(x) for x in next(it).split(",")]
+        elif arg == "--windows":
+            windows = [None if x == "completo" else float(x) for x in next(it).split(",")]
+        elif arg == "--baseline":
+            baseline_path = next(it)
+        elif arg == "--save":
+            save = True
+        elif arg == "--tolerance":
+            tolerance = float(next(it))
+        elif arg == "--paint":
+            paint = True
+        elif arg == "--check":
+            check = True
+        else:
+            print("Uso: python bench.py [--seconds s] [--rates 20,200,2000] [--windows 10,240,completo] "
+                  "[--baseline archivo.json] [--save] [--tolerance 0.25] [--paint] | --check")
+            sys.exit(1)
+
+    app = QApplication(sys.argv[:1])
+    if check:
+        failures = check_disk_scrollback()
+        for line in failures:
+            print(f"FALLA {line}")
+        if failures:
+            sys.exit(1)
+        print("Lectura del disco en pausa correcta.")
+        sys.exit(0)
+
+    results = {}
+    for rate in rates:
+        for window in windows:
+            name = scenario_name(rate, window)
+            print(f"{name}...", flush=True)
+            results[name] = run_scenario(rate, window, seconds, paint)
+
+    baseline = load_baseline(baseline_path)
+    print_results(results, baseline)
+    if save:
+        save_baseline(baseline_path, results, paint)
+        print(f"Línea base guardada en {baseline_path}")
+    elif baseline is None:
+        print(f"Sin línea base ({baseline_path}); usar --save para crearla.")
+    elif baseline.get("paint", False) != paint:
+        print("La línea base se midió con otro modo de pintado (--paint); no se compara.")
+    else:
+        if baseline.get("machine", {}).get("node") != platform.node():
+            print("Atención: la línea base se midió en otra máquina.")
+        regressions = compare(results, baseline, tolerance)
+        for line in regressions:
+            print(f"REGRESIÓN {line}")
+        if regressions:
+            sys.exit(1)
+        print("Sin regresiones respecto de la línea base.")
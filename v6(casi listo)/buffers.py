@@ -0,0 +1,272 @@
+from collections import deque
+
+import numpy as np
+
+
+# ===========================================================
+# ===              BUFFER CIRCULAR ESPEJADO               ===
+# ===========================================================
+
+class RingBuffer:
+    """
+    Buffer circular de varios canales que siempre entrega las últimas
+    muestras como una vista contigua y en orden cronológico, sin copiar:
+    cada muestra se escribe dos veces (en i y en i + capacity), así las
+    últimas `capacity` muestras ocupan siempre data[:, p:p + capacity].
+
+    view(n) devuelve un array (canales, n) que es una vista: se puede
+    desempaquetar por canal (t, p, temp, f = buf.view()) sin copias. La
+    vista es válida hasta la próxima escritura.
+    """
+
+    def __init__(self, capacity, channels, dtype=np.float64):
+        self.capacity = int(capacity)
+        self.data = np.zeros((channels, 2 * self.capacity), dtype=dtype)
+        self.count = 0  # muestras escritas desde el inicio (no se reinicia al dar la vuelta)
+
+    def __len__(self):
+        return min(self.count, self.capacity)
+
+    @property
+    def full(self):
+        return self.count >= self.capacity
+
+    def append(self, values):
+        """Agrega una muestra (un valor por canal)."""
+        i = self.count % self.capacity
+        self.data[:, i] = values
+        self.data[:, i + self.capacity] = values
+        self.count += 1
+
+    def extend(self, block):
+        """Agrega varias muestras de una vez: block es (canales, n)."""
+        block = np.asarray(block, dtype=self.data.dtype)
+        n = block.shape[1]
+        if n > self.capacity:
+            self.count += n - self.capacity
+            block = block[:, -self.capacity:]
+            n = self.capacity
+        i = self.count % self.capacity
+        first = min(n, self.capacity - i)
+        for offset in (0, self.capacity):
+            self.data[:, i + offset:i + offset + first] = block[:, :first]
+            self.data[:, offset:offset + n - first] = block[:, first:]
+        self.count += n
+
+    def view(self, n=None):
+        """Vista (canales, n) de las últimas n muestras (todas las disponibles si n es None)."""
+        size = len(self)
+        n = size if n is None else max(0, min(int(n), size))
+        end = self.count % self.capacity + self.capacity
+        return self.data[:, end - n:end]
+
+    def since(self, sample):
+        """Vista de las muestras desde el número absoluto `sample` (ver count)."""
+        return self.view(self.count - sample)
+
+    def last(self):
+        """Última muestra (un valor por canal)."""
+        return self.view(1)[:, 0]
+
+    def clear(self):
+        self.count = 0
+
+
+# ===========================================================
+# ===           HISTORIAL MULTI-RESOLUCIÓN                ===
+# ===========================================================
+
+class HistoryBuffer:
+    """
+    Historial de toda la sesión con memoria fija: niveles de buckets de
+    `levels` muestras (10, 100 y 1000 por defecto, como la pirámide en
+    disco) con inicio, fin, min, max, suma y cantidad por canal, cada uno
+    en un RingBuffer de `capacity` buckets. El nivel crudo (datos recientes
+    a tasa completa) es el RingBuffer de la ventana en vivo.
+
+    Con ~11 Hz y 10000 buckets, el nivel 100x cubre ~25 h.
+    """
+
+    def __init__(self, channels, levels=(10, 100, 1000), capacity=10000):
+        self.channels = channels
+        self.levels = sorted(levels)
+        self.ratios = []
+        prev = 1
+        for factor in self.levels:
+            if factor % prev:
+                raise ValueError(f"Nivel {factor}x no es múltiplo de {prev}x")
+            self.ratios.append(factor // prev)
+            prev = factor
+        # columnas: t_start, t_end, min[c], max[c], sum[c], count
+        self.width = 3 + 3 * channels
+        self.rings = [RingBuffer(capacity, self.width) for _ in self.levels]
+        self.pending = [None] * len(self.levels)  # bucket en construcción por nivel
+        self.children = [0] * len(self.levels)
+
+    def clear(self):
+        for ring in self.rings:
+            ring.clear()
+        self.pending = [None] * len(self.levels)
+        self.children = [0] * len(self.levels)
+
+    def append(self, t, values):
+        """Agrega una muestra cruda (un valor por canal)."""
+        c = self.channels
+        row = np.empty(self.width)
+        row[0] = row[1] = t
+        row[2:2 + c] = row[2 + c:2 + 2 * c] = row[2 + 2 * c:2 + 3 * c] = values
+        row[-1] = 1
+        self._push(0, row)
+
+    def _push(self, level, row):
+        c = self.channels
+        acc = self.pending[level]
+        if acc is None:
+            acc = self.pending[level] = row.copy()
+        else:
+            acc[1] = row[1]
+            acc[2:2 + c] = np.fmin(acc[2:2 + c], row[2:2 + c])
+            acc[2 + c:2 + 2 * c] = np.fmax(acc[2 + c:2 + 2 * c], row[2 + c:2 + 2 * c])
+            acc[2 + 2 * c:] += row[2 + 2 * c:]
+        self.children[level] += 1
+        if self.children[level] == self.ratios[level]:
+            self.rings[level].append(acc)
+            self.pending[level], self.children[level] = None, 0
+            if level + 1 < len(self.levels):
+                self._push(level + 1, acc)
+
+    def query(self, t_start, t_end):
+        """
+        Buckets del nivel más fino que todavía cubre t_start (o del más
+        grueso), incluido el bucket en construcción. Devuelve
+        (t, media, min, max): t de cada bucket y arrays (canales, n).
+        """
+        c = self.channels
+        level = len(self.levels) - 1
+        for i, ring in enumerate(self.rings):
+            if len(ring) and ring.view(len(ring))[0, 0] <= t_start:
+                level = i
+                break
+        data = self.rings[level].view()
+        if self.pending[level] is not None:
+            data = np.concatenate((data, self.pending[level][:, None]), axis=1)
+        lo = np.searchsorted(data[1], t_start, side="left")
+        hi = np.searchsorted(data[0], t_end, side="right")
+        data = data[:, lo:hi]
+        t = (data[0] + data[1]) / 2
+        mean = data[2 + 2 * c:2 + 3 * c] / data[-1]
+        return t, mean, data[2:2 + c], data[2 + c:2 + 2 * c]
+
+
+# ===========================================================
+# ===        EXTREMOS DE VENTANA DESLIZANTE               ===
+# ===========================================================
+
+class SlidingExtrema:
+    """
+    Mínimo y máximo de las muestras de los últimos `window` segundos con
+    dos colas monótonas: cada muestra entra y sale una sola vez, así push()
+    es O(1) amortizado y min/max se leen del frente sin recorrer datos.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.lows = deque()   # (t, v) con v creciente
+        self.highs = deque()  # (t, v) con v decreciente
+
+    def clear(self):
+        self.lows.clear()
+        self.highs.clear()
+
+    def push(self, t, v):
+        if v != v:  # NaN
+            return
+        while self.lows and self.lows[-1][1] >= v:
+            self.lows.pop()
+        self.lows.append((t, v))
+        while self.highs and self.highs[-1][1] <= v:
+            self.highs.pop()
+        self.highs.append((t, v))
+        self.evict(t - self.window)
+
+    def evict(self, t_min):
+        while self.lows and self.lows[0][0] < t_min:
+            self.lows.popleft()
+        while self.highs and self.highs[0][0] < t_min:
+            self.highs.popleft()
+
+    def rebuild(self, window, t, v):
+        """Nueva ventana: se recargan las muestras que quedan dentro (p. ej. del RingBuffer)."""
+        self.window = window
+        self.clear()
+        for ti, vi in zip(t.tolist(), v.tolist()):
+            self.push(ti, vi)
+
+    def range(self):
+        """(min, max) de la ventana, o None si no hay muestras."""
+        if not self.lows:
+            return None
+        return self.lows[0][1], self.highs[0][1]
+
+
+def hysteresis_range(current, lo, hi, margin=0.1, shrink=0.5, min_span=1.0):
+    """
+    Rango Y con histéresis: se agranda apenas los datos salen del rango
+    actual (dejando `margin` de aire) y solo se achica cuando los datos
+    ocupan menos de `shrink` del rango. Devuelve el rango actual si no hay
+    que moverlo (el eje no tiembla con cada muestra).
+    """
+    span = max(hi - lo, min_span)
+    mid = (lo + hi) / 2
+    target = (mid - span * (0.5 + margin), mid + span * (0.5 + margin))
+    if current is None:
+        return target
+    y0, y1 = current
+    if lo < y0 or hi > y1 or span < shrink * (y1 - y0):
+        return target
+    return current
+
+
+# ===========================================================
+# ===          DECIMACIÓN MIN/MAX POR PÍXEL               ===
+# ===========================================================
+
+def minmax_decimate(t, v, columns, t_min=None, t_max=None):
+    """
+    Reduce una curva a lo sumo a 2 puntos por columna de píxeles: el mínimo
+    y el máximo de cada columna, en su orden original. Son muestras reales,
+    así que ningún pico desaparece. Las columnas se alinean a múltiplos
+    absolutos del ancho de columna (no al borde de la ventana), así el trazo
+    no titila al desplazarse la ventana. Devuelve (t, v); si no hace falta
+    decimar devuelve los mismos arrays.
+    """
+    n = len(t)
+    columns = max(int(columns), 1)
+    if n <= 2 * columns:
+        return t, v
+    t_min = t[0] if t_min is None else t_min
+    t_max = t[-1] if t_max is None else t_max
+    width = (t_max - t_min) / columns
+    if width <= 0:
+        return t, v
+
+    # t está ordenado: cada columna es un tramo contiguo
+    col = np.floor(t / width).astype(np.int64)
+    starts = np.concatenate(([0], np.flatnonzero(col[1:] != col[:-1]) + 1))
+    if len(starts) * 2 >= n:
+        return t, v
+    counts = np.diff(np.append(starts, n))
+    v_min = np.fmin.reduceat(v, starts)  # fmin/fmax ignoran los NaN
+    v_max = np.fmax.reduceat(v, starts)
+
+    # posición de la primera muestra con el mínimo / máximo de cada columna
+    # (columna toda NaN: su primera muestra)
+    idx = np.arange(n)
+    i_min = np.minimum.reduceat(np.where(v == np.repeat(v_min, counts), idx, n), starts)
+    i_max = np.minimum.reduceat(np.where(v == np.repeat(v_max, counts), idx, n), starts)
+    i_min = np.where(i_min == n, starts, i_min)
+    i_max = np.where(i_max == n, starts, i_max)
+    keep = np.empty(2 * len(starts), dtype=np.int64)
+    keep[0::2] = np.minimum(i_min, i_max)
+    keep[1::2] = np.maximum(i_min, i_max)
+    return t[keep], v[keep]
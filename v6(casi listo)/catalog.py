@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import time
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from storage import read_range, COLUMNAR_FILES, LEGACY_SPLIT_FILES
+from historian import HISTORIAN_FILES
+from session import SessionManifest, MANIFEST_FILE, LEGACY_PATIENT_FILE, iso_to_epoch
+
+
+SESSIONS_ROOT = "tests"
+CATALOG_PATH = os.path.join(SESSIONS_ROOT, "catalog.sqlite")
+DATA_FILES = ("data.csv", "data.csv.gz", "data.csv.zst", "data.bin") + COLUMNAR_FILES + tuple(LEGACY_SPLIT_FILES.values()) + HISTORIAN_FILES
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    path        TEXT PRIMARY KEY,
+    name        TEXT NOT NULL,
+    organ_id    TEXT,
+    blood_type  TEXT,
+    liver_mass  TEXT,
+    start_time  REAL,
+    end_time    REAL,
+    duration    REAL,
+    samples     INTEGER,
+    channels    TEXT,
+    data_mtime  REAL,
+    indexed_at  REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_name ON sessions(name);
+CREATE INDEX IF NOT EXISTS sessions_start ON sessions(start_time);
+CREATE TABLE IF NOT EXISTS channel_stats (
+    path    TEXT NOT NULL,
+    channel TEXT NOT NULL,
+    min     REAL,
+    max     REAL,
+    mean    REAL,
+    std     REAL,
+    PRIMARY KEY (path, channel)
+);
+"""
+
+
+# ===========================================================
+# ===               ESCANEO DE UNA SESIÓN                 ===
+# ===========================================================
+
+def is_session(folder):
+    return any(os.path.exists(os.path.join(folder, f))
+               for f in DATA_FILES + (MANIFEST_FILE, LEGACY_PATIENT_FILE))
+
+
+def data_mtime(folder):
+    """Última modificación de los datos o del manifiesto de la sesión (0 si no hay)."""
+    mtimes = [os.path.getmtime(os.path.join(folder, f)) for f in os.listdir(folder)
+              if (f.startswith("data") or f == MANIFEST_FILE or f in LEGACY_SPLIT_FILES.values() or f in HISTORIAN_FILES)
+              and not f.endswith(".tmp")]
+    return max(mtimes, default=0.0)
+
+
+def session_duration(t):
+    """Duración en segundos sumando los tramos monótonos (un reset reinicia el tiempo)."""
+    if len(t) < 2:
+        return 0.0
+    dt = np.diff(t)
+    return float(dt[dt > 0].sum())
+
+
+def scan_session(folder):
+    """Resumen de una sesión para el catálogo. Se ejecuta en procesos separados."""
+    folder = os.path.normpath(folder)
+    manifest = SessionManifest.load(folder)
+    patient = manifest.patient
+    summary = {
+        "path": folder,
+        "name": os.path.basename(folder),
+        "organ_id": patient.get("organ_id"),
+        "blood_type": patient.get("blood_type"),
+        "liver_mass": patient.get("liver_mass_g"),
+        "start_time": iso_to_epoch(manifest.timing.get("start")),
+        "end_time": iso_to_epoch(manifest.timing.get("end")),
+        "duration": 0.0,
+        "samples": 0,
+        "channels": [],
+        "data_mtime": data_mtime(folder),
+        "stats": {},
+    }
+    if summary["start_time"] is None:
+        # Sesiones antiguas: el archivo de paciente se escribe al iniciar
+        for name in (MANIFEST_FILE, LEGACY_PATIENT_FILE):
+            if os.path.exists(os.path.join(folder, name)):
+                summary["start_time"] = os.path.getmtime(os.path.join(folder, name))
+                break
+
+    if not any(os.path.exists(os.path.join(folder, f)) for f in DATA_FILES):
+        return summary
+    try:
+        df = read_range(folder)
+    except Exception as e:
+        print(f"[SessionCatalog] No se pudo leer {folder}: {e}")
+        return summary
+    if df.empty:
+        return summary
+
+    t = df.iloc[:, 0].to_numpy(dtype=float)
+    summary["samples"] = len(df)
+    summary["duration"] = session_duration(t)
+    if summary["end_time"] is None:
+        summary["end_time"] = summary["data_mtime"]
+    if summary["start_time"] is None:
+        summary["start_time"] = summary["end_time"] - summary["duration"]
+    channels = list(df.columns[1:4])
+    summary["channels"] = channels
+    for name in channels:
+        y = df[name].to_numpy(dtype=float)
+        summary["stats"][name] = {
+            "min": float(np.nanmin(y)), "max": float(np.nanmax(y)),
+            "mean": float(np.nanmean(y)), "std": float(np.nanstd(y)),
+        }
+    return summary
+
+
+def find_sessions(root):
+    """Carpetas de sesión bajo root (cualquier profundidad)."""
+    found = []
+    for dirpath, dirnames, _ in os.walk(root):
+        dirnames.sort()
+        if dirpath != root and is_session(dirpath):
+            found.append(dirpath)
+    return found
+
+
+# ===========================================================
+# ===                 CATÁLOGO SQLITE                     ===
+# ===========================================================
+
+class SessionCatalog:
+    """Índice SQLite de todas las sesiones grabadas bajo tests/."""
+
+    def __init__(self, db_path=CATALOG_PATH):
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        with self._connect() as con:
+            con.executescript(SCHEMA)
+
+    def _connect(self):
+        con = sqlite3.connect(self.db_path, timeout=10)
+        con.row_factory = sqlite3.Row
+        return con
+
+    def upsert(self, summary, con=None):
+        own = con is None
+        con = con or self._connect()
+        try:
+            con.execute(
+                "INSERT OR REPLACE INTO sessions VALUES (?,?,?,?,?,?,?,?,?,?,?,?)",
+                (summary["path"], summary["name"], summary["organ_id"], summary["blood_type"],
+                 summary["liver_mass"], summary["start_time"], summary["end_time"],
+                 summary["duration"], summary["samples"], json.dumps(summary["channels"]),
+                 summary["data_mtime"], time.time()))
+            con.execute("DELETE FROM channel_stats WHERE path = ?", (summary["path"],))
+            con.executemany(
+                "INSERT INTO channel_stats VALUES (?,?,?,?,?,?)",
+                [(summary["path"], ch, st["min"], st["max"], st["mean"], st["std"])
+                 for ch, st in summary["stats"].items()])
+            if own:
+                con.commit()
+        finally:
+            if own:
+                con.close()
+
+    def update_session(self, folder):
+        """Actualización incremental: re-escanea solo esta sesión (al terminar de grabar)."""
+        self.upsert(scan_session(folder))
+
+    def rebuild(self, root=SESSIONS_ROOT, workers=None, full=False):
+        """
+        Escanea root en paralelo. Sin `full` solo se re-escanean sesiones cuyos
+        datos cambiaron desde la última indexación. Devuelve cuántas se escanearon.
+        """
+        folders = [os.path.normpath(f) for f in find_sessions(root)]
+        with self._connect() as con:
+            known = {row["path"]: row["data_mtime"] for row in con.execute("SELECT path, data_mtime FROM sessions")}
+        pending = [f for f in folders if full or known.get(f) != data_mtime(f)]
+
+        if pending:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                summaries = list(pool.map(scan_session, pending, chunksize=4))
+        else:
+            summaries = []
+
+        con = self._connect()
+        try:
+            for summary in summaries:
+                self.upsert(summary, con=con)
+            # Sesiones borradas del disco
+            gone = [p for p in known if p not in set(folders) and p.startswith(os.path.normpath(root))]
+            con.executemany("DELETE FROM sessions WHERE path = ?", [(p,) for p in gone])
+            con.executemany("DELETE FROM channel_stats WHERE path = ?", [(p,) for p in gone])
+            con.commit()
+        finally:
+            con.close()
+        return len(summaries)
+
+    def list_sessions(self, name=None, organ_id=None, since=None, until=None, min_duration=None):
+        """Filtra sesiones por nombre/órgano (subcadena), fecha de inicio y duración mínima."""
+        query = "SELECT * FROM sessions WHERE 1=1"
+        args = []
+        if name:
+            query += " AND name LIKE ?"
+            args.append(f"%{name}%")
+        if organ_id:
+            query += " AND organ_id LIKE ?"
+            args.append(f"%{organ_id}%")
+        if since is not None:
+            query += " AND start_time >= ?"
+            args.append(since)
+        if until is not None:
+            query += " AND start_time <= ?"
+            args.append(until)
+        if min_duration is not None:
+            query += " AND duration >= ?"
+            args.append(min_duration)
+        query += " ORDER BY start_time DESC"
+        with self._connect() as con:
+            return [dict(row) for row in con.execute(query, args)]
+
+    def channel_stats(self, path):
+        with self._connect() as con:
+            rows = con.execute("SELECT * FROM channel_stats WHERE path = ?", (os.path.normpath(path),))
+            return {row["channel"]: dict(row) for row in rows}
+
+    def name_taken(self, name, root=SESSIONS_ROOT):
+        """True si ya hay una sesión con ese nombre (en el catálogo o en disco)."""
+        folder = os.path.join(root, name)
+        if os.path.isdir(folder) and is_session(folder):
+            return True
+        with self._connect() as con:
+            row = con.execute("SELECT 1 FROM sessions WHERE path = ?", (os.path.normpath(folder),)).fetchone()
+        return row is not None
+
+
+# ===========================================================
+# ===                       CLI                           ===
+# ===========================================================
+
+if __name__ == "__main__":
+    # python catalog.py rebuild [carpeta] [--full]
+    # python catalog.py list [filtro de nombre]
+    args = sys.argv[1:]
+    catalog = SessionCatalog()
+    if args and args[0] == "rebuild":
+        root = args[1] if len(args) > 1 and not args[1].startswith("--") else SESSIONS_ROOT
+        t0 = time.perf_counter()
+        n = catalog.rebuild(root, full="--full" in args)
+        print(f"{n} sesiones indexadas en {time.perf_counter() - t0:.1f} s")
+    elif args and args[0] == "list":
+        for s in catalog.list_sessions(name=args[1] if len(args) > 1 else None):
+            start = time.strftime("%Y-%m-%d %H:%M", time.localtime(s["start_time"])) if s["start_time"] else "--"
+            print(f"{start}  {s['duration'] / 60:8.1f} min  {s['samples']:9d}  {s['name']}  ({s['organ_id']})")
+    else:
+        print("Uso: python catalog.py rebuild [carpeta] [--full] | list [nombre]")
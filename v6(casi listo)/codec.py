@@ -0,0 +1,266 @@
+import os
+import json
+import struct
+
+import numpy as np
+import pandas as pd
+
+
+CODEC_MAGIC = b"EOWQDC01"
+CODEC_VERSION = 1
+FILE_HEADER = struct.Struct("<8sII")     # magic, versión, largo del header JSON
+BLOCK_HEADER = struct.Struct("<IIdd")    # filas, bytes del bloque, t mínimo, t máximo
+SECTION_HEADER = struct.Struct("<BI")    # 1 si hay máscara de NaN, bytes de varints
+EVENTS_HEADER = struct.Struct("<III")    # hitos, bytes de índices, bytes de texto
+BLOCK_ROWS = 4096      # filas máximas por bloque
+BLOCK_SECONDS = 10     # ... o segundos: lo que no llegó a disco se pierde si se corta la luz
+TIME_SCALE = 1000      # el equipo cuenta milisegundos enteros
+VALUE_SCALE = 10       # _process_line redondea todos los canales a 0.1
+N_CHANNELS = 3         # presión, temperatura, flujo
+
+
+# ===========================================================
+# ===          ZIGZAG + VARINT VECTORIZADOS               ===
+# ===========================================================
+
+def zigzag(x):
+    x = x.astype(np.int64)
+    return ((x << 1) ^ (x >> 63)).astype(np.uint64)
+
+
+def unzigzag(u):
+    return (u >> np.uint64(1)).astype(np.int64) ^ -(u & np.uint64(1)).astype(np.int64)
+
+
+def varint_encode(u):
+    """Codifica enteros sin signo como varints LEB128 (7 bits por byte) sin bucle por valor."""
+    u = np.asarray(u, dtype=np.uint64)
+    if len(u) == 0:
+        return b""
+    nbytes = np.ones(len(u), dtype=np.int64)
+    for k in range(1, 10):
+        nbytes += u >= np.uint64(1 << (7 * k))
+    starts = np.concatenate(([0], np.cumsum(nbytes)[:-1]))
+    out = np.empty(int(nbytes.sum()), dtype=np.uint8)
+    for k in range(int(nbytes.max())):
+        sel = nbytes > k
+        chunk = (u[sel] >> np.uint64(7 * k)) & np.uint64(0x7F)
+        more = (nbytes[sel] > k + 1).astype(np.uint64) << np.uint64(7)
+        out[starts[sel] + k] = (chunk | more).astype(np.uint8)
+    return out.tobytes()
+
+
+def varint_decode(data):
+    """Inverso de varint_encode: agrupa bytes por terminador y suma con reduceat."""
+    b = np.frombuffer(data, dtype=np.uint8)
+    terminal = b < 0x80
+    if terminal.all():
+        return b.astype(np.uint64)  # caso común: todos los deltas entran en un byte
+    ends = np.flatnonzero(terminal)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    shift = (np.arange(len(b)) - np.repeat(starts, ends - starts + 1)) * 7
+    parts = (b & 0x7F).astype(np.uint64) << shift.astype(np.uint64)
+    return np.bitwise_or.reduceat(parts, starts)
+
+
+# ===========================================================
+# ===               CODIFICACIÓN POR BLOQUE               ===
+# ===========================================================
+
+def _quantize(values, scale):
+    """Enteros escalados; los NaN se reemplazan por el valor anterior (delta 0) y van en una máscara."""
+    values = np.asarray(values, dtype=np.float64)
+    nan = np.isnan(values)
+    if nan.any():
+        values = pd.Series(values).ffill().fillna(0.0).to_numpy()
+    return np.round(values * scale).astype(np.int64), nan
+
+
+def _encode_section(q, nan, second_order=False):
+    x = np.diff(q, prepend=0)
+    if second_order and len(x) > 2:
+        x[2:] = np.diff(x[1:])  # delta de delta: con muestreo regular casi todo es 0
+    mask = np.packbits(nan).tobytes() if nan.any() else b""
+    payload = varint_encode(zigzag(x))
+    return SECTION_HEADER.pack(int(nan.any()), len(payload)) + mask + payload
+
+
+def _decode_section(buf, pos, rows, second_order=False):
+    has_nan, length = SECTION_HEADER.unpack_from(buf, pos)
+    pos += SECTION_HEADER.size
+    nan = None
+    if has_nan:
+        nbytes = (rows + 7) // 8
+        nan = np.unpackbits(np.frombuffer(buf, np.uint8, nbytes, pos))[:rows].astype(bool)
+        pos += nbytes
+    x = unzigzag(varint_decode(buf[pos:pos + length]))
+    pos += length
+    if second_order and len(x) > 2:
+        x[1:] = np.cumsum(x[1:])
+    return np.cumsum(x), nan, pos
+
+
+def encode_block(t, channels, events=None):
+    """
+    Un bloque: tiempo en ms como delta de delta, cada canal x10 como delta,
+    todo en zigzag + varint. `events` es un array de textos ("" sin hito).
+    """
+    t_ms, t_nan = _quantize(t, TIME_SCALE)
+    parts = [_encode_section(t_ms, t_nan, second_order=True)]
+    for values in channels:
+        q, nan = _quantize(values, VALUE_SCALE)
+        parts.append(_encode_section(q, nan))
+
+    if events is not None:
+        idx = np.flatnonzero(np.asarray(events, dtype=object) != "")
+    else:
+        idx = np.zeros(0, dtype=np.int64)
+    index_bytes = varint_encode(np.diff(idx, prepend=0).astype(np.uint64))
+    text = "\0".join(str(events[i]) for i in idx).encode("utf-8")
+    parts.append(EVENTS_HEADER.pack(len(idx), len(index_bytes), len(text)) + index_bytes + text)
+
+    payload = b"".join(parts)
+    t_valid = np.asarray(t, dtype=float)
+    return BLOCK_HEADER.pack(len(t_ms), len(payload), float(np.nanmin(t_valid)),
+                             float(np.nanmax(t_valid))) + payload
+
+
+def decode_block(payload, rows):
+    t_ms, _, pos = _decode_section(payload, 0, rows, second_order=True)
+    columns = [t_ms / TIME_SCALE]
+    for _ in range(N_CHANNELS):
+        q, nan, pos = _decode_section(payload, pos, rows)
+        values = q / VALUE_SCALE
+        if nan is not None:
+            values[nan] = np.nan
+        columns.append(values)
+
+    n_events, index_len, text_len = EVENTS_HEADER.unpack_from(payload, pos)
+    pos += EVENTS_HEADER.size
+    events = np.full(rows, "", dtype=object)
+    if n_events:
+        idx = np.cumsum(varint_decode(payload[pos:pos + index_len]).astype(np.int64))
+        pos += index_len
+        events[idx] = payload[pos:pos + text_len].decode("utf-8").split("\0")
+    return columns, events
+
+
+def encode_series(t, values):
+    """Un solo canal (tiempo + valores), sin hitos: lo usa tsstore.py para sus chunks."""
+    t_ms, t_nan = _quantize(t, TIME_SCALE)
+    q, nan = _quantize(values, VALUE_SCALE)
+    return _encode_section(t_ms, t_nan, second_order=True) + _encode_section(q, nan)
+
+
+def decode_series(payload, rows):
+    t_ms, _, pos = _decode_section(payload, 0, rows, second_order=True)
+    q, nan, _ = _decode_section(payload, pos, rows)
+    values = q / VALUE_SCALE
+    if nan is not None:
+        values[nan] = np.nan
+    return t_ms / TIME_SCALE, values
+
+
+# ===========================================================
+# ===                 ESCRITOR / LECTOR                   ===
+# ===========================================================
+
+class CodecWriter:
+    """
+    Registro en data.qdc: header con columnas y escalas, luego bloques
+    independientes (BLOCK_ROWS filas o BLOCK_SECONDS segundos) con su rango
+    de tiempo en el header, para leer solo los bloques de una ventana.
+    """
+
+    def __init__(self, file_path, columns):
+        self.path = file_path
+        self.columns = list(columns)  # Time, 3 canales y Events
+        self.pending = []
+        self.pending_rows = 0
+        self.rows = 0
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            header = json.dumps({"columns": self.columns, "time_scale": TIME_SCALE,
+                                 "value_scale": VALUE_SCALE}).encode("utf-8")
+            with open(self.path, "wb") as f:
+                f.write(FILE_HEADER.pack(CODEC_MAGIC, CODEC_VERSION, len(header)) + header)
+
+    def write_block(self, df):
+        if df.empty:
+            return
+        self.pending.append(df)
+        self.pending_rows += len(df)
+        t = pd.concat([p.iloc[:, 0] for p in self.pending]) if len(self.pending) > 1 else df.iloc[:, 0]
+        if self.pending_rows >= BLOCK_ROWS or t.max() - t.min() >= BLOCK_SECONDS:
+            self._emit()
+
+    def _emit(self):
+        if not self.pending:
+            return
+        df = pd.concat(self.pending, ignore_index=True)
+        self.pending, self.pending_rows = [], 0
+        with open(self.path, "ab") as f:
+            for start in range(0, len(df), BLOCK_ROWS):
+                part = df.iloc[start:start + BLOCK_ROWS]
+                events = part.iloc[:, 4].fillna("").astype(str).to_numpy(dtype=object) \
+                    if part.shape[1] > 4 else None
+                f.write(encode_block(part.iloc[:, 0].to_numpy(dtype=float),
+                                     [part.iloc[:, i].to_numpy(dtype=float) for i in range(1, N_CHANNELS + 1)],
+                                     events))
+        self.rows += len(df)
+
+    def close(self):
+        self._emit()
+
+
+def _read_header(f):
+    magic, version, length = FILE_HEADER.unpack(f.read(FILE_HEADER.size))
+    if magic != CODEC_MAGIC:
+        raise ValueError(f"{f.name} no es un registro .qdc")
+    return json.loads(f.read(length).decode("utf-8"))
+
+
+def read_codec(path, t_start=None, t_end=None):
+    """DataFrame con las columnas originales; con t_start/t_end solo decodifica los bloques que cruzan."""
+    blocks = []
+    with open(path, "rb") as f:
+        header = _read_header(f)
+        columns = header["columns"]
+        while True:
+            raw = f.read(BLOCK_HEADER.size)
+            if len(raw) < BLOCK_HEADER.size:
+                break  # fin (o bloque cortado por un cierre abrupto)
+            rows, length, t_min, t_max = BLOCK_HEADER.unpack(raw)
+            if (t_start is not None and t_max < t_start) or (t_end is not None and t_min > t_end):
+                f.seek(length, os.SEEK_CUR)
+                continue
+            payload = f.read(length)
+            if len(payload) < length:
+                break
+            blocks.append(decode_block(payload, rows))
+    if not blocks:
+        return pd.DataFrame(columns=columns)
+
+    # Se arma un solo DataFrame al final: concatenar arrays es mucho más barato que DataFrames
+    values = [np.concatenate([b[0][i] for b in blocks]) for i in range(N_CHANNELS + 1)]
+    events = np.concatenate([b[1] for b in blocks])
+    mask = np.ones(len(values[0]), dtype=bool)
+    if t_start is not None:
+        mask &= values[0] >= t_start
+    if t_end is not None:
+        mask &= values[0] <= t_end
+    data = {name: v[mask] for name, v in zip(columns[:4], values)}
+    if len(columns) > 4:
+        data[columns[4]] = events[mask]
+    return pd.DataFrame(data)
+
+
+def write_codec(df, path):
+    """Conversión de una sesión completa (convert.py)."""
+    tmp = path + ".tmp"
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    writer = CodecWriter(tmp, df.columns)
+    for start in range(0, len(df), BLOCK_ROWS):
+        writer.write_block(df.iloc[start:start + BLOCK_ROWS])
+    writer.close()
+    os.replace(tmp, path)
@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from storage import (read_range, write_columnar, read_columnar, atomic_write_json,
+                     has_legacy_split, read_legacy_split, LEGACY_SPLIT_FILES, COLUMNAR_FILES)
+from catalog import find_sessions, SESSIONS_ROOT
+from historian import HISTORIAN_FILES
+from stitch import source_files
+
+
+STATE_FILE = "convert_state.json"    # progreso, para retomar una conversión interrumpida
+REPORT_FILE = "convert_report.csv"
+
+try:
+    import pyarrow  # noqa: F401
+    DEFAULT_FORMAT = "parquet"
+except ImportError:  # sin pyarrow se usa .npz, que solo necesita numpy
+    DEFAULT_FORMAT = "npz"
+
+
+# ===========================================================
+# ===             CONVERSIÓN DE UNA SESIÓN                ===
+# ===========================================================
+
+def original_files(folder, fmt=DEFAULT_FORMAT):
+    """
+    Archivos de datos originales de la sesión: los registros que resuelve
+    stitch.source_files (segmentos, comprimidos, binario) más los formatos
+    por canal, historiador u otro columnar (p. ej. un registro .qdc).
+    """
+    names = [f for f in os.listdir(folder)
+             if f in LEGACY_SPLIT_FILES.values() or f in HISTORIAN_FILES
+             or (f in COLUMNAR_FILES and f != f"data.{fmt}")]
+    return sorted(set(source_files(folder)) | {os.path.join(folder, f) for f in names})
+
+
+def source_signature(folder, fmt=DEFAULT_FORMAT):
+    """(bytes, mtime) de los datos originales; si cambian, la sesión se vuelve a convertir."""
+    files = original_files(folder, fmt)
+    return (sum(os.path.getsize(f) for f in files),
+            max((os.path.getmtime(f) for f in files), default=0.0))
+
+
+def frames_equal(a, b):
+    """Mismas columnas, mismo tiempo y canales (NaN == NaN) y mismos hitos."""
+    if list(a.columns) != list(b.columns) or len(a) != len(b):
+        return False
+    for i, name in enumerate(a.columns):
+        x, y = a[name], b[name]
+        if i < 4:
+            if not np.array_equal(x.to_numpy(dtype=float), y.to_numpy(dtype=float), equal_nan=True):
+                return False
+        elif not (x.fillna("").astype(str).to_numpy() == y.fillna("").astype(str).to_numpy()).all():
+            return False
+    return True
+
+
+def convert_session(folder, fmt=DEFAULT_FORMAT):
+    """
+    Convierte una sesión a data.<fmt> en la misma carpeta y verifica que se
+    lea igual que el original. Se ejecuta en procesos separados: nunca lanza,
+    devuelve una fila del reporte.
+    """
+    started = time.perf_counter()
+    result = {"path": folder, "status": "error", "layout": "legacy" if has_legacy_split(folder) else "data",
+              "rows": 0, "src_bytes": 0, "out_bytes": 0, "ratio": None, "seconds": 0.0,
+              "sha256": None, "error": ""}
+    out = os.path.join(folder, f"data.{fmt}")
+    try:
+        src_bytes, src_mtime = source_signature(folder, fmt)
+        result["src_bytes"], result["src_mtime"] = src_bytes, src_mtime
+        if not original_files(folder, fmt):
+            result["status"], result["error"] = "empty", "sin datos originales"
+            return result
+        # El formato por canal se lee directo: read_range preferiría un .npz ya convertido
+        df = read_legacy_split(folder) if result["layout"] == "legacy" else read_range(folder)
+        if df.empty:
+            result["status"], result["error"] = "empty", "sin datos"
+            return result
+        write_columnar(df, out)
+        if not frames_equal(df, read_columnar(out)):
+            os.remove(out)
+            result["error"] = "la verificación de ida y vuelta no coincide"
+            return result
+        with open(out, "rb") as f:
+            result["sha256"] = hashlib.sha256(f.read()).hexdigest()
+        result["rows"] = len(df)
+        result["out_bytes"] = os.path.getsize(out)
+        result["ratio"] = round(src_bytes / result["out_bytes"], 2) if result["out_bytes"] else None
+        result["status"] = "ok"
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        result["seconds"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+# ===========================================================
+# ===                 CONVERSIÓN MASIVA                   ===
+# ===========================================================
+
+def load_state(root):
+    path = os.path.join(root, STATE_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("sessions", {})
+
+
+def is_done(entry, folder, fmt):
+    """Ya convertida con éxito, con la salida presente y sin cambios en los datos originales."""
+    if not entry or entry.get("status") not in ("ok", "empty"):
+        return False
+    if entry["status"] == "ok" and not os.path.exists(os.path.join(folder, f"data.{fmt}")):
+        return False
+    src_bytes, src_mtime = source_signature(folder, fmt)
+    return entry.get("src_bytes") == src_bytes and entry.get("src_mtime") == src_mtime
+
+
+def convert_archive(root=SESSIONS_ROOT, fmt=DEFAULT_FORMAT, workers=None, retry_errors=False):
+    """
+    Convierte todas las sesiones bajo root en paralelo. El progreso se guarda
+    en root/convert_state.json después de cada sesión, así una corrida
+    interrumpida retoma solo lo que falta. Al final escribe root/convert_report.csv.
+    """
+    state = load_state(root)
+    state_path = os.path.join(root, STATE_FILE)
+    folders = [os.path.normpath(f) for f in find_sessions(root)]
+    pending = []
+    for folder in folders:
+        key = os.path.relpath(folder, root)
+        entry = state.get(key)
+        if is_done(entry, folder, fmt):
+            continue
+        if entry and entry.get("status") == "error" and not retry_errors \
+                and entry.get("src_mtime") == source_signature(folder, fmt)[1]:
+            continue
+        pending.append(folder)
+    print(f"[Convert] {len(folders)} sesiones, {len(pending)} por convertir")
+
+    if pending:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(convert_session, folder, fmt): folder for folder in pending}
+            for n, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                key = os.path.relpath(result["path"], root)
+                state[key] = dict(result, path=key, format=fmt)
+                atomic_write_json(state_path, {"version": 1, "sessions": state})
+                print(f"[Convert] {n}/{len(pending)} {result['status']:5s} {key} {result['error']}")
+
+    report = pd.DataFrame([state[k] for k in sorted(state)])
+    if not report.empty:
+        report.to_csv(os.path.join(root, REPORT_FILE), index=False)
+    return report
+
+
+# ===========================================================
+# ===                       CLI                           ===
+# ===========================================================
+
+if __name__ == "__main__":
+    # python convert.py [carpeta] [--format npz|parquet|qdc] [--workers N] [--retry-errors]
+    args = sys.argv[1:]
+    root, fmt, workers = SESSIONS_ROOT, DEFAULT_FORMAT, None
+    it = iter(args)
+    for arg in it:
+        if arg == "--format":
+            fmt = next(it)
+        elif arg == "--workers":
+            workers = int(next(it))
+        elif arg != "--retry-errors":
+            root = arg
+    if f"data.{fmt}" not in COLUMNAR_FILES:
+        print(f"Formato desconocido: {fmt}")
+        sys.exit(1)
+    t0 = time.perf_counter()
+    report = convert_archive(root, fmt, workers, retry_errors="--retry-errors" in args)
+    if report.empty:
+        print("No hay sesiones")
+        sys.exit(0)
+    ok = report[report["status"] == "ok"]
+    print(f"{len(ok)}/{len(report)} sesiones convertidas en {time.perf_counter() - t0:.1f} s, "
+          f"{ok['src_bytes'].sum() / 1e6:.1f} MB -> {ok['out_bytes'].sum() / 1e6:.1f} MB "
+          f"(reporte en {os.path.join(root, REPORT_FILE)})")
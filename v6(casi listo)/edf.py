@@ -0,0 +1,308 @@
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from storage import open_text, read_binary, read_range
+from session import SessionManifest, default_channels
+from stitch import source_files, continuous_time
+from tsstore import session_wall_start
+from catalog import DATA_FILES
+
+
+EDF_FILE = "data.edf"
+EDF_SAMPLE_RATE = 20          # Hz fijos por canal (el equipo manda ~11 Hz irregulares)
+EDF_RECORD_SECONDS = 1        # un data record por segundo
+EDF_ANNOTATION_BYTES = 128    # bytes por record del canal "EDF Annotations"
+EDF_READ_ROWS = 200000        # filas por bloque al convertir una sesión grabada
+DIGITAL_MIN, DIGITAL_MAX = -32768, 32767
+# Rango físico por canal; los que no están usan su resolución del manifiesto (0.1 -> ±3276.7).
+# El flujo tiene picos de más de 18000 mL/min: se guarda de a 1 mL/min.
+EDF_PHYSICAL_RANGE = {"flow": (-32768.0, 32767.0)}
+MONTHS = ("JAN", "FEB", "MAR", "APR", "MAY", "JUN", "JUL", "AUG", "SEP", "OCT", "NOV", "DEC")
+
+
+def _field(value, width):
+    """Campo ASCII de ancho fijo del header (sin acentos: EDF solo admite ASCII 32..126)."""
+    text = str(value).encode("ascii", "replace").decode("ascii")
+    return text[:width].ljust(width)
+
+
+def _number(value, width=8):
+    """Número en un campo de 8 caracteres: 0.1 * 32767 = 3276.7 entra tal cual."""
+    text = f"{value:g}"
+    if len(text) > width:
+        text = f"{value:.{max(width - 2 - len(str(int(abs(value)))), 0)}f}"
+    return _field(text, width)
+
+
+def _edf_name(value):
+    """Subcampos de EDF+ (paciente, equipo): sin espacios, X si no se conoce."""
+    value = str(value).strip() if value not in (None, "") else "X"
+    return value.replace(" ", "_")
+
+
+def _tal(onset, text=""):
+    """Time-stamped Annotation List: +onset\\x14texto\\x14\\x00."""
+    return f"+{onset:.3f}".rstrip("0").rstrip(".").encode("ascii") + b"\x14" + text.encode("utf-8") + b"\x14\x00"
+
+
+# ===========================================================
+# ===                  ESCRITOR EDF+                      ===
+# ===========================================================
+
+class EdfWriter:
+    """
+    Escribe data.edf (EDF+C) bloque por bloque, en vivo o al convertir: los
+    canales se remuestrean a EDF_SAMPLE_RATE sobre el tiempo continuo de la
+    sesión (los resets del equipo se empalman), los hitos van al canal
+    "EDF Annotations" y el header sale del manifiesto. Solo guarda en memoria
+    las muestras del record que falta completar. La cantidad de records
+    queda en -1 mientras se graba y se corrige al cerrar.
+    """
+
+    def __init__(self, file_path, manifest=None, rate=EDF_SAMPLE_RATE, start=None):
+        self.path = file_path
+        self.manifest = manifest
+        self.rate = int(rate)
+        self.start = start  # hora real de la primera muestra; si falta, sale del manifiesto
+        channels = manifest.data.get("channels") if manifest else None
+        self.channels = [c for c in (channels or default_channels()) if c["name"] not in ("time", "events")]
+        self.physical = [EDF_PHYSICAL_RANGE.get(c["name"]) or
+                         (DIGITAL_MIN * (c.get("resolution") or 0.1), DIGITAL_MAX * (c.get("resolution") or 0.1))
+                         for c in self.channels]
+        self.file = None
+        self.records = 0
+        # tiempo continuo
+        self.last_t = None
+        self.step = 1.0 / self.rate
+        self.offset = 0.0
+        self.t0 = None
+        # muestras pendientes (aún no cubiertas por un record) y hitos por escribir
+        self.t_buf = np.zeros(0)
+        self.v_buf = np.zeros((len(self.channels), 0))
+        self.last_valid = np.zeros(len(self.channels))
+        self.annotations = []
+
+    # ---------- header ----------
+
+    def _header(self):
+        manifest = self.manifest
+        patient = manifest.patient if manifest else {}
+        device = manifest.data.get("device", {}) if manifest else {}
+        start = datetime.fromtimestamp(self.start if self.start is not None else time.time())
+        startdate = f"{start.day:02d}-{MONTHS[start.month - 1]}-{start.year}"
+        ns = len(self.channels) + 1
+        fields = [
+            _field("0", 8),
+            _field(f"{_edf_name(patient.get('organ_id'))} X X {_edf_name(patient.get('blood_type'))}", 80),
+            _field(f"Startdate {startdate} {_edf_name(manifest.data.get('name') if manifest else None)} X "
+                   f"{_edf_name(device.get('port'))}", 80),
+            _field(start.strftime("%d.%m.%y"), 8),
+            _field(start.strftime("%H.%M.%S"), 8),
+            _field(256 * (ns + 1), 8),
+            _field("EDF+C", 44),
+            _field(-1, 8),  # se corrige en close()
+            _field(EDF_RECORD_SECONDS, 8),
+            _field(ns, 4),
+        ]
+        labels = [c["name"].capitalize() for c in self.channels] + ["EDF Annotations"]
+        units = [c.get("unit") or "" for c in self.channels] + [""]
+        physical = self.physical + [(-1, 1)]
+        samples = [self.rate * EDF_RECORD_SECONDS] * len(self.channels) + [EDF_ANNOTATION_BYTES // 2]
+        fields += [_field(x, 16) for x in labels]
+        fields += [_field("", 80) for _ in labels]
+        fields += [_field(u.replace("°", "deg"), 8) for u in units]
+        fields += [_number(lo) for lo, _ in physical]
+        fields += [_number(hi) for _, hi in physical]
+        fields += [_field(DIGITAL_MIN, 8) for _ in labels]
+        fields += [_field(DIGITAL_MAX, 8) for _ in labels]
+        fields += [_field("", 80) for _ in labels]
+        fields += [_field(n, 8) for n in samples]
+        fields += [_field("", 32) for _ in labels]
+        return "".join(fields).encode("ascii")
+
+    def _open(self):
+        if self.start is None and self.manifest is not None:
+            self.start = session_wall_start(self.manifest.folder)
+        self.file = open(self.path, "wb")
+        self.file.write(self._header())
+
+    # ---------- datos ----------
+
+    def _continuous(self, t):
+        """Empalma los resets del equipo y descarta muestras que no avanzan en el tiempo."""
+        out, self.offset, self.step = continuous_time(t, self.last_t, self.offset, self.step)
+        self.last_t = float(t[-1])
+        # np.interp necesita tiempos crecientes: fuera duplicados y retrocesos chicos (jitter)
+        last = self.t_buf[-1] if len(self.t_buf) else -np.inf
+        keep = out > np.maximum.accumulate(np.concatenate(([last], out[:-1])))
+        return out, keep
+
+    def write_block(self, df):
+        if df.empty:
+            return
+        t, keep = self._continuous(df.iloc[:, 0].to_numpy(dtype=float))
+        if self.t0 is None:
+            self.t0 = float(t[0])
+        values = np.array(df.iloc[:, 1:len(self.channels) + 1].to_numpy(dtype=float).T)
+        for i, row in enumerate(values):
+            # NaN (canal sin muestra): se mantiene el último valor válido
+            row = pd.Series(row).ffill().fillna(self.last_valid[i]).to_numpy()
+            self.last_valid[i] = row[-1]
+            values[i] = row
+        if df.shape[1] > len(self.channels) + 1:
+            ev = df.iloc[:, -1].fillna("").astype(str).to_numpy()
+            self.annotations.extend((float(t[i]) - self.t0, ev[i]) for i in np.flatnonzero(ev != ""))
+        self.t_buf = np.concatenate((self.t_buf, t[keep]))
+        self.v_buf = np.concatenate((self.v_buf, values[:, keep]), axis=1)
+        self._emit()
+
+    def _emit(self, final=False):
+        """Escribe todos los records completos; con final=True también el último, repitiendo el último valor."""
+        if not len(self.t_buf):
+            return
+        if self.file is None:
+            self._open()
+        t_last = self.t_buf[-1] - self.t0
+        # el record k está completo cuando llegó su última muestra de la grilla (k + 1 - 1/rate)
+        end = int(np.floor(t_last + 1.0 / self.rate + 1e-9)) // EDF_RECORD_SECONDS
+        if final:
+            end = max(end, int(np.ceil(t_last + 1e-9)) // EDF_RECORD_SECONDS, self.records + 1)
+            if self.annotations:
+                end = max(end, int(self.annotations[-1][0]) // EDF_RECORD_SECONDS + 1)
+        n = end - self.records
+        if n <= 0:
+            return
+
+        per_record = self.rate * EDF_RECORD_SECONDS
+        # mismo cálculo para cada muestra sin importar cómo llegaron los bloques (vivo = convertido)
+        grid = self.t0 + (self.records * per_record + np.arange(n * per_record)) / self.rate
+        digital = np.empty((n, len(self.channels), per_record), dtype="<i2")
+        for i in range(len(self.channels)):
+            v = np.interp(grid, self.t_buf, self.v_buf[i])  # fuera del rango: último valor
+            lo, hi = self.physical[i]
+            q = np.round((v - lo) * (DIGITAL_MAX - DIGITAL_MIN) / (hi - lo)) + DIGITAL_MIN
+            q = np.clip(q, DIGITAL_MIN, DIGITAL_MAX)
+            digital[:, i, :] = q.reshape(n, per_record)
+
+        out = np.zeros((n, digital[0].nbytes + EDF_ANNOTATION_BYTES), dtype=np.uint8)
+        out[:, :digital[0].nbytes] = digital.reshape(n, -1).view(np.uint8)
+        for k in range(n):
+            out[k, digital[0].nbytes:] = np.frombuffer(self._annotation_record(self.records + k), np.uint8)
+        self.file.write(out.tobytes())
+        self.records = end
+
+        # Se conserva solo la muestra anterior al próximo record para interpolar su comienzo
+        cut = max(int(np.searchsorted(self.t_buf, self.t0 + end * EDF_RECORD_SECONDS, side="right")) - 1, 0)
+        self.t_buf, self.v_buf = self.t_buf[cut:], self.v_buf[:, cut:]
+
+    def _annotation_record(self, k):
+        """TAL de tiempo del record más los hitos que empiezan antes de su fin y entran en el espacio."""
+        onset = k * EDF_RECORD_SECONDS
+        data = _tal(onset)
+        first = True
+        while self.annotations and self.annotations[0][0] < onset + EDF_RECORD_SECONDS:
+            t, text = self.annotations[0]
+            tal = _tal(max(t, 0.0), text)
+            if len(data) + len(tal) > EDF_ANNOTATION_BYTES:
+                if not first:
+                    break  # no entra: pasa al record siguiente (el onset es absoluto)
+                tal = tal[:EDF_ANNOTATION_BYTES - len(data) - 2] + b"\x14\x00"  # texto demasiado largo
+            data += tal
+            first = False
+            self.annotations.pop(0)
+        return data.ljust(EDF_ANNOTATION_BYTES, b"\x00")
+
+    def close(self):
+        self._emit(final=True)
+        while self.annotations:  # hitos que no entraron en el último record
+            self._emit(final=True)
+        if self.file is None:
+            return
+        self.file.seek(236)
+        self.file.write(_field(self.records, 8).encode("ascii"))
+        self.file.close()
+        self.file = None
+        print(f"[EdfWriter] {self.records} records de {EDF_RECORD_SECONDS} s -> {self.path}")
+
+
+# ===========================================================
+# ===                   CONVERSIÓN                        ===
+# ===========================================================
+
+def iter_session_blocks(folder, rows=EDF_READ_ROWS):
+    """
+    DataFrames de a `rows` filas de una sesión grabada, sin cargarla entera:
+    los registros de texto (segmentos, comprimidos) se leen por partes, los
+    headers repetidos a mitad de archivo se descartan y data.bin se recorre
+    sobre el mmap. Los formatos columnar, historiador y por canal se leen
+    con read_range.
+    """
+    files = source_files(folder)
+    if not files:
+        if not any(os.path.exists(os.path.join(folder, f)) for f in DATA_FILES):
+            return
+        df = read_range(folder)
+        for start in range(0, len(df), rows):
+            yield df.iloc[start:start + rows]
+        return
+    for path in files:
+        if path.endswith(".bin"):
+            df = read_binary(path)
+            for start in range(0, len(df), rows):
+                yield df.iloc[start:start + rows]
+            continue
+        with open_text(path) as f:
+            for chunk in pd.read_csv(f, chunksize=rows, on_bad_lines="skip", index_col=False):
+                if chunk.shape[1] > 4:
+                    chunk[chunk.columns[4]] = chunk.iloc[:, 4].fillna("").astype(str)
+                if not all(pd.api.types.is_numeric_dtype(chunk[c]) for c in chunk.columns[:4]):
+                    # un header repetido en este bloque: esas filas no son números y se descartan
+                    for c in chunk.columns[:4]:
+                        chunk[c] = pd.to_numeric(chunk[c], errors="coerce")
+                    chunk = chunk[chunk.iloc[:, 0].notna()]
+                yield chunk
+
+
+def convert_to_edf(folder, out_path=None, rate=EDF_SAMPLE_RATE):
+    """Convierte una sesión grabada a EDF+ en una pasada. Devuelve la cantidad de records."""
+    out_path = out_path or os.path.join(folder, EDF_FILE)
+    writer = EdfWriter(out_path + ".tmp", SessionManifest.load(folder), rate)
+    for block in iter_session_blocks(folder):
+        writer.write_block(block)
+    writer.close()
+    if writer.records == 0:
+        if os.path.exists(out_path + ".tmp"):
+            os.remove(out_path + ".tmp")
+        return 0
+    os.replace(out_path + ".tmp", out_path)
+    return writer.records
+
+
+# ===========================================================
+# ===                       CLI                           ===
+# ===========================================================
+
+if __name__ == "__main__":
+    # python edf.py <carpeta de sesión>... [--rate Hz] [--out archivo.edf]
+    args = sys.argv[1:]
+    rate, out, folders = EDF_SAMPLE_RATE, None, []
+    it = iter(args)
+    for arg in it:
+        if arg == "--rate":
+            rate = int(next(it))
+        elif arg == "--out":
+            out = next(it)
+        else:
+            folders.append(arg)
+    if not folders:
+        print("Uso: python edf.py <carpeta de sesión>... [--rate Hz] [--out archivo.edf]")
+        sys.exit(1)
+    for folder in folders:
+        t0 = time.perf_counter()
+        records = convert_to_edf(folder, out if len(folders) == 1 else None, rate)
+        print(f"{folder}: {records} records en {time.perf_counter() - t0:.1f} s")
@@ -1,10 +1,11 @@
 import os
 import json
 import time
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import pyqtgraph as pg
-from pyqtgraph import InfiniteLine, TextItem
 from PyQt6.QtWidgets import (
     QWidget, QVBoxLayout, QHBoxLayout, QGridLayout,
     QPushButton, QLabel, QLineEdit, QComboBox, QFrame
@@ -12,14 +13,37 @@ from PyQt6.QtWidgets import (
 from PyQt6 import QtCore, QtGui
 from PyQt6.QtCore import pyqtSignal, QTimer, Qt
 from backend import SerialReader, ErrorWindow
+from buffers import RingBuffer, HistoryBuffer, SlidingExtrema, hysteresis_range, minmax_decimate
+from markers import EventMarkers
+from storage import PYRAMID_LEVELS, read_range
+from historian import HISTORIAN_TOLERANCES
+from tsstore import TSSTORE_DIR
+from catalog import SessionCatalog, scan_session, data_mtime
+from session import SessionManifest
+from stitch import RESET_BACKSTEP, continuous_time
 from PyQt6.QtGui import QIcon, QPixmap
 
 
-MAX_POINTS = 5000        # buffer circular
-UPDATE_INTERVAL_MS = 50   # frecuencia de refresco gráfico (5 Hz)
+MAX_POINTS = 5000        # buffer circular (datos recientes a tasa completa)
+HISTORY_BUCKETS = 10000  # buckets por nivel del historial (10x/100x/1000x): ~25 h con el nivel 100x
+UPDATE_INTERVAL_MS = 50   # intervalo mínimo entre cuadros (20 Hz); solo se redibuja con datos nuevos
+MAX_UPDATE_INTERVAL_MS = 500  # intervalo máximo si los cuadros tardan más que su presupuesto
+FRAME_BUDGET = 0.5        # fracción del intervalo que puede ocupar un cuadro antes de bajar la tasa
 DISPLAY_DELAY = 0.3       # segundos de retraso visual
+Y_AXIS_WIDTH = 60         # ancho fijo del eje Y: los tres gráficos quedan alineados en el lienzo
+READER_STOP_TIMEOUT_MS = 15000  # espera máxima al lector (y su escritor) al cerrar la sesión
+DISK_WARNING_MS = 90000   # el aviso de disco lento queda visible (el escritor lo repite cada 60 s)
+PAUSE_REFRESH_MS = 100    # en pausa, se relee el rango visible al terminar el zoom/pan
+PAUSE_RAW_SAMPLES = 20000  # en pausa, vistas con menos muestras que esto se leen crudas del disco
 TIME_RANGE_DEFAULT = 4*60  # segundos en ventana por defecto
 START_FULL_SCREEN = False  # iniciar en modo pantalla completa
+SEGMENT_DURATION = 60*60   # rotar data.csv cada hora de registro
+SEGMENT_MAX_BYTES = 50 * 1024 * 1024  # ... o al superar 50 MB
+RECORD_FORMAT = "csv"      # "csv", "csv.gz"/"csv.zst" (frames con tabla de saltos), "bin" (mmap preasignado),
+                           # "qdc" (enteros en delta + varint, ver codec.py)
+                           # o "hist" (historiador: solo puntos de quiebre, ver HISTORIAN_TOLERANCES)
+USE_TSSTORE = True         # además, agregar cada sesión al almacén compartido tests/tsstore
+RECORD_EDF = False         # además, escribir data.edf (EDF+, hitos como anotaciones) durante la grabación
 
 def timeformat(seconds):
     m = int(seconds // 60)
@@ -28,6 +52,61 @@ def timeformat(seconds):
     return f"{h:02d}:{m % 60:02d}:{s_string}"
 
 
+# ===========================================================
+# ===              LÍMITES MANUALES DEL EJE Y             ===
+# ===========================================================
+
+class LimitsWindow(QWidget):
+    """Fija (o libera) los límites del eje Y de un gráfico; el resto sigue en automático."""
+
+    TARGETS = {"Presión": "pressure", "Flujo": "flow", "Temperatura": "temperature"}
+
+    def __init__(self, parent):
+        super().__init__()
+        self.parent = parent
+        self.setWindowTitle("Fijar límites eje Y")
+
+        vbox = QVBoxLayout()
+        self.target_label = QLabel("Seleccionar gráfica:", self)
+        self.target_menu = QComboBox()
+        self.target_menu.addItems(list(self.TARGETS))
+        vbox.addWidget(self.target_label)
+        vbox.addWidget(self.target_menu)
+
+        self.lower_label = QLabel("Límite inferior:", self)
+        self.lower_input = QLineEdit("", self)
+        vbox.addWidget(self.lower_label)
+        vbox.addWidget(self.lower_input)
+
+        self.upper_label = QLabel("Límite superior:", self)
+        self.upper_input = QLineEdit("", self)
+        vbox.addWidget(self.upper_label)
+        vbox.addWidget(self.upper_input)
+
+        self.apply_button = QPushButton("Fijar límites", self)
+        self.apply_button.clicked.connect(self.apply_limits)
+        vbox.addWidget(self.apply_button)
+        self.release_button = QPushButton("Automático", self)
+        self.release_button.clicked.connect(self.release_limits)
+        vbox.addWidget(self.release_button)
+        self.setLayout(vbox)
+
+    def apply_limits(self):
+        try:
+            lower = float(self.lower_input.text())
+            upper = float(self.upper_input.text())
+            if lower >= upper:
+                raise ValueError("El límite inferior debe ser menor al superior")
+            self.parent.set_y_lock(self.TARGETS[self.target_menu.currentText()], (lower, upper))
+            self.close()
+        except ValueError as e:
+            ErrorWindow(str(e)).exec()
+
+    def release_limits(self):
+        self.parent.set_y_lock(self.TARGETS[self.target_menu.currentText()], None)
+        self.close()
+
+
 # ===========================================================
 # ===   CLASE PRINCIPAL DE ADQUISICIÓN Y GRAFICADO       ===
 # ===========================================================
@@ -35,33 +114,73 @@ def timeformat(seconds):
 class RecordingWindow(QWidget):
     stop_recording_signal = pyqtSignal()
 
-    def __init__(self, port, file_path, patient_file="patient_info.txt"):
+    def __init__(self, port, file_path, manifest=None, reader=None):
+        """`reader`: fuente de lecturas ya armada (bench.py usa una sintética); por defecto SerialReader."""
         super().__init__()
         self.setWindowIcon(QIcon("ico2.png"))
         self. file_path = file_path
         self.port = port
+        folder = os.path.dirname(file_path) or "."
+        self.manifest = manifest or SessionManifest.load(folder)
+        self.manifest.set_recording(format=RECORD_FORMAT, data_file=os.path.basename(file_path),
+                                    segment_duration=SEGMENT_DURATION,
+                                    segment_max_bytes=SEGMENT_MAX_BYTES,
+                                    pyramid_levels=list(PYRAMID_LEVELS), edf=RECORD_EDF,
+                                    historian_tolerances=HISTORIAN_TOLERANCES if RECORD_FORMAT == "hist" else None)
         # --- Buffers prealocados ---
-        self.index = 0
-        self.full = False
         self.y_autoscale_enabled = True
-        self.time = np.zeros(MAX_POINTS)
-        self.pressure = np.zeros(MAX_POINTS)
-        self.temperature = np.zeros(MAX_POINTS)
-        self.flow = np.zeros(MAX_POINTS)
+        self.buffer = RingBuffer(MAX_POINTS, 4)  # tiempo, presión, temperatura, flujo
+        self.history = HistoryBuffer(3, levels=PYRAMID_LEVELS, capacity=HISTORY_BUCKETS)  # presión, flujo, temperatura
+        # Los resets del equipo se empalman (como stitch y el EDF): todo lo que se
+        # grafica va en tiempo continuo = tiempo del equipo + t_offset
+        self.last_t = None     # último tiempo del equipo
+        self.t_offset = 0.0
+        self.t_step = 0.0      # último período positivo, para empalmar el próximo reset
+        self.run_start = None  # tiempo continuo donde empieza el tramo actual (desde el último reset)
+        self.paused = False  # gráfico detenido (la adquisición sigue)
+        self.recording = False  # se arrancó el lector; al cerrar hay que actualizar el catálogo
 
         self.time_range = TIME_RANGE_DEFAULT
-        self.serial_reader = SerialReader(file_path= file_path, port= port)
+        # Eje Y: extremos de la ventana por canal (colas monótonas), rango actual y bloqueos manuales
+        self.extrema = {name: SlidingExtrema(self.time_range) for name in ("pressure", "flow", "temperature")}
+        self.y_ranges = dict.fromkeys(self.extrema)
+        self.y_locks = dict.fromkeys(self.extrema)
+        if reader is None:
+            reader = SerialReader(file_path= file_path, port= port,
+                                  file_format=RECORD_FORMAT,
+                                  segment_duration=SEGMENT_DURATION,
+                                  segment_max_bytes=SEGMENT_MAX_BYTES,
+                                  pyramid_levels=PYRAMID_LEVELS,
+                                  historian_tolerances=HISTORIAN_TOLERANCES,
+                                  tsstore_root=os.path.join(os.path.dirname(os.path.abspath(folder)),
+                                                            TSSTORE_DIR) if USE_TSSTORE else None,
+                                  record_edf=RECORD_EDF,
+                                  manifest=self.manifest)
+        self.serial_reader = reader
         self.stop_recording_signal.connect(self.serial_reader.end_reading)
         self.serial_reader.readings.connect(self.process_new_data)
         self.serial_reader.warning_signal.connect(lambda msg: ErrorWindow(msg).exec())
+        self.serial_reader.disk_warning_signal.connect(self.show_disk_warning)
 
         pg.setConfigOptions(antialias=True, background='k', foreground='w', useOpenGL=True)
-        self.init_ui(patient_file)
+        self.init_ui()
 
-        # --- Temporizador de actualización ---
+        # --- Temporizador de actualización: redibuja solo si algo cambió ---
+        self.dirty = True
+        self.frame_interval = UPDATE_INTERVAL_MS
+        self.last_tick = time.perf_counter()
         self.update_timer = QTimer()
-        self.update_timer.timeout.connect(self.update_graphs)
-        self.update_timer.start(UPDATE_INTERVAL_MS)
+        self.update_timer.timeout.connect(self.render_frame)
+        self.update_timer.start(self.frame_interval)
+        for plot in [self.pressure_plot, self.flow_plot, self.temp_plot]:
+            plot.getViewBox().sigRangeChangedManually.connect(self.mark_dirty)
+
+        # --- Pausa: se relee la vista una sola vez tras terminar de hacer zoom/pan ---
+        self.pause_timer = QTimer()
+        self.pause_timer.setSingleShot(True)
+        self.pause_timer.setInterval(PAUSE_REFRESH_MS)
+        self.pause_timer.timeout.connect(self.update_paused)
+        self.pressure_plot.sigXRangeChanged.connect(self._on_x_range_changed)
         
         screen = QtGui.QGuiApplication.primaryScreen()
         geometry = screen.availableGeometry()
@@ -78,7 +197,7 @@ class RecordingWindow(QWidget):
 
 
     # ----------------------------------------------------
-    def init_ui(self, patient_file):
+    def init_ui(self):
         self.setWindowTitle(f"Registro de datos -- {self.file_path} -- Puerto: {self.port}")
         vbox = QVBoxLayout()
 
@@ -89,7 +208,7 @@ class RecordingWindow(QWidget):
         self.set_button = QPushButton("Aplicar")
         self.set_button.clicked.connect(self.adjust_time)
         self.scale_drop = QComboBox()
-        self.scale_drop.addItems(["Completo     ", "Segundos    ", "Minutos     "])#addItems(["Completo", "Segundos", "Minutos", "Horas"])
+        self.scale_drop.addItems(["Completo     ", "Segundos    ", "Minutos     ", "Horas       "])
         self.scale_drop.currentIndexChanged.connect(self.full_mode)
         self.hito_input = QLineEdit("")
         self.hito_input.setPlaceholderText("Escribir hito")
@@ -100,47 +219,76 @@ class RecordingWindow(QWidget):
         self.autoscale_button.setCheckable(True)
         self.autoscale_button.setChecked(True)
         self.autoscale_button.toggled.connect(self.toggle_autoscale_y)
+        self.limits_button = QPushButton("Límites Y")
+        self.limits_button.clicked.connect(self.open_limits_window)
+        self.pause_button = QPushButton("Pausar")
+        self.pause_button.setCheckable(True)
+        self.pause_button.toggled.connect(self.set_paused)
+
+        # Modo historiador: períodos con registro crudo a pedido
+        self.raw_button = QPushButton("Registro crudo")
+        self.raw_button.setCheckable(True)
+        self.raw_button.toggled.connect(self.serial_reader.set_raw_storage)
 
         hbox1 = QHBoxLayout()
         for w in [self.label_t_window, self.seconds_box, self.scale_drop,
-                  self.set_button, self.hito_input, self.hito_button, self.autoscale_button]:
+                  self.set_button, self.hito_input, self.hito_button, self.autoscale_button,
+                  self.limits_button, self.pause_button]:
             hbox1.addWidget(w)
+        if RECORD_FORMAT == "hist":
+            hbox1.addWidget(self.raw_button)
         vbox.addLayout(hbox1)
 
-        # --- Gráficos ---
-        def create_plot(title, color_plot, color_title):
-            glw = pg.GraphicsLayoutWidget()
+        # --- Gráficos: un solo lienzo (una sola pintada por cuadro) ---
+        self.graphs_widget = pg.GraphicsLayoutWidget()
+
+        def create_plot(title, color_plot, color_title, row):
             title_html = (
                 "<span style='color:#E5E5E5; font-size:12pt; font-family:Segoe UI; "
                 "font-weight:600;'><b>{}</b></span>".format(title)
             )            
-            plot = glw.addPlot(title=title_html)
+            plot = self.graphs_widget.addPlot(row=row, col=0, title=title_html)
             plot.showGrid(x=True, y=True, alpha=0.3)
             plot.hideButtons()
+            plot.enableAutoRange(axis=pg.ViewBox.YAxis, enable=False)  # el rango Y lo fija _apply_y_ranges
             curve = plot.plot(pen=pg.mkPen(color_plot, width=2))
-            return glw, plot, curve
-
-        self.pressure_widget, self.pressure_plot, self.pressure_curve = create_plot(title = "Presión",      color_plot = "#FF4C4C", color_title= "#FF7171")
-        self.flow_widget, self.flow_plot, self.flow_curve =             create_plot(title = "Flujo" ,       color_plot = "#8FD3FF", color_title= "#8FD3FF")
-        self.temp_widget, self.temp_plot, self.temp_curve =             create_plot(title = "Temperatura",  color_plot = "#FFA726", color_title= "#FFCB6B")
+            plot.event_markers = EventMarkers()  # todos los hitos del gráfico en un solo ítem
+            plot.addItem(plot.event_markers)
+            plot.getAxis("left").setWidth(Y_AXIS_WIDTH)
+            return plot, curve
+
+        self.pressure_plot, self.pressure_curve = create_plot(title = "Presión",      color_plot = "#FF4C4C", color_title= "#FF7171", row = 0)
+        self.flow_plot, self.flow_curve =         create_plot(title = "Flujo" ,       color_plot = "#8FD3FF", color_title= "#8FD3FF", row = 1)
+        self.temp_plot, self.temp_curve =         create_plot(title = "Temperatura",  color_plot = "#FFA726", color_title= "#FFCB6B", row = 2)
+        # Eje X compartido: un solo setXRange por cuadro y, en pausa, el zoom/pan mueve los tres
+        self.flow_plot.setXLink(self.pressure_plot)
+        self.temp_plot.setXLink(self.pressure_plot)
+        # Un solo eje de tiempo (el de abajo); arriba quedan las marcas para la grilla
+        for plot in (self.pressure_plot, self.flow_plot):
+            plot.getAxis("bottom").setStyle(showValues=False)
 
         # --- Contenedor de gráficos + resumen ---
         graph_container = QHBoxLayout()
 
-        gbox = QVBoxLayout()
-        gbox.addWidget(self.pressure_widget)
-        gbox.addWidget(self.flow_widget)
-        gbox.addWidget(self.temp_widget)
-        graph_container.addLayout(gbox)
+        graph_container.addWidget(self.graphs_widget)
 
         # --- Panel de resumen clínico ---
-        self.summary = SummaryWidget(patient_file=patient_file)
+        self.summary = SummaryWidget(manifest=self.manifest)
         self.summary.set_data_source(self)
         graph_container.addWidget(self.summary)
 
         vbox.addLayout(graph_container)
 
         # --- Botones ---
+        self.disk_warning_label = QLabel("")
+        self.disk_warning_label.setStyleSheet("color: #FFA726;")
+        self.disk_warning_label.hide()
+        self.disk_warning_timer = QTimer()
+        self.disk_warning_timer.setSingleShot(True)
+        self.disk_warning_timer.setInterval(DISK_WARNING_MS)
+        self.disk_warning_timer.timeout.connect(self.disk_warning_label.hide)
+        vbox.addWidget(self.disk_warning_label)
+
         self.start_button = QPushButton("Empezar")
         self.start_button.clicked.connect(self.start_recording)
         self.stop_button = QPushButton("Parar")
@@ -153,11 +301,43 @@ class RecordingWindow(QWidget):
 
         self.setLayout(vbox)
     
-    def toggle_autoscale_y(self, enable):
+    def show_disk_warning(self, msg):
+        """Aviso de escritura lenta en una etiqueta: un popup modal frenaría el dibujo y las lecturas."""
+        self.disk_warning_label.setText(f"⚠ {msg}")
+        self.disk_warning_label.show()
+        self.disk_warning_timer.start()  # se oculta solo si el escritor deja de avisar
 
-        for plot in [self.pressure_plot, self.flow_plot, self.temp_plot]:
-            plot.enableAutoRange(axis=pg.ViewBox.YAxis, enable=True)
+    def toggle_autoscale_y(self, enable):
+        """Con autoescala apagada el eje Y queda donde está (se puede mover con el mouse)."""
+        self.y_autoscale_enabled = bool(enable)
+        if enable:
+            self.y_ranges = dict.fromkeys(self.y_ranges)  # recalcular desde los extremos actuales
+        self.dirty = True
+
+    def set_y_lock(self, name, limits):
+        """Límites fijos para un gráfico (None vuelve a automático)."""
+        self.y_locks[name] = limits
+        self.y_ranges[name] = None
+        self.dirty = True
+        self.update_graphs()
 
+    def open_limits_window(self):
+        self.limits_window = LimitsWindow(self)
+        self.limits_window.show()
+
+    def _apply_y_ranges(self, ranges):
+        """Fija el rango Y de cada gráfico: bloqueo manual, o extremos con histéresis."""
+        plots = {"pressure": self.pressure_plot, "flow": self.flow_plot, "temperature": self.temp_plot}
+        for name, plot in plots.items():
+            if self.y_locks[name] is not None:
+                target = self.y_locks[name]
+            elif not self.y_autoscale_enabled or ranges.get(name) is None:
+                continue
+            else:
+                target = hysteresis_range(self.y_ranges[name], *ranges[name])
+            if target != self.y_ranges[name]:
+                self.y_ranges[name] = target
+                plot.setYRange(*target, padding=0)
 
 
     # ----------------------------------------------------
@@ -168,58 +348,83 @@ class RecordingWindow(QWidget):
         except json.JSONDecodeError:
             return
 
-        t = data["time"]
-        i = self.index
-
-        self.time[i] = t
-        self.pressure[i] = data["pressure"]
-        self.temperature[i] = data["temp"]
-        self.flow[i] = data["flow"]
-
-        self.index = (i + 1) % MAX_POINTS
-        if self.index == 0:
-            self.full = True
+        device_t = data["time"]
+        if self.last_t is not None:
+            if device_t < self.last_t - RESET_BACKSTEP:
+                # reset del equipo: el tramo nuevo sigue al anterior, el historial se conserva
+                _, self.t_offset, _ = continuous_time((device_t,), self.last_t, self.t_offset, self.t_step)
+                self.run_start = None
+            elif device_t > self.last_t:
+                self.t_step = device_t - self.last_t
+        self.last_t = device_t
+        t = device_t + self.t_offset
+        if self.run_start is None:
+            self.run_start = t
+        self.buffer.append((t, data["pressure"], data["temp"], data["flow"]))
+        self.history.append(t, (data["pressure"], data["flow"], data["temp"]))
+        for name, key in (("pressure", "pressure"), ("flow", "flow"), ("temperature", "temp")):
+            self.extrema[name].push(t, data[key])
+        self.dirty = True
 
         if data.get("event"):
             self._add_event_marker(t, data["event"])
 
     # ----------------------------------------------------
     def _add_event_marker(self, t, label):
-        """Dibuja marcador de evento."""
+        """Agrega el hito al ítem de marcadores de cada gráfico (no se descarta ninguno)."""
         for plot in [self.pressure_plot, self.temp_plot, self.flow_plot]:
-            line = InfiniteLine(pos=t, angle=90,
-                                pen=pg.mkPen((200, 200, 200), style=QtCore.Qt.PenStyle.DashLine))
-            text = TextItem(label, anchor=(0, 1), color=(255, 255, 255))
-            plot.addItem(line)
-            plot.addItem(text)
-            y_top = plot.viewRange()[1][1]
-            text.setPos(t, y_top - 0.05 * abs(y_top))
-            if not hasattr(plot, "event_markers"):
-                plot.event_markers = []
-            plot.event_markers.append((t, text, line))
-            if len(plot.event_markers) > 50:
-                old_t, old_text, old_line = plot.event_markers.pop(0)
-                plot.removeItem(old_text)
-                plot.removeItem(old_line)
+            plot.event_markers.add(t, label)
+        self.dirty = True
 
     # ----------------------------------------------------
-    def update_graphs(self):
-        if self.index == 0 and not self.full:
+    def mark_dirty(self, *args):
+        self.dirty = True
+
+    def _visible(self):
+        """False si la ventana está minimizada, oculta o completamente tapada."""
+        handle = self.windowHandle()
+        return self.isVisible() and not self.isMinimized() and (handle is None or handle.isExposed())
+
+    def render_frame(self):
+        """Tick del temporizador: dibuja solo con datos nuevos o vista movida, y adapta la tasa."""
+        now = time.perf_counter()
+        late_ms = max(0.0, (now - self.last_tick) * 1000 - self.frame_interval)  # event loop ocupado (pintado)
+        self.last_tick = now
+        if not self.dirty or self.paused or not self._visible():
             return
+        self.dirty = False
+        self.update_graphs()
+        self._adapt_rate((time.perf_counter() - now) * 1000 + late_ms)
+
+    def _adapt_rate(self, frame_ms):
+        budget = FRAME_BUDGET * self.frame_interval
+        interval = self.frame_interval
+        if frame_ms > budget:
+            interval = min(interval * 1.5, MAX_UPDATE_INTERVAL_MS)
+        elif frame_ms < budget / 4:
+            interval = max(interval / 1.2, UPDATE_INTERVAL_MS)
+        if int(interval) != int(self.frame_interval):
+            self.frame_interval = interval
+            self.update_timer.setInterval(int(interval))
+
+    def changeEvent(self, event):
+        """Minimizada: se detiene el refresco; al restaurar se redibuja enseguida."""
+        if event.type() == QtCore.QEvent.Type.WindowStateChange:
+            if self.isMinimized():
+                self.update_timer.stop()
+            else:
+                self.dirty = True
+                self.last_tick = time.perf_counter()
+                self.update_timer.start(int(self.frame_interval))
+        super().changeEvent(event)
 
-        # --- datos ordenados ---
-        if self.full:
-            idx = self.index
-            t = np.concatenate((self.time[idx:], self.time[:idx]))
-            p = np.concatenate((self.pressure[idx:], self.pressure[:idx]))
-            f = np.concatenate((self.flow[idx:], self.flow[:idx]))
-            temp = np.concatenate((self.temperature[idx:], self.temperature[:idx]))
-        else:
-            t = self.time[:self.index]
-            p = self.pressure[:self.index]
-            f = self.flow[:self.index]
-            temp = self.temperature[:self.index]
-
+    # ----------------------------------------------------
+    def update_graphs(self):
+        if self.paused:
+            self.update_paused()  # la ventana la maneja el usuario
+            return
+        # --- datos recientes, ordenados (vistas del buffer espejado, sin copias) ---
+        t, p, temp, f = self.buffer.view()
         if len(t) == 0:
             return
 
@@ -227,22 +432,123 @@ class RecordingWindow(QWidget):
         if t_max <= 0:
             return
         t_min = max(t_max - self.time_range, 0)
-        mask = (t >= t_min) & (t <= t_max)
-        t, p, f, temp = t[mask], p[mask], f[mask], temp[mask]
-
-        if len(t) == 0:
-            return
-
-        if len(t) > 5000:
-            step = len(t) // 5000
-            t, p, f, temp = t[::step], p[::step], f[::step], temp[::step]
-
-        self.pressure_curve.setData(t, p)
-        self.flow_curve.setData(t, f)
-        self.temp_curve.setData(t, temp)
+        columns = int(self.pressure_plot.getViewBox().width()) or MAX_POINTS
+        curves = (self.pressure_curve, self.flow_curve, self.temp_curve)
+        names = ("pressure", "flow", "temperature")
+
+        if not self._raw_covers(t, t_min) and self.history.rings[0].count:
+            # La ventana va más atrás que los datos crudos: buckets min/max del historial + crudos
+            ranges = {}
+            for name, curve, (t_c, v_c) in zip(names, curves,
+                                                self._history_curves(t_min, t_max, t, (p, f, temp))):
+                curve.setData(*minmax_decimate(t_c, v_c, columns, t_min, t_max))
+                finite = v_c[np.isfinite(v_c)]  # buckets visibles y el buffer: unos miles de valores
+                ranges[name] = (finite.min(), finite.max()) if len(finite) else None
+        else:
+            # El tiempo continuo crece: la ventana es un slice (búsqueda binaria, sin máscara)
+            lo, hi = np.searchsorted(t, t_min, side="left"), np.searchsorted(t, t_max, side="right")
+            t, p, f, temp = t[lo:hi], p[lo:hi], f[lo:hi], temp[lo:hi]
+            if len(t) == 0:
+                return
+            # Envolvente min/max por columna de píxeles: nunca esconde un pico
+            for curve, v in zip(curves, (p, f, temp)):
+                curve.setData(*minmax_decimate(t, v, columns, t_min, t_max))
+            ranges = {name: self.extrema[name].range() for name in names}
+
+        self.pressure_plot.setXRange(t_min, t_max, padding=0)  # flujo y temperatura están enlazados
+        self._apply_y_ranges(ranges)
+
+    def _raw_covers(self, t, t_min):
+        """True si el buffer crudo tiene toda la ventana (o toda la sesión, p. ej. en "Completo")."""
+        return t[0] <= t_min or not self.buffer.full
+
+    def _history_curves(self, t_min, t_max, t, channels):
+        """
+        (t, v) por canal para [t_min, t_max]: envolvente min/max (intercalada)
+        de los buckets del historial hasta donde empieza el buffer, y de ahí
+        en adelante las muestras crudas de `channels` (el historial no
+        incluye los buckets que todavía se están armando).
+        """
+        t_b, _, v_min, v_max = self.history.query(t_min, t_max)
+        t_env = np.repeat(t_b, 2)
+        older = t_env < t[0] if len(t) else np.ones(len(t_env), dtype=bool)
+        lo, hi = np.searchsorted(t, t_min, side="left"), np.searchsorted(t, t_max, side="right")
+        curves = []
+        for i, v in enumerate(channels):
+            v_env = np.empty(2 * len(t_b))
+            v_env[0::2], v_env[1::2] = v_min[i], v_max[i]
+            curves.append((np.concatenate((t_env[older], t[lo:hi])),
+                           np.concatenate((v_env[older], v[lo:hi]))))
+        return curves
 
-        for plot in [self.pressure_plot, self.temp_plot, self.flow_plot]:
-            plot.setXRange(t_min, t_max, padding=0)
+    # ----------------------------------------------------
+    def set_paused(self, paused):
+        """En pausa el gráfico queda quieto; adquisición, registro y resumen siguen igual."""
+        self.paused = bool(paused)
+        self.pause_button.setText("Volver a vivo" if self.paused else "Pausar")
+        if self.paused:
+            self.update_paused()
+        else:
+            self.pause_timer.stop()
+            self.dirty = True
+            self.update_graphs()
+
+    def _on_x_range_changed(self, *args):
+        if self.paused:
+            self.pause_timer.start()
+
+    def update_paused(self):
+        """Redibuja el rango que se está mirando en pausa, con la resolución que da el zoom."""
+        t_min, t_max = self.pressure_plot.viewRange()[0]
+        columns = int(self.pressure_plot.getViewBox().width()) or MAX_POINTS
+        curves = (self.pressure_curve, self.flow_curve, self.temp_curve)
+        ranges = {}
+        for name, curve, (t, v) in zip(("pressure", "flow", "temperature"), curves,
+                                       self._paused_data(t_min, t_max)):
+            curve.setData(*minmax_decimate(t, v, columns, t_min, t_max))
+            finite = v[np.isfinite(v)]
+            ranges[name] = (finite.min(), finite.max()) if len(finite) else None
+        self._apply_y_ranges(ranges)
+
+    def _paused_data(self, t_min, t_max):
+        """
+        (t, v) de presión, flujo y temperatura en [t_min, t_max]: crudos del
+        buffer si alcanzan; crudos del disco si la vista es angosta; si no,
+        la envolvente del historial en memoria seguida de los crudos del buffer.
+        """
+        t, p, temp, f = self.buffer.view()
+        if len(t) and self._raw_covers(t, t_min):
+            lo, hi = np.searchsorted(t, t_min, side="left"), np.searchsorted(t, t_max, side="right")
+            return [(t[lo:hi], v[lo:hi]) for v in (p, f, temp)]
+
+        rate = (len(t) - 1) / (t[-1] - t[0]) if len(t) > 1 and t[-1] > t[0] else 0.0
+        if (t_max - t_min) * rate <= PAUSE_RAW_SAMPLES:
+            raw = self._read_disk(t_min, t_max)
+            if raw is not None:
+                return raw
+        return self._history_curves(t_min, t_max, t, (p, f, temp))
+
+    def _read_disk(self, t_min, t_max):
+        """
+        Datos crudos del registro en disco, solo del tramo actual: el disco
+        guarda el tiempo del equipo, que se repite tras un reset. Ventanas
+        que empiezan en un tramo anterior quedan para el historial.
+        """
+        if self.run_start is None or t_min < self.run_start:
+            return None
+        try:
+            df = read_range(os.path.dirname(self.file_path) or ".", t_min - self.t_offset, t_max - self.t_offset)
+        except (OSError, ValueError) as e:  # archivos ausentes o a medio escribir; el resto es un error real
+            print(f"[RecordingWindow] No se pudo leer el registro: {e}")
+            return None
+        if df.empty:
+            return None
+        data = df.iloc[:, :4].to_numpy(dtype=float)  # tiempo, presión, temperatura, flujo
+        resets = np.flatnonzero(np.diff(data[:, 0]) < -RESET_BACKSTEP)
+        if len(resets):
+            data = data[resets[-1] + 1:]
+        t = data[:, 0] + self.t_offset
+        return [(t, data[:, 1]), (t, data[:, 3]), (t, data[:, 2])]
             
     # ----------------------------------------------------
     def send_hito_event(self):
@@ -256,38 +562,77 @@ class RecordingWindow(QWidget):
         idx = self.scale_drop.currentIndex()
         try:
             if idx == 0:
-                self.time_range = TIME_RANGE_DEFAULT
+                self.time_range = float("inf")  # toda la sesión (historial)
             else:
                 t = float(self.seconds_box.text())
                 if idx == 2:
                     t *= 60
-                #elif idx == 3:#horas
-                #    t *= 3600
+                elif idx == 3:
+                    t *= 3600
                 self.time_range = t
-            if self.time_range > TIME_RANGE_DEFAULT:
-                self.time_range = TIME_RANGE_DEFAULT
         except:
             ErrorWindow("Ventana de tiempo debe ser numérica.").exec()
+        # Los extremos se recalculan una vez con la nueva ventana desde los datos crudos
+        t, p, temp, f = self.buffer.view()
+        for name, v in (("pressure", p), ("flow", f), ("temperature", temp)):
+            self.extrema[name].rebuild(self.time_range, t, v)
+        self.dirty = True
         self.update_graphs()
 
     # ----------------------------------------------------
     def start_recording(self):
+        self.manifest.start()
         self.serial_reader.start()
+        self.recording = True
         self.start_button.hide()
         self.stop_button.show()
 
     def stop_recording(self):
-        self.stop_recording_signal.emit()
         # --- NEW: save final infuse time ---
         if hasattr(self, "summary"):
             self.summary.finalize_infuse_time()
-        self.close()
+        self.close()  # closeEvent detiene el lector y actualiza el catálogo
+
+    def _finish_session(self):
+        """
+        Detiene el lector y cierra la sesión en un hilo aparte: esperar al
+        escritor y releer toda la sesión puede llevar segundos, y la interfaz
+        no se congela. El hilo no es daemon: la aplicación lo espera al salir.
+        """
+        self.stop_recording_signal.emit()
+        if not self.recording:
+            return
+        self.recording = False
+        self.close_thread = threading.Thread(target=self._close_session, name="close_session")
+        self.close_thread.start()
+
+    def _close_session(self):
+        """Espera a que el escritor vacíe sus buffers y recién entonces actualiza el catálogo."""
+        if not self.serial_reader.wait(READER_STOP_TIMEOUT_MS):
+            print("[RecordingWindow] El lector no terminó a tiempo; se actualiza el catálogo igual.")
+        self.update_catalog()
+
+    def update_catalog(self):
+        """Guarda el resumen en session.json y registra la sesión en el catálogo."""
+        folder = os.path.dirname(self.file_path) or "."
+        try:
+            # El escaneo lee la sesión completa: en otro proceso, como SessionCatalog.rebuild
+            with ProcessPoolExecutor(max_workers=1) as pool:
+                scan = pool.submit(scan_session, folder).result()
+            self.manifest.set_summary(scan)
+            banner = list(self.serial_reader.device_banner)
+            if banner:
+                self.manifest.set_device_banner(banner)
+            scan["data_mtime"] = data_mtime(folder)  # incluye el session.json recién escrito
+            SessionCatalog().upsert(scan)
+        except Exception as e:
+            print(f"[RecordingWindow] No se pudo actualizar el catálogo: {e}")
 
     def full_mode(self, index):
         self.seconds_box.setDisabled(index == 0)
 
     def closeEvent(self, event):
-        self.stop_recording_signal.emit()
+        self._finish_session()
         event.accept()
 
 
@@ -306,11 +651,12 @@ def format_hms(seconds):
 class SummaryWidget(QWidget):
     """Panel lateral estilo monitor, optimizado para pantallas 16:9."""
 
-    def __init__(self, parent=None, patient_file="patient_info.txt"):
+    def __init__(self, parent=None, manifest=None):
         super().__init__(parent)
 
         # un poco más angosto y sin exagerar el alto
         self.data_ref = None
+        self.reset_sample = None  # buffer.count al último reboot de min/max
         self.setMinimumWidth(260)
         self.setStyleSheet("""
             SummaryWidget, QWidget {
@@ -336,7 +682,7 @@ class SummaryWidget(QWidget):
             }
         """)
 
-        self.patient_file = patient_file
+        self.manifest = manifest
         self.patient_info = self._load_patient_info()
 
         layout = QVBoxLayout(self)
@@ -516,27 +862,15 @@ class SummaryWidget(QWidget):
         return lbl
 
     def _load_patient_info(self):
-        """Reads patient info from text file and normalizes keys."""
+        """Datos del paciente desde el manifiesto de la sesión."""
         data = {"id": "(not set)", "blood": "(not set)", "mass": "(not set)", "infuse": "(not set)"}
-        if not os.path.exists(self.patient_file):
+        if self.manifest is None:
             return data
-
-        with open(self.patient_file, "r") as f:
-            for line in f:
-                if ":" not in line:
-                    continue
-                key, val = line.strip().split(":", 1)
-                key = key.strip().lower().replace(" ", "_")
-                val = val.strip() or "(not set)"
-                # Normalize to our internal keys
-                if "organ" in key:
-                    data["id"] = val
-                elif "blood" in key:
-                    data["blood"] = val
-                elif "mass" in key:
-                    data["mass"] = val
-                elif "infuse" in key:
-                    data["infuse"] = val
+        patient = self.manifest.patient
+        data["id"] = patient.get("organ_id") or "(not set)"
+        data["blood"] = patient.get("blood_type") or "(not set)"
+        data["mass"] = patient.get("liver_mass_g") or "(not set)"
+        data["infuse"] = self.manifest.timing.get("infuse_time") or "(not set)"
         return data
 
 
@@ -546,33 +880,15 @@ class SummaryWidget(QWidget):
     # ---------- lógica de actualización ----------
 
     def update_panel(self):
-        if not self.data_ref or self.data_ref.index == 0:
+        if not self.data_ref or self.data_ref.buffer.count == 0:
             return
 
-        rw = self.data_ref
-        t, p, f, temp = rw.time, rw.pressure, rw.flow, rw.temperature
-
-        # buffer circular → ordenar
-        if rw.full:
-            idx = rw.index
-            t = np.concatenate((t[idx:], t[:idx]))
-            p = np.concatenate((p[idx:], p[:idx]))
-            f = np.concatenate((f[idx:], f[:idx]))
-            temp = np.concatenate((temp[idx:], temp[:idx]))
-        else:
-            t, p, f, temp = t[:rw.index], p[:rw.index], f[:rw.index], temp[:rw.index]
+        # Solo las muestras desde el último reboot (o todo el buffer), como vistas sin copia
+        buf = self.data_ref.buffer
+        t, p, temp, f = buf.since(self.reset_sample) if self.reset_sample is not None else buf.view()
 
-        if len(t) < 2:
+        if len(t) < 1:
             return
-        
-        # Si se ha hecho reboot, solo considerar datos desde ese punto
-        if hasattr(self, "reset_index") and rw.full:
-            t = np.concatenate((t[idx:], t[:idx]))
-            start_idx = self.reset_index if self.reset_index < len(t) else 0
-            t = t[start_idx:]
-            p, f, temp = p[start_idx:], f[start_idx:], temp[start_idx:]
-        elif hasattr(self, "reset_index"):
-            t, p, f, temp = t[self.reset_index:], p[self.reset_index:], f[self.reset_index:], temp[self.reset_index:]
 
         # FLOW
         self.flow_value.setText(f"{f[-1]:.1f}")
@@ -603,8 +919,8 @@ class SummaryWidget(QWidget):
 
         rw = self.data_ref
 
-        # Guardamos la posición actual como punto de reinicio
-        self.reset_index = rw.index
+        # Guardamos el número de muestra actual como punto de reinicio
+        self.reset_sample = rw.buffer.count
 
         # Reiniciar valores visuales
         self.flow_minmax.setText("Min: -- mL/min | Max: -- mL/min")
@@ -616,7 +932,7 @@ class SummaryWidget(QWidget):
         self.temp_mean.setText("Mean: -- °C")
 
         # Registrar tiempo del reinicio para depuración
-        print("[SummaryWidget] Min/Max reset at index", self.reset_index)
+        print("[SummaryWidget] Min/Max reset at sample", self.reset_sample)
     
     def finalize_infuse_time(self):
         """Update patient file and panel with the final infuse time."""
@@ -624,23 +940,9 @@ class SummaryWidget(QWidget):
         final_time = format_hms(elapsed)
         self.info_labels["infuse"].setText(final_time)
 
-        # Persist final value into the patient info text file
-        lines = []
-        if os.path.exists(self.patient_file):
-            with open(self.patient_file, "r") as f:
-                lines = f.readlines()
-
-        # Update or append the infuse line
-        found = False
-        with open(self.patient_file, "w") as f:
-            for line in lines:
-                if "infuse" in line.lower():
-                    f.write(f"Infuse Time: {final_time}\n")
-                    found = True
-                else:
-                    f.write(line)
-            if not found:
-                f.write(f"Infuse Time: {final_time}\n")
+        # Persist final value into the session manifest (atomic write)
+        if self.manifest is not None:
+            self.manifest.finish(final_time)
     
     def _update_logo_size(self):
         """Resize logo proportionally to widget size while keeping aspect ratio."""
@@ -671,11 +973,12 @@ class SummaryWidget(QWidget):
         self._update_logo_size()
 
     def on_tare(self, type):
-        if self.data_ref:
+        if self.data_ref and self.data_ref.buffer.count:
+            _, pressure, _, flow = self.data_ref.buffer.last()
             if type == "pressure":
-                self.data_ref.serial_reader.tare("pressure", self.data_ref.pressure[self.data_ref.index - 1])
+                self.data_ref.serial_reader.tare("pressure", pressure)
             elif type == "flow":
-                self.data_ref.serial_reader.tare("flow", self.data_ref.flow[self.data_ref.index - 1])
+                self.data_ref.serial_reader.tare("flow", flow)
 
     def change_flow_direction(self):
         if self.data_ref:
@@ -0,0 +1,213 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+
+# Tolerancia por canal (unidades del canal): la reconstrucción lineal entre
+# puntos guardados nunca se aleja más que esto de la muestra original.
+HISTORIAN_TOLERANCES = {"pressure": 0.1, "temperature": 0.1, "flow": 0.1}
+HISTORIAN_CHANNELS = ("pressure", "temperature", "flow")  # columnas 1..3 de data.csv
+HISTORIAN_FILES = tuple(f"hist_{c}.csv" for c in HISTORIAN_CHANNELS)
+EPSILON = 1e-9  # 22.7 - 22.6 = 0.10000000000000142: que eso siga dentro de 0.1
+
+
+# ===========================================================
+# ===              COMPRESIÓN SWINGING DOOR               ===
+# ===========================================================
+
+class SwingingDoor:
+    """
+    Compresión swinging door de un canal, muestra por muestra. Mantiene el
+    rango de pendientes [s_lo, s_hi] que, desde el último punto guardado,
+    pasan a menos de `tolerance` de todas las muestras siguientes. Cuando
+    una muestra cierra la puerta se guarda la anterior, con el valor que
+    cae sobre una pendiente válida (a lo sumo `tolerance` del original),
+    así la interpolación entre puntos guardados respeta la tolerancia.
+    """
+
+    def __init__(self, tolerance):
+        self.tolerance = tolerance + EPSILON
+        self.anchor = None  # último punto guardado (t, v)
+        self.prev = None    # última muestra aceptada sin guardar
+        self.s_lo = -np.inf
+        self.s_hi = np.inf
+
+    def _restart(self, point):
+        self.anchor = point
+        self.prev = None
+        self.s_lo, self.s_hi = -np.inf, np.inf
+
+    def _close_door(self):
+        """Punto a guardar en lugar de prev (sobre una pendiente válida)."""
+        at, av = self.anchor
+        pt, pv = self.prev
+        slope = min(max((pv - av) / (pt - at), self.s_lo), self.s_hi)
+        return (pt, av + slope * (pt - at))
+
+    def add(self, t, v):
+        """Agrega una muestra; devuelve la lista de puntos a guardar (casi siempre vacía)."""
+        if self.anchor is None:
+            self._restart((t, v))
+            return [(t, v)]
+        last_t = self.prev[0] if self.prev else self.anchor[0]
+        if t == last_t:
+            return []  # mismo milisegundo: una curva no puede tener dos valores en t
+        if t < last_t:
+            # Reset del equipo: se cierra el tramo y empieza otro
+            out = self.flush()
+            self._restart((t, v))
+            return out + [(t, v)]
+
+        at, av = self.anchor
+        dt = t - at
+        lo = max(self.s_lo, (v - self.tolerance - av) / dt)
+        hi = min(self.s_hi, (v + self.tolerance - av) / dt)
+        if lo <= hi:
+            self.s_lo, self.s_hi = lo, hi
+            self.prev = (t, v)
+            return []
+
+        point = self._close_door()
+        self._restart(point)
+        dt = t - point[0]
+        self.s_lo = (v - self.tolerance - point[1]) / dt
+        self.s_hi = (v + self.tolerance - point[1]) / dt
+        self.prev = (t, v)
+        return [point]
+
+    def force(self, t, v):
+        """Guarda esta muestra tal cual (hitos y modo crudo)."""
+        out = self.flush()
+        self._restart((t, v))
+        return out + [(t, v)]
+
+    def flush(self):
+        """Guarda lo pendiente (al cerrar o antes de un reset)."""
+        if self.prev is None:
+            return []
+        point = self._close_door()
+        self._restart(point)
+        return [point]
+
+
+# ===========================================================
+# ===                ESCRITOR HISTORIADOR                 ===
+# ===========================================================
+
+class HistorianWriter:
+    """
+    Modo historiador: en lugar de cada muestra guarda, por canal, solo los
+    puntos de quiebre en hist_<canal>.csv (Time, valor). Las filas con hito
+    se guardan siempre; con set_raw(True) se guardan todas las muestras
+    tal cual, para los períodos que necesitan el registro crudo.
+    """
+
+    def __init__(self, folder, columns, tolerances=None):
+        self.folder = folder
+        self.columns = list(columns)  # Time + los 3 canales, como en data.csv
+        self.tolerances = dict(HISTORIAN_TOLERANCES, **(tolerances or {}))
+        self.doors = [SwingingDoor(self.tolerances[c]) for c in HISTORIAN_CHANNELS]
+        self.paths = [os.path.join(folder, name) for name in HISTORIAN_FILES]
+        self.raw = False
+        self.samples = 0
+        self.points = 0
+
+    def set_raw(self, enabled):
+        self.raw = bool(enabled)
+
+    def write_block(self, df):
+        t = df.iloc[:, 0].to_numpy(dtype=float)
+        if self.raw:
+            keep = np.ones(len(df), dtype=bool)
+        elif df.shape[1] > 4:
+            keep = (df.iloc[:, 4].fillna("").astype(str) != "").to_numpy()
+        else:
+            keep = np.zeros(len(df), dtype=bool)
+        for i, door in enumerate(self.doors):
+            values = df.iloc[:, i + 1].to_numpy(dtype=float)
+            points = []
+            for ti, vi, forced in zip(t.tolist(), values.tolist(), keep.tolist()):
+                if vi != vi:  # NaN: canal sin muestra en esta fila
+                    continue
+                points.extend(door.force(ti, vi) if forced else door.add(ti, vi))
+            self._append(i, points)
+        self.samples += len(df)
+
+    def _append(self, i, points):
+        if not points:
+            return
+        path = self.paths[i]
+        new = not os.path.exists(path)
+        with open(path, "a", encoding="utf-8") as f:
+            if new:
+                f.write(f"{self.columns[0]},{self.columns[i + 1]}\n")
+            f.writelines(f"{t},{v}\n" for t, v in points)
+        self.points += len(points)
+
+    def close(self):
+        for i, door in enumerate(self.doors):
+            self._append(i, door.flush())
+        if self.samples:
+            print(f"[HistorianWriter] {self.samples} muestras -> {self.points} puntos "
+                  f"({self.points / (3 * self.samples):.1%})")
+
+
+# ===========================================================
+# ===                     LECTURA                         ===
+# ===========================================================
+
+def has_historian(folder):
+    return any(os.path.exists(os.path.join(folder, name)) for name in HISTORIAN_FILES)
+
+
+def read_points(path):
+    """(nombre de columna, tiempos, valores) de un hist_<canal>.csv."""
+    df = pd.read_csv(path)
+    return df.columns[1], df.iloc[:, 0].to_numpy(dtype=float), df.iloc[:, 1].to_numpy(dtype=float)
+
+
+def _runs(t):
+    """Límites de los tramos de tiempo creciente (un reset abre otro)."""
+    breaks = np.flatnonzero(np.diff(t) <= 0) + 1
+    return np.concatenate(([0], breaks)), np.concatenate((breaks, [len(t)]))
+
+
+def read_historian(folder, t_start=None, t_end=None):
+    """
+    Reconstruye la sesión con las columnas de data.csv: en cada tramo, los
+    canales se interpolan linealmente sobre la unión de sus puntos guardados.
+    Los hitos salen de events.csv.
+    """
+    channels = []
+    for name in HISTORIAN_FILES:
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            channels.append(read_points(path))
+    if not channels:
+        return pd.DataFrame()
+    runs = [list(zip(*_runs(t))) for _, t, _ in channels]
+    n_runs = min(len(r) for r in runs)
+
+    parts = []
+    for k in range(n_runs):
+        pieces = [(t[a:b], v[a:b]) for (_, t, v), r in zip(channels, runs) for a, b in [r[k]]]
+        grid = np.unique(np.concatenate([t for t, _ in pieces]))
+        if t_start is not None:
+            grid = grid[grid >= t_start]
+        if t_end is not None:
+            grid = grid[grid <= t_end]
+        if len(grid):
+            parts.append([grid] + [np.interp(grid, t, v) for t, v in pieces])
+    columns = ["Time"] + [name for name, _, _ in channels]
+    if not parts:
+        return pd.DataFrame(columns=columns + ["Events"])
+    df = pd.DataFrame(np.concatenate(parts, axis=1).T, columns=columns)
+
+    df["Events"] = ""
+    events_path = os.path.join(folder, "events.csv")
+    if os.path.exists(events_path):
+        events = pd.read_csv(events_path, keep_default_na=False)
+        labels = dict(zip(events.iloc[:, 0].astype(float), events.iloc[:, 1].astype(str)))
+        df["Events"] = [labels.get(t, "") for t in df.iloc[:, 0]]
+    return df
@@ -7,6 +7,9 @@ from PyQt6.QtWidgets import (
 from PyQt6.QtGui import QPalette, QColor, QAction, QIcon
 import serial.tools.list_ports
 from frontend import RecordingWindow
+from backend import ErrorWindow
+from catalog import SessionCatalog, SESSIONS_ROOT
+from session import SessionManifest
 
 
 def set_dark_mode(app):
@@ -77,31 +80,28 @@ def set_dark_mode(app):
 # ============================================================
 
 class PatientDialog(QDialog):
-    """Ventana para ingresar la información del paciente."""
-    def __init__(self, save_path):
+    """Ventana para ingresar la información del paciente (se guarda en session.json)."""
+    def __init__(self, manifest):
         super().__init__()
         self.setWindowTitle("Patient Information")
-        self.save_path = save_path
+        self.manifest = manifest
         self.setMinimumWidth(300)
 
         layout = QVBoxLayout(self)
         self.inputs = {}
-        fields = ["Organ ID", "Blood Type", "Liver Mass (g)"]
-        for f in fields:
-            layout.addWidget(QLabel(f))
+        fields = [("Organ ID", "organ_id"), ("Blood Type", "blood_type"), ("Liver Mass (g)", "liver_mass_g")]
+        for label, key in fields:
+            layout.addWidget(QLabel(label))
             le = QLineEdit()
             layout.addWidget(le)
-            self.inputs[f.lower().replace(" ", "_")] = le
+            self.inputs[key] = le
 
         btn = QPushButton("Guardar y continuar")
         btn.clicked.connect(self.save_and_close)
         layout.addWidget(btn)
 
     def save_and_close(self):
-        with open(self.save_path, "w") as f:
-            for k, le in self.inputs.items():
-                f.write(f"{k}: {le.text().strip()}\n")
-            f.write("infuse: 00h 00m 00s\n")
+        self.manifest.set_patient(**{k: le.text().strip() for k, le in self.inputs.items()})
         self.accept()
 
 
@@ -109,6 +109,20 @@ class PatientDialog(QDialog):
 # === VENTANA DE INICIO ======================================
 # ============================================================
 
+def session_folder_name(name):
+    """
+    Nombre de carpeta para la sesión: los separadores de ruta se reemplazan
+    por "_" (los puntos valen: "1.0", "1.1 jeringaa"). None si no queda un
+    nombre usable.
+    """
+    for sep in {os.sep, os.altsep, "/", "\\"} - {None}:
+        name = name.replace(sep, "_")
+    name = name.strip()
+    if name in ("", ".", ".."):
+        return None
+    return name
+
+
 class StartWindow(QWidget):
     def __init__(self):
         super().__init__()
@@ -133,18 +147,26 @@ class StartWindow(QWidget):
 
     def start_recording(self):
         port = self.port_menu.currentText().split(" ")[0]
-        os.makedirs("tests", exist_ok=True)
-        folder = os.path.join("tests", self.name_box.text())
+        name = session_folder_name(self.name_box.text())
+        if name is None:
+            ErrorWindow("Nombre inválido").exec()
+            return
+        # Reusar un nombre mezclaría dos sesiones en el mismo data.csv
+        if SessionCatalog().name_taken(name):
+            ErrorWindow(f"Ya existe una sesión llamada '{name}'. Elegir otro nombre.").exec()
+            return
+        os.makedirs(SESSIONS_ROOT, exist_ok=True)
+        folder = os.path.join(SESSIONS_ROOT, name)
         os.makedirs(folder, exist_ok=True)
         path = os.path.join(folder, "data.csv")
-        patient_file = os.path.join(folder, "patient_info.txt")
+        manifest = SessionManifest.create(folder, name, port=port)
 
         # --- Mostrar diálogo de paciente ---
-        dlg = PatientDialog(patient_file)
+        dlg = PatientDialog(manifest)
         dlg.exec()
 
         # --- Crear ventana de grabación ---
-        self.recorder_window = RecordingWindow(port, path, patient_file=patient_file)
+        self.recorder_window = RecordingWindow(port, path, manifest=manifest)
         self.recorder_window.show()
         self.parent().close()
 
@@ -0,0 +1,107 @@
+import numpy as np
+import pyqtgraph as pg
+from PyQt6 import QtCore, QtGui
+
+
+LABEL_GAP_PX = 6       # separación mínima entre etiquetas antes de ocultar la siguiente
+LABEL_MARGIN_PX = 4    # distancia de la etiqueta a su línea y al borde superior
+
+
+# ===========================================================
+# ===           MARCADORES DE HITOS EN LOTE               ===
+# ===========================================================
+
+class EventMarkers(pg.GraphicsObject):
+    """
+    Todos los hitos de un gráfico en un solo ítem: las líneas verticales se
+    dibujan como un único path (a lo sumo una por columna de píxeles) y las
+    etiquetas se dibujan de izquierda a derecha, omitiendo las que se
+    superponen con la anterior según el zoom. No se borra ningún hito; el
+    costo de dibujo depende de lo visible, no de la cantidad total.
+    """
+
+    def __init__(self, pen=None, label_color=(255, 255, 255)):
+        super().__init__()
+        self.pen = pen or pg.mkPen((200, 200, 200), style=QtCore.Qt.PenStyle.DashLine)
+        self.label_color = QtGui.QColor(*label_color)
+        self.times = np.zeros(0)
+        self.labels = []
+        self.setZValue(10)
+
+    def add(self, t, label):
+        """Agrega un hito (los tiempos se mantienen ordenados)."""
+        i = int(np.searchsorted(self.times, t, side="right"))
+        self.times = np.insert(self.times, i, t)
+        self.labels.insert(i, str(label))
+        self.update()
+
+    def extend(self, times, labels):
+        """Agrega varios hitos de una vez."""
+        self.set_events(np.concatenate((self.times, np.asarray(times, dtype=float))),
+                        self.labels + [str(x) for x in labels])
+
+    def set_events(self, times, labels):
+        order = np.argsort(np.asarray(times, dtype=float), kind="stable")
+        self.times = np.asarray(times, dtype=float)[order]
+        self.labels = [str(labels[i]) for i in order]
+        self.update()
+
+    def clear(self):
+        self.set_events([], [])
+
+    def __len__(self):
+        return len(self.times)
+
+    # ---------- QGraphicsItem ----------
+
+    def dataBounds(self, axis, frac=1.0, orthoRange=None):
+        return None  # no participa del autoescalado
+
+    def viewRangeChanged(self):
+        self.prepareGeometryChange()
+        self.update()
+
+    def boundingRect(self):
+        rect = self.viewRect()
+        return rect if rect is not None else QtCore.QRectF()
+
+    def paint(self, p, *args):
+        rect = self.viewRect()
+        if rect is None or not len(self.times):
+            return
+        lo = int(np.searchsorted(self.times, rect.left(), side="left"))
+        hi = int(np.searchsorted(self.times, rect.right(), side="right"))
+        if lo >= hi:
+            return
+        t = self.times[lo:hi]
+
+        # Una línea por columna de píxeles: miles de hitos cuestan lo mismo que un ancho de pantalla
+        px = self.pixelWidth() or 1.0
+        cols = np.floor(t / px)
+        first = np.concatenate(([True], cols[1:] != cols[:-1]))
+        top, bottom = rect.top(), rect.bottom()
+        path = QtGui.QPainterPath()
+        for x in t[first].tolist():
+            path.moveTo(x, top)
+            path.lineTo(x, bottom)
+        p.setPen(self.pen)
+        p.drawPath(path)
+
+        # Etiquetas en coordenadas de pantalla (sin escalar), omitiendo las que chocan
+        transform = p.transform()
+        p.save()
+        p.resetTransform()
+        p.setPen(self.label_color)
+        metrics = p.fontMetrics()
+        y_top = min(transform.map(QtCore.QPointF(t[0], top)).y(),
+                    transform.map(QtCore.QPointF(t[0], bottom)).y())
+        baseline = y_top + LABEL_MARGIN_PX + metrics.ascent()
+        x_px = t * transform.m11() + transform.m31() + LABEL_MARGIN_PX  # eje x sin rotación
+        i = 0
+        while i < len(x_px):
+            label = self.labels[lo + i]
+            p.drawText(QtCore.QPointF(float(x_px[i]), baseline), label)
+            # la próxima etiqueta que no choca con esta (solo se recorren las dibujadas)
+            right = x_px[i] + metrics.horizontalAdvance(label) + LABEL_GAP_PX
+            i = max(i + 1, int(np.searchsorted(x_px, right, side="left")))
+        p.restore()
@@ -0,0 +1,159 @@
+import os
+import sys
+
+import numpy as np
+
+from session import SessionManifest
+from storage import read_range, RESET_BACKSTEP
+
+
+TRANSFORM_SETTINGS = ("pressure_offset", "flow_offset", "flow_direction")
+INITIAL_SETTINGS = {"pressure_offset": 0.0, "flow_offset": 0.0, "flow_direction": 1}
+
+
+def change_rows(changes, t):
+    """
+    Fila desde la que rige cada cambio, según su `t` (tiempo de la última
+    muestra antes del cambio). `sample` no sirve como índice: cuenta también
+    las muestras descartadas con la cola llena, y en el formato historiador
+    las filas no son muestras. Tras un reset el mismo t aparece en varios
+    tramos: vale el que no queda antes del cambio anterior y, si quedan
+    varios, el más cercano a `sample`.
+    """
+    t = np.asarray(t, dtype=float)
+    bounds = np.concatenate(([0], np.flatnonzero(np.diff(t) < -RESET_BACKSTEP) + 1, [len(t)]))
+    rows, prev = [], 0
+    for h in changes:  # en orden cronológico, como se registraron
+        if h.get("t") is None:  # antes de la primera muestra
+            rows.append(prev)
+            continue
+        candidates = []
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            run = t[lo:hi]
+            if run[0] - RESET_BACKSTEP <= h["t"] <= run.max():
+                row = lo + int(np.searchsorted(run, h["t"], side="right"))
+                if row >= prev:
+                    candidates.append(row)
+        if not candidates:
+            print(f"[Reprocess] t={h['t']} de {h['setting']} no está en los datos; rige desde la fila {prev}")
+            candidates = [prev]
+        sample = h.get("sample")
+        prev = candidates[0] if sample is None else min(candidates, key=lambda row: abs(row - sample))
+        rows.append(prev)
+    return np.array(rows, dtype=np.int64)
+
+
+def settings_regimes(history, t):
+    """
+    Convierte el historial de ajustes en tramos de filas de la columna de
+    tiempo `t`. Devuelve (regime, table): regime[i] es el tramo de la fila i
+    y table[setting][k] el valor del ajuste durante el tramo k.
+    """
+    changes = [h for h in history if h["setting"] in TRANSFORM_SETTINGS]
+    starts = change_rows(changes, t)
+
+    current = dict(INITIAL_SETTINGS)
+    if changes:
+        # El primer "old" de cada ajuste es su valor inicial real
+        for setting in TRANSFORM_SETTINGS:
+            first = next((h for h in changes if h["setting"] == setting), None)
+            if first is not None:
+                current[setting] = first["old"]
+    table = {k: [v] for k, v in current.items()}
+    for h in changes:
+        current[h["setting"]] = h["new"]
+        for k in TRANSFORM_SETTINGS:
+            table[k].append(current[k])
+
+    regime = np.searchsorted(starts, np.arange(len(t)), side="right")
+    return regime, {k: np.asarray(v, dtype=float) for k, v in table.items()}
+
+
+def recover_raw(pressure, flow, regime, table):
+    """Deshace offsets y dirección de flujo de toda la sesión en una sola operación vectorizada."""
+    raw_pressure = pressure - table["pressure_offset"][regime]
+    raw_flow = flow / table["flow_direction"][regime] - table["flow_offset"][regime]
+    return raw_pressure, raw_flow
+
+
+def apply_settings(raw_pressure, raw_flow, regime, table):
+    pressure = np.round(raw_pressure + table["pressure_offset"][regime], 1)
+    flow = np.round(table["flow_direction"][regime] * (raw_flow + table["flow_offset"][regime]), 1)
+    return pressure, flow
+
+
+def corrected_history(history, drop=(), override=None):
+    """
+    Historial corregido: `drop` son índices de cambios a descartar (p. ej. un
+    tare equivocado) y `override` {índice: valor nuevo}. Los cambios que
+    quedan se encadenan de nuevo: un tare suma su delta al offset corregido
+    y un cambio de dirección invierte la dirección vigente.
+    """
+    override = override or {}
+    current = {}
+    fixed = []
+    for i, h in enumerate(history):
+        setting = h["setting"]
+        if setting not in TRANSFORM_SETTINGS:
+            continue
+        prev = current.get(setting, h["old"])  # el primer "old" es el valor inicial
+        if i in drop:
+            current[setting] = prev
+            continue
+        if i in override:
+            new = override[i]
+        elif setting == "flow_direction":
+            new = prev * (h["new"] / h["old"])
+        else:
+            new = prev + (h["new"] - h["old"])
+        current[setting] = new
+        fixed.append(dict(h, old=prev, new=new))
+    return fixed
+
+
+def reprocess_session(folder, drop=(), override=None):
+    """Vuelve a aplicar los ajustes de una sesión con el historial corregido. Devuelve un DataFrame."""
+    manifest = SessionManifest.load(folder)
+    history = manifest.data.get("settings_history", [])
+    df = read_range(folder)
+    t = df.iloc[:, 0].to_numpy(dtype=float)
+    pressure = df.iloc[:, 1].to_numpy(dtype=float)
+    flow = df.iloc[:, 3].to_numpy(dtype=float)
+
+    regime, table = settings_regimes(history, t)
+    raw_pressure, raw_flow = recover_raw(pressure, flow, regime, table)
+
+    new_regime, new_table = settings_regimes(corrected_history(history, drop, override), t)
+    df.iloc[:, 1], df.iloc[:, 3] = apply_settings(raw_pressure, raw_flow, new_regime, new_table)
+    return df
+
+
+# ===========================================================
+# ===                       CLI                           ===
+# ===========================================================
+
+if __name__ == "__main__":
+    # python reprocess.py <carpeta>                      -> lista el historial de ajustes
+    # python reprocess.py <carpeta> --drop 2 --set 3=-1.5  -> escribe reprocessed.csv
+    args = sys.argv[1:]
+    if not args:
+        print("Uso: python reprocess.py <carpeta> [--drop N] [--set N=valor]")
+        sys.exit(1)
+    folder = args[0]
+    drop, override = [], {}
+    for flag, value in zip(args[1::2], args[2::2]):
+        if flag == "--drop":
+            drop.append(int(value))
+        elif flag == "--set":
+            idx, val = value.split("=")
+            override[int(idx)] = float(val)
+
+    history = SessionManifest.load(folder).data.get("settings_history", [])
+    if not drop and not override:
+        for i, h in enumerate(history):
+            print(f"[{i}] muestra {h['sample']}  t={h['t']}  {h['setting']}: {h['old']} -> {h['new']}  ({h['wall']})")
+        sys.exit(0)
+
+    out = os.path.join(folder, "reprocessed.csv")
+    reprocess_session(folder, drop, override).to_csv(out, index=False)
+    print(f"Sesión reprocesada en {out}")
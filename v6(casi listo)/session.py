@@ -0,0 +1,191 @@
+import os
+import re
+import json
+import threading
+from datetime import datetime
+
+from storage import atomic_write_json
+
+
+MANIFEST_FILE = "session.json"
+LEGACY_PATIENT_FILE = "patient_info.txt"
+MANIFEST_VERSION = 1
+# "firmware 1.2", "FW: v2.0.1", "versión 3.1", ... en las líneas de arranque del equipo
+FIRMWARE_PATTERN = re.compile(r"\b(?:firmware|fw|versi[oó]n|version|ver)\b\W*v?(\d+(?:\.\d+)+\w*)", re.IGNORECASE)
+
+
+def now_iso():
+    return datetime.now().astimezone().isoformat(timespec="seconds")
+
+
+def iso_to_epoch(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except ValueError:
+        return None
+
+
+def parse_firmware(lines):
+    """Versión de firmware anunciada en el banner del equipo, o None si no la informa."""
+    for line in lines:
+        match = FIRMWARE_PATTERN.search(line)
+        if match:
+            return match.group(1)
+    return None
+
+
+def default_channels(unit="mmHg"):
+    """Esquema de columnas de data.csv (orden, nombre de columna, unidad y resolución)."""
+    return [
+        {"name": "time", "column": "Time", "unit": "s", "resolution": 0.001},
+        {"name": "pressure", "column": f"Pressure ({unit})", "unit": unit, "resolution": 0.1},
+        {"name": "temperature", "column": "Temperature[°C]", "unit": "°C", "resolution": 0.1},
+        {"name": "flow", "column": "Flow[mL/min]", "unit": "mL/min", "resolution": 0.1},
+        {"name": "events", "column": "Events", "unit": None, "resolution": None},
+    ]
+
+
+class SessionManifest:
+    """
+    Manifiesto estructurado de una sesión (session.json): paciente, esquema de
+    canales, tiempos, ajustes y su historial, y estadísticas de resumen.
+    Cada guardado es atómico (archivo temporal + os.replace).
+    """
+
+    def __init__(self, folder, data):
+        self.folder = folder
+        self.path = os.path.join(folder, MANIFEST_FILE)
+        self.data = data
+        self.lock = threading.RLock()
+
+    # ---------- creación / carga ----------
+
+    @classmethod
+    def create(cls, folder, name, port=None, unit="mmHg", save=True):
+        data = {
+            "version": MANIFEST_VERSION,
+            "name": name,
+            "patient": {"organ_id": None, "blood_type": None, "liver_mass_g": None},
+            "device": {"port": port, "baudrate": 115200, "firmware": None, "banner": []},
+            "recording": {},
+            "channels": default_channels(unit),
+            "timing": {"created": now_iso(), "start": None, "end": None,
+                       "duration_s": None, "infuse_time": None, "sample_rate_hz": None},
+            "settings": {"pressure_offset": 0.0, "flow_offset": 0.0, "flow_direction": 1},
+            "settings_history": [],
+            "summary": {"samples": 0, "channels": {}},
+        }
+        manifest = cls(folder, data)
+        if save:
+            manifest.save()
+        return manifest
+
+    @classmethod
+    def load(cls, folder):
+        """Lee session.json; en sesiones antiguas lo arma desde patient_info.txt (sin guardarlo)."""
+        path = os.path.join(folder, MANIFEST_FILE)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(folder, json.load(f))
+        manifest = cls.create(folder, os.path.basename(os.path.normpath(folder)), save=False)
+        legacy = read_legacy_patient_info(folder)
+        manifest.data["timing"]["infuse_time"] = legacy.pop("infuse_time", None)
+        manifest.data["patient"].update(legacy)
+        return manifest
+
+    @staticmethod
+    def exists(folder):
+        return os.path.exists(os.path.join(folder, MANIFEST_FILE))
+
+    def save(self):
+        with self.lock:
+            atomic_write_json(self.path, self.data)
+
+    # ---------- accesos ----------
+
+    @property
+    def patient(self):
+        return self.data["patient"]
+
+    @property
+    def timing(self):
+        return self.data["timing"]
+
+    def set_patient(self, organ_id=None, blood_type=None, liver_mass_g=None):
+        with self.lock:
+            self.data["patient"].update(
+                {"organ_id": organ_id or None, "blood_type": blood_type or None,
+                 "liver_mass_g": liver_mass_g or None})
+            self.save()
+
+    def set_recording(self, **options):
+        """Formato de archivo, segmentos, pirámide, etc."""
+        with self.lock:
+            self.data["recording"].update(options)
+            self.save()
+
+    def start(self):
+        with self.lock:
+            self.data["timing"]["start"] = now_iso()
+            self.save()
+
+    def finish(self, infuse_time):
+        with self.lock:
+            self.data["timing"]["end"] = now_iso()
+            self.data["timing"]["infuse_time"] = infuse_time
+            self.save()
+
+    def log_setting(self, setting, old, new, t=None, sample=None, value=None, raw=None):
+        """Agrega un cambio de transformación (offset, dirección) al historial."""
+        with self.lock:
+            self.data["settings"][setting] = new
+            self.data["settings_history"].append({
+                "wall": now_iso(), "t": t, "sample": sample,
+                "setting": setting, "old": old, "new": new,
+                "value": value, "raw": raw,
+            })
+            self.save()
+
+    def set_device_banner(self, lines):
+        with self.lock:
+            self.data["device"]["banner"] = list(lines)
+            firmware = parse_firmware(lines)
+            if firmware:
+                self.data["device"]["firmware"] = firmware
+            self.save()
+
+    def set_summary(self, scan):
+        """Guarda estadísticas calculadas por catalog.scan_session()."""
+        with self.lock:
+            duration = scan["duration"]
+            self.data["timing"]["duration_s"] = round(duration, 3)
+            if duration > 0:
+                self.data["timing"]["sample_rate_hz"] = round(scan["samples"] / duration, 3)
+            self.data["summary"] = {"samples": scan["samples"], "channels": scan["stats"]}
+            self.save()
+
+
+def read_legacy_patient_info(folder):
+    """Lee patient_info.txt (líneas `clave: valor` con claves libres)."""
+    info = {}
+    path = os.path.join(folder, LEGACY_PATIENT_FILE)
+    if not os.path.exists(path):
+        return info
+    with open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            if ":" not in line:
+                continue
+            key, val = line.split(":", 1)
+            key = key.strip().lower()
+            val = val.strip() or None
+            if "organ" in key:
+                info["organ_id"] = val
+            elif "blood" in key:
+                info["blood_type"] = val
+            elif "mass" in key:
+                info["liver_mass_g"] = val
+            elif "infuse" in key:
+                info["infuse_time"] = val
+    return info
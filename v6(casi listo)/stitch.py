@@ -0,0 +1,303 @@
+import os
+import sys
+import shutil
+
+import numpy as np
+
+from storage import open_text, read_binary, session_files, TimeIndexWriter, RESET_BACKSTEP
+from session import SessionManifest, LEGACY_PATIENT_FILE, iso_to_epoch
+
+
+DATA_NAMES = ("data.csv", "data.csv.gz", "data.csv.zst", "data.bin")
+
+
+# ===========================================================
+# ===          DETECCIÓN DE TRAMOS (RUNS)                 ===
+# ===========================================================
+
+def source_files(source):
+    """Archivos de datos de una fuente: un archivo, o la carpeta de una sesión (todos sus segmentos)."""
+    if os.path.isfile(source):
+        return session_files(source)
+    for name in DATA_NAMES:
+        path = os.path.join(source, name)
+        if os.path.exists(path):
+            return session_files(path)
+    return []
+
+
+def iter_lines(path):
+    """Líneas de un registro de texto (plano o comprimido) o de un .bin convertido a CSV."""
+    if path.endswith(".bin"):
+        yield from read_binary(path).to_csv(index=False).splitlines(keepends=True)
+        return
+    with open_text(path) as f:
+        yield from f
+
+
+def _parse_time(line):
+    parts = line.split(",", 4)
+    if len(parts) < 4:
+        return None  # línea cortada (p. ej. al cerrar la app a mitad de escritura)
+    try:
+        return float(parts[0])
+    except ValueError:
+        return None
+
+
+def find_runs(path):
+    """
+    Recorre un archivo y lo divide en tramos continuos: un header a mitad
+    de archivo o un retroceso del tiempo mayor a RESET_BACKSTEP abre un
+    tramo nuevo. Cada tramo guarda su rango de líneas y de tiempo.
+    """
+    runs = []
+    header = None
+    run = None
+    for n, line in enumerate(iter_lines(path)):
+        t = _parse_time(line)
+        if t is None:
+            if line.startswith("Time"):
+                if header is not None and line.strip() != header.strip():
+                    print(f"[Stitch] Header distinto en {path}:{n + 1}, se usa el primero")
+                header = header or line
+                run = None  # el próximo dato abre un tramo nuevo
+            continue
+        if run is not None and t < run["t_last"] - RESET_BACKSTEP:
+            run = None
+        if run is None:
+            run = {"file": path, "first_line": n, "last_line": n,
+                   "t_first": t, "t_last": t, "rows": 0, "dt": []}
+            runs.append(run)
+        if len(run["dt"]) < 100 and t > run["t_last"]:
+            run["dt"].append(t - run["t_last"])
+        run["t_last"] = max(run["t_last"], t)
+        run["last_line"] = n
+        run["rows"] += 1
+    for r in runs:
+        r["dt"] = float(np.median(r["dt"])) if r["dt"] else 0.0
+        r["header"] = header
+    return runs
+
+
+def wall_anchors(folder, runs):
+    """
+    Hora real de los tramos de una carpeta: el inicio del primero sale del
+    manifiesto (o de patient_info.txt en sesiones antiguas) y el final del
+    último, del fin de la sesión o del mtime de los datos.
+    """
+    manifest = SessionManifest.load(folder)
+    start = iso_to_epoch(manifest.timing.get("start"))
+    if start is None and os.path.exists(os.path.join(folder, LEGACY_PATIENT_FILE)):
+        start = os.path.getmtime(os.path.join(folder, LEGACY_PATIENT_FILE))
+    end = iso_to_epoch(manifest.timing.get("end"))
+    if end is None:
+        end = os.path.getmtime(runs[-1]["file"])
+    if start is not None:
+        runs[0]["wall"] = (start, runs[0]["t_first"])
+    if len(runs) > 1 or start is None:
+        runs[-1]["wall"] = (end, runs[-1]["t_last"])
+
+
+def find_segments(sources):
+    """Tramos de todas las fuentes, en el orden dado (y dentro de cada una, en orden de archivo)."""
+    runs = []
+    for source in sources:
+        files = source_files(source)
+        if not files:
+            print(f"[Stitch] Sin datos en {source}")
+            continue
+        folder_runs = [r for path in files for r in find_runs(path)]
+        if folder_runs:
+            folder = source if os.path.isdir(source) else (os.path.dirname(source) or ".")
+            wall_anchors(folder, folder_runs)
+            runs.extend(folder_runs)
+    return runs
+
+
+# ===========================================================
+# ===                    ALINEACIÓN                       ===
+# ===========================================================
+
+def align_runs(runs, mode="wall", offsets=None):
+    """
+    Calcula el offset (s) que se suma al tiempo de cada tramo.
+      - offsets {índice: segundos}: dados por el usuario, tienen prioridad.
+      - "wall": según la hora real de cada tramo respecto del primero.
+      - "append" (o sin hora real, o si la hora real lo superpone con el
+        anterior): el tramo empieza un período de muestreo después del anterior.
+    El primer tramo conserva el tiempo original del equipo.
+    """
+    offsets = offsets or {}
+    origin = runs[0].get("wall") if runs else None
+    if origin is not None:
+        # hora real correspondiente a t_first del primer tramo
+        origin = origin[0] - (origin[1] - runs[0]["t_first"])
+    prev_end = None
+    for i, run in enumerate(runs):
+        if i in offsets:
+            run["offset"], run["align"] = float(offsets[i]), "user"
+        elif i == 0:
+            run["offset"], run["align"] = 0.0, "origin"
+        else:
+            appended = prev_end + run["dt"] - run["t_first"]
+            run["offset"], run["align"] = appended, "append"
+            if mode == "wall" and origin is not None and "wall" in run:
+                wall, t_anchor = run["wall"]
+                offset = runs[0]["t_first"] + (wall - origin) - t_anchor
+                if run["t_first"] + offset > prev_end:
+                    run["offset"], run["align"] = offset, "wall"
+                else:
+                    print(f"[Stitch] La hora real del tramo {i} lo superpone con el anterior, se concatena")
+        prev_end = run["t_last"] + run["offset"]
+    return runs
+
+
+def continuous_time(t, last_t=None, offset=0.0, step=0.0):
+    """
+    Empalma los resets del equipo en un bloque de tiempos: tras un retroceso
+    mayor a RESET_BACKSTEP, la muestra sigue a la anterior con el último
+    período positivo visto, así el resultado no depende de cómo se corten
+    los bloques. last_t, offset y step vienen del bloque anterior (None, 0
+    y 0 en el primero). Devuelve (tiempos continuos, offset, step) para
+    pasarle al bloque siguiente. Lo usan el almacén, el EDF y el visor.
+    """
+    t = np.asarray(t, dtype=float)
+    if len(t) == 0:
+        return t, offset, step
+    prev = np.concatenate(([t[0] if last_t is None else last_t], t[:-1]))
+    dt = t - prev
+    # período vigente en cada muestra: el último dt positivo (o el del bloque anterior)
+    last_positive = np.maximum.accumulate(np.where(dt > 0, np.arange(len(t)), -1))
+    steps = np.where(last_positive >= 0, dt[np.maximum(last_positive, 0)], step)
+    before = np.concatenate(([step], steps[:-1]))
+    jumps = np.where(dt < -RESET_BACKSTEP, prev - t + before, 0.0)
+    out = t + offset + np.cumsum(jumps)
+    return out, offset + float(jumps.sum()), float(steps[-1])
+
+
+def append_runs(t):
+    """
+    Versión en memoria para el visualizador: detecta los resets de un vector
+    de tiempo y desplaza cada tramo para que siga al anterior.
+    """
+    return continuous_time(t)[0]
+
+
+# ===========================================================
+# ===                     ESCRITURA                       ===
+# ===========================================================
+
+def stitch(sources, out_folder, mode="wall", offsets=None):
+    """
+    Escribe una sola sesión continua en out_folder/data.csv en dos pasadas
+    por cada archivo: find_runs lo recorre para ubicar los tramos (la
+    alineación necesita los límites de todos antes de escribir: el ancla de
+    hora real del último tramo es su t_last), y la escritura lo vuelve a leer
+    sumando a cada tramo su offset y descartando las filas que no avanzan en
+    el tiempo (duplicados por reconexión o superposición). Ninguna pasada
+    carga el archivo en memoria. Devuelve la lista de tramos con su offset y
+    filas escritas/descartadas.
+    """
+    runs = align_runs(find_segments(sources), mode, offsets)
+    if not runs:
+        raise ValueError("No se encontraron datos para unir")
+    os.makedirs(out_folder, exist_ok=True)
+    out_path = os.path.join(out_folder, "data.csv")
+    if os.path.exists(out_path):
+        raise FileExistsError(f"{out_path} ya existe")
+
+    index = TimeIndexWriter(out_path)
+    last_t = -np.inf
+    with open(out_path, "w", encoding="utf-8", newline="") as out:
+        out.write(runs[0]["header"].rstrip("\r\n") + "\n")
+        offset_bytes = out.tell()
+        lines = None
+        current = None
+        position = 0  # línea siguiente del iterador actual
+        for run in runs:
+            # Los tramos de un mismo archivo se leen con el mismo iterador
+            if run["file"] != current or run["first_line"] < position:
+                lines, current, position = iter_lines(run["file"]), run["file"], 0
+            run["written"] = run["dropped"] = 0
+            times, starts = [], []
+            for line in lines:
+                n = position
+                position += 1
+                if n < run["first_line"]:
+                    continue
+                t = _parse_time(line)
+                if t is not None:
+                    t_out = round(t + run["offset"], 3)
+                    if t_out <= last_t:
+                        run["dropped"] += 1
+                    else:
+                        row = f"{t_out:.3f},{line.split(',', 1)[1].rstrip(chr(13) + chr(10))}\n"
+                        out.write(row)
+                        times.append(t_out)
+                        starts.append(offset_bytes)
+                        offset_bytes += len(row.encode("utf-8"))
+                        last_t = t_out
+                        run["written"] += 1
+                if n >= run["last_line"]:
+                    break
+            index.add(times, starts)
+
+    _write_manifest(sources, out_folder, runs, mode)
+    return runs
+
+
+def _write_manifest(sources, out_folder, runs, mode):
+    first = next((s if os.path.isdir(s) else os.path.dirname(s) or "." for s in sources), ".")
+    manifest = SessionManifest.load(first)
+    manifest.folder = out_folder
+    manifest.path = os.path.join(out_folder, os.path.basename(manifest.path))
+    manifest.data["name"] = os.path.basename(os.path.normpath(out_folder))
+    manifest.data["stitch"] = {
+        "sources": [os.path.abspath(s) for s in sources],
+        "align": mode,
+        "runs": [{k: r[k] for k in ("file", "first_line", "last_line", "t_first", "t_last",
+                                     "offset", "align", "written", "dropped")} for r in runs],
+    }
+    manifest.save()
+    legacy = os.path.join(first, LEGACY_PATIENT_FILE)
+    if os.path.exists(legacy):
+        shutil.copy2(legacy, os.path.join(out_folder, LEGACY_PATIENT_FILE))
+
+
+def print_runs(runs):
+    for i, r in enumerate(runs):
+        shift = f"  +{r['offset']:.3f} s ({r['align']})" if "offset" in r else ""
+        print(f"[{i}] {r['file']}  líneas {r['first_line'] + 1}-{r['last_line'] + 1}  "
+              f"t={r['t_first']:.3f}..{r['t_last']:.3f}  {r['rows']} filas{shift}")
+
+
+# ===========================================================
+# ===                       CLI                           ===
+# ===========================================================
+
+if __name__ == "__main__":
+    # python stitch.py list <fuente> [...]                 -> muestra los tramos y los offsets propuestos
+    # python stitch.py <salida> <fuente> [...] [--align wall|append] [--offset N=segundos]
+    args = sys.argv[1:]
+    mode, offsets, positional = "wall", {}, []
+    it = iter(args)
+    for arg in it:
+        if arg == "--align":
+            mode = next(it)
+        elif arg == "--offset":
+            idx, val = next(it).split("=")
+            offsets[int(idx)] = float(val)
+        else:
+            positional.append(arg)
+
+    if len(positional) >= 2 and positional[0] == "list":
+        print_runs(align_runs(find_segments(positional[1:]), mode, offsets))
+    elif len(positional) >= 2:
+        runs = stitch(positional[1:], positional[0], mode, offsets)
+        print_runs(runs)
+        print(f"{sum(r['written'] for r in runs)} filas escritas, "
+              f"{sum(r['dropped'] for r in runs)} duplicadas descartadas -> {positional[0]}")
+    else:
+        print("Uso: python stitch.py list <fuente>... | <salida> <fuente>... "
+              "[--align wall|append] [--offset N=segundos]")
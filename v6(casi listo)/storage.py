@@ -0,0 +1,943 @@
+import io
+import sys
+import os
+import gzip
+import json
+import mmap
+import struct
+import shutil
+import hashlib
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from historian import has_historian, read_historian
+from codec import write_codec, read_codec
+
+try:
+    import zstandard
+except ImportError:  # zstd es opcional, gzip siempre está disponible
+    zstandard = None
+
+
+SEGMENTS_FILE = "segments.json"   # manifiesto de segmentos dentro de la carpeta de sesión
+EVENTS_FILE = "events.csv"        # hitos (tiempo, texto) para lectores que no cargan datos crudos
+PYRAMID_LEVELS = (10, 100, 1000)  # factores de decimación de la pirámide min/max
+CHANNELS = ("pressure", "temperature", "flow")  # columnas 1..3 de data.csv
+RESET_BACKSTEP = 0.5   # un retroceso mayor a esto (s) es un reset del equipo, no jitter
+
+
+FRAME_BYTES = 1024 * 1024        # tamaño máximo (sin comprimir) de cada frame
+FRAME_SECONDS = 60               # ... o segundos de datos por frame
+SEEK_SUFFIX = ".idx"             # tabla de saltos: data.csv.gz -> data.csv.gz.idx
+BIN_MAGIC = b"EOWEOBIN"
+BIN_HEADER = struct.Struct("<8sIIQ")  # magic, versión, columnas, filas válidas
+BIN_HEADER_SIZE = 128                 # header + nombres de columnas, relleno con ceros
+EXTENT_BYTES = 64 * 1024 * 1024       # el archivo binario crece de a 64 MB
+TIME_INDEX_SUFFIX = ".tidx"           # índice tiempo -> byte: data.csv -> data.csv.tidx
+TIME_INDEX_INTERVAL = 10              # una entrada cada 10 s de datos
+COLUMNAR_FILES = ("data.parquet", "data.npz", "data.qdc")  # sesiones convertidas por convert.py
+# Formato antiguo: un archivo por canal con header "x0000,y0000" y filas "t,v,"
+LEGACY_SPLIT_FILES = {"pressure": "presion.csv", "temperature": "temp.csv", "flow": "flow.csv"}
+LEGACY_COLUMNS = ["Time", "Pressure (mmHg)", "Temperature[°C]", "Flow[mL/min]", "Events"]
+
+
+def pyramid_name(factor):
+    return f"pyramid_{factor}x.csv"
+
+
+def atomic_write_json(path, data):
+    """Escribe un JSON en un archivo temporal y lo reemplaza de forma atómica."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def segment_name(base_name, number):
+    """data.csv, data_001.csv, data_002.csv, ..."""
+    if number == 0:
+        return base_name
+    root, ext = os.path.splitext(base_name)
+    return f"{root}_{number:03d}{ext}"
+
+
+# ===========================================================
+# ===               MANIFIESTO DE SEGMENTOS               ===
+# ===========================================================
+
+class SegmentManifest:
+    """Lista de segmentos de una sesión con rango de tiempo, filas y checksum."""
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.path = os.path.join(folder, SEGMENTS_FILE)
+        self.segments = []
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, "r", encoding="utf-8") as f:
+                    self.segments = json.load(f).get("segments", [])
+            except (OSError, ValueError) as e:
+                print(f"[SegmentManifest] No se pudo leer {self.path}: {e}")
+
+    def update(self, entry):
+        """Agrega o actualiza la entrada de un segmento (por nombre de archivo)."""
+        for i, seg in enumerate(self.segments):
+            if seg["file"] == entry["file"]:
+                self.segments[i] = entry
+                break
+        else:
+            self.segments.append(entry)
+
+    def save(self):
+        atomic_write_json(self.path, {"version": 1, "segments": self.segments})
+
+    def files(self):
+        return [os.path.join(self.folder, seg["file"]) for seg in self.segments]
+
+    def segments_for_range(self, t_start=None, t_end=None):
+        """Segmentos cuyo rango de tiempo se cruza con [t_start, t_end]."""
+        selected = []
+        for seg in self.segments:
+            if seg["rows"] == 0:
+                continue
+            # t_min/t_max cubren también los tramos posteriores a un reset del equipo
+            # (nulos o ausentes en manifiestos viejos: se usan t_start/t_end)
+            seg_min = seg.get("t_min")
+            seg_max = seg.get("t_max")
+            if t_start is not None and (seg["t_end"] if seg_max is None else seg_max) < t_start:
+                continue
+            if t_end is not None and (seg["t_start"] if seg_min is None else seg_min) > t_end:
+                continue
+            selected.append(seg)
+        return selected
+
+
+# ===========================================================
+# ===             ESCRITOR CSV POR SEGMENTOS              ===
+# ===========================================================
+
+class SegmentedCsvWriter:
+    """
+    Escribe bloques de datos en segmentos CSV que rotan por duración
+    (segundos de tiempo del equipo) o por tamaño en bytes.
+    """
+
+    def __init__(self, file_path, segment_duration=None, segment_max_bytes=None):
+        self.folder = os.path.dirname(file_path) or "."
+        self.base_name = os.path.basename(file_path)
+        self.segment_duration = segment_duration
+        self.segment_max_bytes = segment_max_bytes
+        self.manifest = SegmentManifest(self.folder)
+
+        # No se reutiliza nunca un segmento existente: una sesión nueva en la
+        # misma carpeta empieza en el siguiente número libre.
+        self.number = 0
+        while os.path.exists(os.path.join(self.folder, segment_name(self.base_name, self.number))):
+            self.number += 1
+        self._open_segment()
+
+    def _open_segment(self):
+        self.file_name = segment_name(self.base_name, self.number)
+        self.path = os.path.join(self.folder, self.file_name)
+        self.hasher = hashlib.sha256()
+        self.rows = 0
+        self.bytes = 0
+        self.t_start = None
+        self.t_end = None
+        self.t_min = None
+        self.t_max = None
+        self.header_written = False
+        self.time_index = TimeIndexWriter(self.path)
+
+    def _entry(self):
+        return {
+            "file": self.file_name,
+            "t_start": self.t_start,
+            "t_end": self.t_end,
+            "t_min": self.t_min,
+            "t_max": self.t_max,
+            "rows": self.rows,
+            "bytes": self.bytes,
+            "sha256": self.hasher.hexdigest(),
+        }
+
+    def _should_rotate(self):
+        if self.rows == 0:
+            return False
+        if self.segment_max_bytes and self.bytes >= self.segment_max_bytes:
+            return True
+        if self.segment_duration and self.t_end - self.t_start >= self.segment_duration:
+            return True
+        return False
+
+    def write_block(self, df):
+        if df.empty:
+            return
+        if self._should_rotate():
+            self.number += 1
+            self._open_segment()
+
+        with_header = not self.header_written
+        data = df.to_csv(index=False, header=with_header).encode("utf-8")
+        with open(self.path, "ab") as f:
+            f.write(data)
+        self.header_written = True
+
+        # Offset de inicio de cada fila para el índice tiempo -> byte
+        newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 0x0A)
+        starts = np.concatenate(([0], newlines[:-1] + 1)) + self.bytes
+        if with_header:
+            starts = starts[1:]
+        self.time_index.add(df.iloc[:, 0].to_numpy(dtype=float), starts)
+
+        self.hasher.update(data)
+        self.bytes += len(data)
+        self.rows += len(df)
+        t = df.iloc[:, 0]
+        if self.t_start is None:
+            self.t_start = float(t.iloc[0])
+            self.t_min = self.t_max = self.t_start
+        self.t_end = float(t.iloc[-1])
+        self.t_min = min(self.t_min, float(t.min()))
+        self.t_max = max(self.t_max, float(t.max()))
+
+        self.manifest.update(self._entry())
+        self.manifest.save()
+
+    def close(self):
+        if self.rows:
+            self.manifest.update(self._entry())
+            self.manifest.save()
+
+
+# ===========================================================
+# ===            ÍNDICE TIEMPO -> OFFSET EN BYTES         ===
+# ===========================================================
+
+class TimeIndexWriter:
+    """
+    Mantiene <csv>.tidx con pares (tiempo, offset de la fila) cada `interval`
+    segundos. Un salto hacia atrás del tiempo (reset del equipo) siempre
+    agrega una entrada, así los lectores pueden separar los tramos.
+    """
+
+    def __init__(self, csv_path, interval=TIME_INDEX_INTERVAL):
+        self.path = csv_path + TIME_INDEX_SUFFIX
+        self.interval = interval
+        self.last_t = None
+        self.prev_t = None
+
+    def add(self, t, offsets):
+        entries = []
+        for ti, off in zip(t, offsets):
+            if (self.last_t is None or ti - self.last_t >= self.interval
+                    or (self.prev_t is not None and ti < self.prev_t)):
+                entries.append(f"{ti},{off}\n")
+                self.last_t = ti
+            self.prev_t = ti
+        if entries:
+            new = not os.path.exists(self.path)
+            with open(self.path, "a", encoding="utf-8") as f:
+                if new:
+                    f.write("t,offset\n")
+                f.writelines(entries)
+
+
+def build_time_index(csv_path, interval=TIME_INDEX_INTERVAL):
+    """Genera el índice de un CSV ya grabado en una sola pasada. Devuelve las entradas escritas."""
+    index_path = csv_path + TIME_INDEX_SUFFIX
+    if os.path.exists(index_path):
+        os.remove(index_path)
+    writer = TimeIndexWriter(csv_path, interval)
+    times, offsets = [], []
+    with open(csv_path, "rb") as f:
+        offset = 0
+        for line in f:
+            try:
+                t = float(line.split(b",", 1)[0])
+            except ValueError:
+                t = None  # header (también los repetidos a mitad de archivo)
+            if t is not None:
+                times.append(t)
+                offsets.append(offset)
+            offset += len(line)
+            if len(times) >= 100000:
+                writer.add(times, offsets)
+                times, offsets = [], []
+    writer.add(times, offsets)
+    if not os.path.exists(index_path):
+        return 0
+    return len(pd.read_csv(index_path))
+
+
+def _byte_ranges(index, t_start, t_end, file_size):
+    """Rangos [inicio, fin) de bytes que contienen [t_start, t_end] en cada tramo monótono."""
+    t = index["t"].to_numpy()
+    off = index["offset"].to_numpy()
+    breaks = np.flatnonzero(np.diff(t) < 0) + 1
+    run_starts = np.concatenate(([0], breaks))
+    run_ends = np.concatenate((breaks, [len(t)]))
+    ranges = []
+    for a, b in zip(run_starts, run_ends):
+        rt = t[a:b]
+        end_of_run = off[b] if b < len(t) else file_size
+        if t_end is not None and rt[0] > t_end:
+            continue
+        i = 0 if t_start is None else max(np.searchsorted(rt, t_start, side="right") - 1, 0)
+        j = b - a if t_end is None else np.searchsorted(rt, t_end, side="right")
+        start = off[a + i]
+        stop = off[a + j] if a + j < b else end_of_run
+        if t_start is not None and j == b - a and t_start > rt[-1] + TIME_INDEX_INTERVAL * 2:
+            continue  # el tramo termina antes de t_start (margen por el último intervalo)
+        ranges.append((int(start), int(stop)))
+    return ranges
+
+
+def _parse_csv_bytes(data):
+    df = pd.read_csv(io.BytesIO(data))
+    # Un header repetido a mitad de archivo deja la columna como texto
+    if df.empty:
+        return df
+    df = df[pd.to_numeric(df.iloc[:, 0], errors="coerce").notna()]
+    return df.astype({c: float for c in df.columns[:4]})
+
+
+def _filter_time(df, t_start, t_end):
+    if df.empty:
+        return df
+    t = df.iloc[:, 0]
+    mask = pd.Series(True, index=df.index)
+    if t_start is not None:
+        mask &= t >= t_start
+    if t_end is not None:
+        mask &= t <= t_end
+    return df[mask].reset_index(drop=True)
+
+
+def read_time_window(csv_path, t_start=None, t_end=None):
+    """Lee solo la parte de un CSV que cubre [t_start, t_end] usando su índice .tidx."""
+    index_path = csv_path + TIME_INDEX_SUFFIX
+    if not os.path.exists(index_path) or (t_start is None and t_end is None):
+        with open(csv_path, "rb") as f:
+            return _filter_time(_parse_csv_bytes(f.read()), t_start, t_end)
+
+    index = pd.read_csv(index_path)
+    with open(csv_path, "rb") as f:
+        header = f.readline()
+        chunks = [header]
+        for start, stop in _byte_ranges(index, t_start, t_end, os.path.getsize(csv_path)):
+            f.seek(start)
+            chunks.append(f.read(stop - start))
+    return _filter_time(_parse_csv_bytes(b"".join(chunks)), t_start, t_end)
+
+
+# ===========================================================
+# ===         CSV COMPRIMIDO CON TABLA DE SALTOS          ===
+# ===========================================================
+
+def _compressor(codec):
+    if codec == "zst":
+        cctx = zstandard.ZstdCompressor(level=3)
+        return cctx.compress
+    return lambda data: gzip.compress(data, compresslevel=6)
+
+
+def _decompressor(codec):
+    if codec == "zst":
+        dctx = zstandard.ZstdDecompressor()
+        return dctx.decompress
+    return gzip.decompress
+
+
+class CompressedCsvWriter:
+    """
+    Escribe el CSV como una secuencia de frames gzip/zstd independientes de
+    tamaño acotado. El archivo completo sigue siendo un .csv.gz/.csv.zst
+    válido, y la tabla de saltos (<archivo>.idx) guarda offset, largo, rango
+    de tiempo (mínimo y máximo reales) y filas de cada frame para leer solo
+    los frames necesarios. Un reset del equipo cierra el frame en curso.
+    """
+
+    def __init__(self, file_path, codec="gz", frame_bytes=FRAME_BYTES, frame_seconds=FRAME_SECONDS):
+        if codec == "zst" and zstandard is None:
+            print("[CompressedCsvWriter] zstandard no instalado, se usa gzip.")
+            codec = "gz"
+        self.codec = codec
+        self.path = f"{file_path}.{codec}"
+        self.seek_path = self.path + SEEK_SUFFIX
+        self.frame_bytes = frame_bytes
+        self.frame_seconds = frame_seconds
+        self.compress = _compressor(codec)
+
+        self.pending = []
+        self.pending_bytes = 0
+        self.pending_rows = 0
+        self.t_min = None   # rango de tiempo del frame en curso
+        self.t_max = None
+        self.last_t = None  # último tiempo escrito, para detectar resets entre bloques
+        self.header_written = os.path.exists(self.path) and os.path.getsize(self.path) > 0
+        if not os.path.exists(self.seek_path):
+            with open(self.seek_path, "w", encoding="utf-8") as f:
+                f.write("offset,length,t_start,t_end,rows\n")
+
+    def write_block(self, df):
+        if df.empty:
+            return
+        # Tras un reset el tiempo vuelve a empezar: cada tramo va en frames propios
+        t = df.iloc[:, 0].to_numpy(dtype=float)
+        prev = np.concatenate(([np.nan if self.last_t is None else self.last_t], t[:-1]))
+        resets = np.flatnonzero(t < prev - RESET_BACKSTEP)
+        bounds = [0] + resets.tolist() + [len(df)]
+        for start, stop in zip(bounds[:-1], bounds[1:]):
+            if start in resets:
+                self._write_frame()
+            if stop > start:
+                self._append(df.iloc[start:stop], t[start:stop])
+        self.last_t = float(t[-1])
+
+    def _append(self, df, t):
+        data = df.to_csv(index=False, header=not self.header_written).encode("utf-8")
+        self.header_written = True
+        self.pending.append(data)
+        self.pending_bytes += len(data)
+        self.pending_rows += len(df)
+        lo, hi = float(np.nanmin(t)), float(np.nanmax(t))
+        self.t_min = lo if self.t_min is None else min(self.t_min, lo)
+        self.t_max = hi if self.t_max is None else max(self.t_max, hi)
+
+        if (self.pending_bytes >= self.frame_bytes
+                or self.t_max - self.t_min >= self.frame_seconds):
+            self._write_frame()
+
+    def _write_frame(self):
+        if not self.pending:
+            return
+        frame = self.compress(b"".join(self.pending))
+        with open(self.path, "ab") as f:
+            offset = f.tell()
+            f.write(frame)
+        with open(self.seek_path, "a", encoding="utf-8") as f:
+            f.write(f"{offset},{len(frame)},{self.t_min},{self.t_max},{self.pending_rows}\n")
+        self.pending = []
+        self.pending_bytes = 0
+        self.pending_rows = 0
+        self.t_min = None
+        self.t_max = None
+
+    def close(self):
+        self._write_frame()
+
+
+def open_text(path):
+    """Abre un CSV plano o comprimido (todos sus frames) como texto."""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8")
+    if path.endswith(".zst"):
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), read_across_frames=True)
+        return io.TextIOWrapper(reader, encoding="utf-8")
+    return open(path, "r", encoding="utf-8")
+
+
+def read_compressed_range(path, t_start=None, t_end=None):
+    """Descomprime solo los frames de path que cubren [t_start, t_end]."""
+    decompress = _decompressor("zst" if path.endswith(".zst") else "gz")
+    seek = pd.read_csv(path + SEEK_SUFFIX)
+    first_length = int(seek["length"].iloc[0]) if len(seek) else 0
+    if t_start is not None:
+        seek = seek[seek["t_end"] >= t_start]
+    if t_end is not None:
+        seek = seek[seek["t_start"] <= t_end]
+
+    chunks = []
+    with open(path, "rb") as f:
+        # El header solo está al inicio del primer frame
+        header = decompress(f.read(first_length)).partition(b"\n")[0] if first_length else b""
+        for offset, length in zip(seek["offset"], seek["length"]):
+            f.seek(offset)
+            text = decompress(f.read(length))
+            if offset == 0:
+                text = text.partition(b"\n")[2]
+            chunks.append(text)
+
+    if not header:
+        return pd.DataFrame()
+    df = pd.read_csv(io.BytesIO(header + b"\n" + b"".join(chunks)))
+    if t_start is not None:
+        df = df[df.iloc[:, 0] >= t_start]
+    if t_end is not None:
+        df = df[df.iloc[:, 0] <= t_end]
+    return df.reset_index(drop=True)
+
+
+# ===========================================================
+# ===      BINARIO PREASIGNADO Y MAPEADO EN MEMORIA       ===
+# ===========================================================
+
+class MmapRecordingWriter:
+    """
+    Graba Time/Pressure/Temperature/Flow como float64 en un archivo binario
+    preasignado por extents (fallocate en Linux) y escrito a través de un
+    mmap. El header guarda cuántas filas son válidas: se actualiza después de
+    escribir cada bloque, así un lector o una recuperación tras un corte sabe
+    dónde terminan los datos. Al cerrar se trunca al largo real.
+    """
+
+    def __init__(self, file_path, columns, extent_bytes=EXTENT_BYTES):
+        self.path = os.path.splitext(file_path)[0] + ".bin"
+        self.columns = list(columns)
+        self.ncols = len(self.columns)
+        self.row_bytes = 8 * self.ncols
+        self.extent_bytes = extent_bytes
+
+        exists = os.path.exists(self.path) and os.path.getsize(self.path) >= BIN_HEADER_SIZE
+        self.f = open(self.path, "r+b" if exists else "w+b")
+        if exists:
+            magic, _, ncols, self.rows = BIN_HEADER.unpack(self.f.read(BIN_HEADER.size))
+            if magic != BIN_MAGIC or ncols != self.ncols:
+                raise ValueError(f"{self.path} no es un registro binario compatible")
+        else:
+            self.rows = 0
+            names = ";".join(self.columns).encode("utf-8")[:BIN_HEADER_SIZE - BIN_HEADER.size]
+            header = BIN_HEADER.pack(BIN_MAGIC, 1, self.ncols, 0) + names
+            self.f.write(header.ljust(BIN_HEADER_SIZE, b"\0"))
+            self.f.flush()
+        self.mm = None
+        self._map(max(os.path.getsize(self.path), BIN_HEADER_SIZE + self.extent_bytes))
+
+    def _map(self, size):
+        """Reserva el archivo hasta `size` bytes y lo vuelve a mapear."""
+        if self.mm is not None:
+            self.mm.flush()
+            self.mm.close()
+        if os.path.getsize(self.path) < size:
+            if hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(self.f.fileno(), 0, size)
+            else:
+                self.f.truncate(size)
+        self.mm = mmap.mmap(self.f.fileno(), size)
+        self.capacity = (size - BIN_HEADER_SIZE) // self.row_bytes
+
+    def write_block(self, df):
+        if df.empty:
+            return
+        block = df.iloc[:, :self.ncols].to_numpy(dtype="<f8")
+        n = len(block)
+        if self.rows + n > self.capacity:
+            needed = BIN_HEADER_SIZE + (self.rows + n) * self.row_bytes
+            extents = -(-needed // self.extent_bytes)
+            self._map(extents * self.extent_bytes)
+
+        view = np.ndarray((self.capacity, self.ncols), dtype="<f8", buffer=self.mm, offset=BIN_HEADER_SIZE)
+        view[self.rows:self.rows + n] = block
+        del view
+        self.rows += n
+        # Primero los datos, después el contador de filas válidas
+        self.mm.flush()
+        struct.pack_into("<Q", self.mm, 16, self.rows)
+        self.mm.flush(0, mmap.PAGESIZE)
+
+    def close(self):
+        if self.mm is None:
+            return
+        struct.pack_into("<Q", self.mm, 16, self.rows)
+        self.mm.flush()
+        self.mm.close()
+        self.mm = None
+        self.f.truncate(BIN_HEADER_SIZE + self.rows * self.row_bytes)
+        self.f.close()
+
+
+def read_binary(path):
+    """DataFrame con las filas válidas de un registro binario (ignora lo preasignado)."""
+    with open(path, "rb") as f:
+        head = f.read(BIN_HEADER_SIZE)
+    magic, _, ncols, rows = BIN_HEADER.unpack(head[:BIN_HEADER.size])
+    if magic != BIN_MAGIC:
+        raise ValueError(f"{path} no es un registro binario")
+    names = head[BIN_HEADER.size:].rstrip(b"\0").decode("utf-8").split(";")
+    if rows == 0:
+        return pd.DataFrame(columns=names)
+    data = np.memmap(path, dtype="<f8", mode="r", offset=BIN_HEADER_SIZE, shape=(rows, ncols))
+    return pd.DataFrame(np.array(data), columns=names)
+
+
+# ===========================================================
+# ===           FORMATO COLUMNAR (ARCHIVO)                ===
+# ===========================================================
+
+def write_columnar(df, path):
+    """
+    Guarda una sesión completa en formato columnar: .parquet si pyarrow está
+    instalado, si no .npz comprimido (una columna por array; los hitos se
+    guardan dispersos como índice + texto), o .qdc (ver codec.py).
+    """
+    if path.endswith(".qdc"):
+        write_codec(df, path)
+        return
+    tmp = path + ".tmp"
+    if path.endswith(".parquet"):
+        df.to_parquet(tmp, index=False, compression="zstd")
+    else:
+        events = df.iloc[:, 4].fillna("").astype(str).to_numpy() if df.shape[1] > 4 else np.array([], dtype=str)
+        event_index = np.flatnonzero(events != "")
+        arrays = {f"c{i}": df.iloc[:, i].to_numpy(dtype=np.float64) for i in range(min(4, df.shape[1]))}
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, columns=np.array(list(df.columns), dtype=str), rows=np.int64(len(df)),
+                                event_index=event_index, event_text=events[event_index].astype(str), **arrays)
+    os.replace(tmp, path)
+
+
+def read_columnar(path):
+    if path.endswith(".qdc"):
+        return read_codec(path)
+    if path.endswith(".parquet"):
+        return pd.read_parquet(path)
+    with np.load(path, allow_pickle=False) as z:
+        columns = [str(c) for c in z["columns"]]
+        df = pd.DataFrame({name: z[f"c{i}"] for i, name in enumerate(columns[:4])})
+        if len(columns) > 4:
+            events = np.full(int(z["rows"]), "", dtype=object)
+            events[z["event_index"]] = z["event_text"]
+            df[columns[4]] = events
+    return df
+
+
+def columnar_path(folder):
+    """Archivo columnar existente de la sesión, o None."""
+    for name in COLUMNAR_FILES:
+        path = os.path.join(folder, name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def has_legacy_split(folder):
+    return any(os.path.exists(os.path.join(folder, f)) for f in LEGACY_SPLIT_FILES.values())
+
+
+def read_legacy_split(folder):
+    """
+    Une presion.csv / temp.csv / flow.csv en una tabla con las columnas de
+    data.csv. Cada canal tiene sus propios tiempos: se unen por tiempo y el
+    canal que no tiene muestra en ese instante queda en NaN.
+    """
+    merged = None
+    for channel, column in zip(CHANNELS, LEGACY_COLUMNS[1:4]):
+        path = os.path.join(folder, LEGACY_SPLIT_FILES[channel])
+        if not os.path.exists(path):
+            df = pd.DataFrame({"Time": pd.Series(dtype=float), column: pd.Series(dtype=float)})
+        else:
+            # index_col=False: la coma final de cada fila no debe convertir el tiempo en índice
+            df = pd.read_csv(path, index_col=False, usecols=[0, 1])
+            df.columns = ["Time", column]
+            df = df.drop_duplicates("Time", keep="last")
+        merged = df if merged is None else merged.merge(df, on="Time", how="outer")
+    merged = merged.sort_values("Time", kind="stable").reset_index(drop=True)
+    merged["Events"] = ""
+    return merged.astype({c: float for c in LEGACY_COLUMNS[:4]})
+
+
+# ===========================================================
+# ===                 REGISTRO DE HITOS                   ===
+# ===========================================================
+
+class EventLogWriter:
+    """Agrega los hitos de cada bloque a events.csv (tiempo, texto)."""
+
+    def __init__(self, folder):
+        self.path = os.path.join(folder, EVENTS_FILE)
+
+    def write_block(self, df):
+        events = df[df.iloc[:, -1].fillna("").astype(str) != ""]
+        if events.empty:
+            return
+        out = pd.DataFrame({"Time": events.iloc[:, 0], "Event": events.iloc[:, -1]})
+        out.to_csv(self.path, mode="a", index=False, header=not os.path.exists(self.path))
+
+    def close(self):
+        pass
+
+
+# ===========================================================
+# ===          PIRÁMIDE MIN/MAX EN TIEMPO DE ESCRITURA    ===
+# ===========================================================
+
+def _records(t, values):
+    """Convierte muestras crudas en buckets de una muestra."""
+    return {
+        "t_start": t, "t_end": t,
+        "min": values, "max": values, "sum": values,
+        "count": np.ones(len(t), dtype=np.int64),
+    }
+
+
+def _concat_records(a, b):
+    if a is None:
+        return b
+    return {k: np.concatenate((a[k], b[k])) for k in a}
+
+
+def _reduce_records(rec, ratio):
+    """Agrupa cada `ratio` buckets consecutivos en uno (len(rec) múltiplo de ratio)."""
+    n = len(rec["count"]) // ratio
+    return {
+        "t_start": rec["t_start"][::ratio],
+        "t_end": rec["t_end"][ratio - 1::ratio],
+        "min": rec["min"].reshape(n, ratio, -1).min(axis=1),
+        "max": rec["max"].reshape(n, ratio, -1).max(axis=1),
+        "sum": rec["sum"].reshape(n, ratio, -1).sum(axis=1),
+        "count": rec["count"].reshape(n, ratio).sum(axis=1),
+    }
+
+
+def _slice_records(rec, start, stop=None):
+    return {k: v[start:stop] for k, v in rec.items()}
+
+
+class PyramidWriter:
+    """
+    Mantiene niveles decimados (por defecto 10x, 100x y 1000x) mientras se
+    graba. Cada nivel guarda min, max, media y cantidad por bucket en
+    pyramid_<N>x.csv junto a los datos crudos.
+    """
+
+    def __init__(self, folder, levels=PYRAMID_LEVELS):
+        self.folder = folder
+        self.levels = sorted(levels)
+        self.ratios = []
+        prev = 1
+        for factor in self.levels:
+            if factor % prev:
+                raise ValueError(f"Nivel {factor}x no es múltiplo de {prev}x")
+            self.ratios.append(factor // prev)
+            prev = factor
+        self.pending = [None] * len(self.levels)
+        self.paths = [os.path.join(folder, pyramid_name(f)) for f in self.levels]
+
+    def write_block(self, df):
+        if df.empty:
+            return
+        t = df.iloc[:, 0].to_numpy(dtype=float)
+        values = df.iloc[:, 1:1 + len(CHANNELS)].to_numpy(dtype=float)
+        rec = _records(t, values)
+        for i, ratio in enumerate(self.ratios):
+            rec = _concat_records(self.pending[i], rec)
+            n_full = (len(rec["count"]) // ratio) * ratio
+            self.pending[i] = _slice_records(rec, n_full)
+            if n_full == 0:
+                break
+            rec = _reduce_records(_slice_records(rec, 0, n_full), ratio)
+            self._append(i, rec)
+
+    def _append(self, i, rec):
+        data = {"t_start": rec["t_start"], "t_end": rec["t_end"], "count": rec["count"]}
+        mean = rec["sum"] / rec["count"][:, None]
+        for c, name in enumerate(CHANNELS):
+            data[f"{name}_min"] = rec["min"][:, c]
+            data[f"{name}_max"] = rec["max"][:, c]
+            data[f"{name}_mean"] = np.round(mean[:, c], 3)
+        path = self.paths[i]
+        pd.DataFrame(data).to_csv(path, mode="a", index=False, header=not os.path.exists(path))
+
+    def close(self):
+        """Escribe los buckets incompletos de cada nivel."""
+        for i, ratio in enumerate(self.ratios):
+            rec = self.pending[i]
+            self.pending[i] = None
+            if rec is None or len(rec["count"]) == 0:
+                continue
+            partial = _reduce_records(rec, len(rec["count"]))
+            self._append(i, partial)
+            if i + 1 < len(self.levels):
+                self.pending[i + 1] = _concat_records(self.pending[i + 1], partial)
+
+
+def read_pyramid(folder, factor):
+    path = os.path.join(folder, pyramid_name(factor))
+    if not os.path.exists(path):
+        return None
+    return pd.read_csv(path).sort_values("t_start", kind="stable").reset_index(drop=True)
+
+
+def read_events(folder):
+    path = os.path.join(folder, EVENTS_FILE)
+    if not os.path.exists(path):
+        return pd.DataFrame(columns=["Time", "Event"])
+    return pd.read_csv(path, keep_default_na=False)
+
+
+class SessionLOD:
+    """
+    Nivel de detalle para visores: entrega la envolvente min/max del nivel de
+    la pirámide que corresponde al zoom, y solo lee datos crudos cuando el
+    rango visible tiene pocas muestras.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.levels = {}
+        for factor in PYRAMID_LEVELS:
+            df = read_pyramid(folder, factor)
+            if df is not None and not df.empty:
+                self.levels[factor] = df
+        self.events = read_events(folder)
+
+    @staticmethod
+    def available(folder):
+        return any(os.path.exists(os.path.join(folder, pyramid_name(f))) for f in PYRAMID_LEVELS)
+
+    def full_range(self):
+        df = self.levels[max(self.levels)]
+        return float(df["t_start"].min()), float(df["t_end"].max())
+
+    def query(self, t_start, t_end, max_points):
+        """
+        Devuelve {"kind", "t", <canal>: (media, min, max)} con a lo sumo
+        ~2*max_points buckets dentro de [t_start, t_end].
+        """
+        budget = max(2 * max_points, 2000)
+        finest = None
+        for factor in sorted(self.levels):
+            df = self.levels[factor]
+            sel = df[(df["t_end"] >= t_start) & (df["t_start"] <= t_end)]
+            if finest is None:
+                finest = sel
+            if len(sel) <= budget:
+                break
+
+        if finest is not None and finest["count"].sum() <= budget:
+            raw = read_range(self.folder, t_start, t_end)
+            if not raw.empty:
+                raw = raw.sort_values(raw.columns[0], kind="stable")
+                out = {"kind": "raw", "t": raw.iloc[:, 0].to_numpy()}
+                for c, name in enumerate(CHANNELS):
+                    y = raw.iloc[:, c + 1].to_numpy()
+                    out[name] = (y, y, y)
+                return out
+
+        out = {"kind": "envelope", "t": ((sel["t_start"] + sel["t_end"]) / 2).to_numpy()}
+        for name in CHANNELS:
+            out[name] = (sel[f"{name}_mean"].to_numpy(),
+                         sel[f"{name}_min"].to_numpy(),
+                         sel[f"{name}_max"].to_numpy())
+        return out
+
+
+# ===========================================================
+# ===                 LECTURA POR RANGO                   ===
+# ===========================================================
+
+def session_files(csv_path):
+    """Archivos de la sesión a la que pertenece csv_path (todos sus segmentos)."""
+    folder = os.path.dirname(csv_path) or "."
+    manifest = SegmentManifest(folder)
+    files = manifest.files()
+    if any(os.path.samefile(f, csv_path) for f in files if os.path.exists(f)):
+        return [f for f in files if os.path.exists(f)]
+    return [csv_path]
+
+
+def read_range(folder, t_start=None, t_end=None):
+    """Lee solo los segmentos (y dentro de ellos, los bytes) que cubren [t_start, t_end]."""
+    manifest = SegmentManifest(folder)
+    if manifest.segments:
+        files = [os.path.join(folder, seg["file"]) for seg in manifest.segments_for_range(t_start, t_end)]
+    else:
+        for ext in (".gz", ".zst"):
+            compressed = os.path.join(folder, "data.csv" + ext)
+            if os.path.exists(compressed + SEEK_SUFFIX):
+                return read_compressed_range(compressed, t_start, t_end)
+        binary = os.path.join(folder, "data.bin")
+        if os.path.exists(binary):
+            return _filter_time(read_binary(binary), t_start, t_end)
+        plain = os.path.join(folder, "data.csv")
+        if not os.path.exists(plain):
+            # Sesiones convertidas a formato columnar o con el formato antiguo por canal
+            columnar = columnar_path(folder)
+            if columnar is not None and columnar.endswith(".qdc"):
+                return read_codec(columnar, t_start, t_end)  # solo decodifica los bloques de la ventana
+            if columnar is not None:
+                return _filter_time(read_columnar(columnar), t_start, t_end)
+            if has_legacy_split(folder):
+                return _filter_time(read_legacy_split(folder), t_start, t_end)
+            if has_historian(folder):
+                return read_historian(folder, t_start, t_end)
+        files = [plain]  # sesiones sin segmentar
+    frames = [read_time_window(path, t_start, t_end) for path in files]
+    if not frames:
+        return pd.DataFrame()
+    return pd.concat(frames, ignore_index=True)
+
+
+def verify_segments(folder):
+    """Comprueba los checksums del manifiesto. Devuelve la lista de segmentos corruptos."""
+    bad = []
+    for seg in SegmentManifest(folder).segments:
+        path = os.path.join(folder, seg["file"])
+        h = hashlib.sha256()
+        try:
+            with open(path, "rb") as f:
+                for chunk in iter(lambda: f.read(1 << 20), b""):
+                    h.update(chunk)
+        except OSError:
+            bad.append(seg["file"])
+            continue
+        if h.hexdigest() != seg["sha256"]:
+            bad.append(seg["file"])
+    return bad
+
+
+def check_segmented_reads():
+    """
+    Graba una sesión segmentada sintética (con un reset del equipo) y
+    comprueba que las lecturas acotadas devuelven exactamente las filas
+    escritas. Devuelve la lista de fallas (vacía si todo está bien).
+    """
+    folder = tempfile.mkdtemp(prefix="check_segments_")
+    try:
+        t = np.concatenate((np.arange(0, 20, 0.1), np.arange(0, 5, 0.1)))  # reset a los 20 s
+        df = pd.DataFrame({"Time": np.round(t, 3), "Pressure (mmHg)": np.arange(len(t), dtype=float),
+                           "Temperature[°C]": 37.0, "Flow[mL/min]": 150.0, "Events": ""})
+        writer = SegmentedCsvWriter(os.path.join(folder, "data.csv"), segment_duration=5)
+        for start in range(0, len(df), 25):
+            writer.write_block(df.iloc[start:start + 25])
+
+        failures = []
+        for t_start, t_end in ((3, 12), (0, 2), (15, 30), (None, None)):
+            expected = df[(df["Time"] >= (-np.inf if t_start is None else t_start))
+                          & (df["Time"] <= (np.inf if t_end is None else t_end))]
+            got = read_range(folder, t_start, t_end)
+            if sorted(got["Pressure (mmHg)"]) != sorted(expected["Pressure (mmHg)"]):
+                failures.append(f"read_range({t_start}, {t_end}): {len(got)} filas, se esperaban {len(expected)}")
+        return failures
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+
+# ===========================================================
+# ===                       CLI                           ===
+# ===========================================================
+
+if __name__ == "__main__":
+    # python storage.py index <data.csv> [...]       -> genera <csv>.tidx para archivos antiguos
+    # python storage.py window <data.csv> <t0> <t1>  -> imprime solo esas filas
+    # python storage.py check                        -> lecturas por rango sobre una sesión sintética
+    args = sys.argv[1:]
+    if len(args) >= 2 and args[0] == "index":
+        for path in args[1:]:
+            print(f"{path}: {build_time_index(path)} entradas")
+    elif len(args) == 4 and args[0] == "window":
+        print(read_time_window(args[1], float(args[2]), float(args[3])).to_csv(index=False), end="")
+    elif args == ["check"]:
+        failures = check_segmented_reads()
+        for line in failures:
+            print(f"FALLA {line}")
+        if failures:
+            sys.exit(1)
+        print("Lecturas por rango correctas.")
+    else:
+        print("Uso: python storage.py index <csv> [...] | window <csv> <t0> <t1> | check")
@@ -0,0 +1,480 @@
+import os
+import sys
+import time
+import sqlite3
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from codec import encode_series, decode_series
+from storage import read_range, CHANNELS
+from session import SessionManifest, LEGACY_PATIENT_FILE, iso_to_epoch
+from catalog import find_sessions, DATA_FILES
+from stitch import continuous_time
+
+
+TSSTORE_DIR = "tsstore"          # dentro de la carpeta de sesiones (tests/tsstore)
+INDEX_FILE = "index.sqlite"
+CHUNK_SECONDS = 60               # un chunk comprimido por canal cada 60 s de datos
+ROLLUP_SECONDS = 1               # agregados precalculados (suma, cuenta, min, max) por segundo
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session     TEXT PRIMARY KEY,
+    device      TEXT,
+    wall_start  REAL,
+    samples     INTEGER DEFAULT 0,
+    duration    REAL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id          INTEGER PRIMARY KEY,
+    session     TEXT NOT NULL,
+    device      TEXT,
+    channel     TEXT NOT NULL,
+    t_start     REAL NOT NULL,
+    t_end       REAL NOT NULL,
+    wall_start  REAL,
+    count       INTEGER,
+    sum         REAL,
+    min         REAL,
+    max         REAL,
+    file        TEXT,            -- NULL cuando la retención ya borró los datos crudos
+    offset      INTEGER,
+    length      INTEGER
+);
+CREATE INDEX IF NOT EXISTS chunks_range ON chunks(channel, session, t_start);
+CREATE INDEX IF NOT EXISTS chunks_wall ON chunks(wall_start);
+CREATE TABLE IF NOT EXISTS rollups (
+    session     TEXT NOT NULL,
+    channel     TEXT NOT NULL,
+    t           REAL NOT NULL,   -- inicio del segundo (tiempo desde el inicio de la sesión)
+    count       INTEGER,
+    sum         REAL,
+    min         REAL,
+    max         REAL
+);
+CREATE INDEX IF NOT EXISTS rollups_range ON rollups(channel, session, t);
+CREATE TABLE IF NOT EXISTS events (
+    session     TEXT NOT NULL,
+    t           REAL NOT NULL,
+    text        TEXT
+);
+CREATE TABLE IF NOT EXISTS retention (
+    channel     TEXT PRIMARY KEY,
+    raw_days    REAL NOT NULL
+);
+"""
+
+
+def _safe(name):
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in str(name or "sin_equipo"))
+
+
+def _rollup(t, v, width=ROLLUP_SECONDS):
+    """Agregados por segundo de un tramo ordenado: (t, count, sum, min, max)."""
+    ok = ~np.isnan(v)
+    t, v = t[ok], v[ok]
+    if len(t) == 0:
+        return []
+    b = np.floor(t / width)
+    starts = np.flatnonzero(np.concatenate(([True], b[1:] != b[:-1])))
+    counts = np.diff(np.concatenate((starts, [len(t)])))
+    return list(zip((b[starts] * width).tolist(), counts.tolist(),
+                    np.add.reduceat(v, starts).tolist(),
+                    np.minimum.reduceat(v, starts).tolist(),
+                    np.maximum.reduceat(v, starts).tolist()))
+
+
+# ===========================================================
+# ===                 ALMACÉN DE SERIES                   ===
+# ===========================================================
+
+class TSStore:
+    """
+    Almacén embebido de series de tiempo, solo de agregado al final:
+      - chunks/<equipo>/<día>/<canal>.chunks: chunks comprimidos (codec.py),
+        particionados por día de la hora real.
+      - index.sqlite: índice de chunks con rango de tiempo y min/max/suma/cuenta,
+        agregados por segundo, hitos y políticas de retención.
+    El tiempo de cada sesión es continuo (los resets se empalman) y empieza en 0.
+    """
+
+    def __init__(self, root=os.path.join("tests", TSSTORE_DIR)):
+        self.root = root
+        os.makedirs(os.path.join(root, "chunks"), exist_ok=True)
+        self.db_path = os.path.join(root, INDEX_FILE)
+        with self._connect() as con:
+            con.executescript(SCHEMA)
+
+    @staticmethod
+    def available(folder):
+        """True si la carpeta de sesiones que contiene a folder ya tiene almacén."""
+        return os.path.exists(os.path.join(os.path.dirname(os.path.abspath(folder)), TSSTORE_DIR, INDEX_FILE))
+
+    @classmethod
+    def for_session(cls, folder):
+        """Almacén que corresponde a una carpeta de sesión (tests/<sesión> -> tests/tsstore)."""
+        return cls(os.path.join(os.path.dirname(os.path.abspath(folder)), TSSTORE_DIR))
+
+    def session_key(self, folder):
+        """
+        Clave de una sesión: su ruta relativa a la carpeta de sesiones del
+        almacén ("1.0", "lote/1.0"), no solo el nombre, para que dos sesiones
+        homónimas en carpetas distintas no se pisen.
+        """
+        sessions_root = os.path.dirname(os.path.abspath(self.root))
+        return os.path.relpath(os.path.abspath(folder), sessions_root).replace(os.sep, "/")
+
+    def _connect(self):
+        con = sqlite3.connect(self.db_path, timeout=10)
+        con.row_factory = sqlite3.Row
+        return con
+
+    # ---------- escritura ----------
+
+    def register_session(self, session, device=None, wall_start=None):
+        with self._connect() as con:
+            con.execute("INSERT OR IGNORE INTO sessions (session, device, wall_start) VALUES (?,?,?)",
+                        (session, device, wall_start))
+            if wall_start is not None:
+                con.execute("UPDATE sessions SET wall_start = COALESCE(wall_start, ?) WHERE session = ?",
+                            (wall_start, session))
+
+    def has_session(self, session):
+        with self._connect() as con:
+            row = con.execute("SELECT 1 FROM chunks WHERE session = ? LIMIT 1", (session,)).fetchone()
+        return row is not None
+
+    def append(self, session, device, wall_start, series, events=(), samples=0, duration=0.0):
+        """
+        Agrega un chunk por canal. series = {canal: (t, valores)}; t en segundos
+        desde el inicio de la sesión. Todo el bloque entra en una transacción.
+        """
+        con = self._connect()
+        try:
+            for channel, (t, v) in series.items():
+                if len(t) == 0:
+                    continue
+                wall = (wall_start or time.time()) + float(t[0])
+                day = datetime.fromtimestamp(wall).strftime("%Y-%m-%d")
+                rel = os.path.join("chunks", _safe(device), day, f"{_safe(channel)}.chunks")
+                path = os.path.join(self.root, rel)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                payload = encode_series(t, v)
+                with open(path, "ab") as f:
+                    offset = f.tell()
+                    f.write(payload)
+                valid = v[~np.isnan(v)]
+                con.execute(
+                    "INSERT INTO chunks (session, device, channel, t_start, t_end, wall_start, count, sum,"
+                    " min, max, file, offset, length) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)",
+                    (session, device, channel, float(t[0]), float(t[-1]), wall, len(t),
+                     float(valid.sum()), float(valid.min()) if len(valid) else None,
+                     float(valid.max()) if len(valid) else None, rel, offset, len(payload)))
+                con.executemany("INSERT INTO rollups VALUES (?,?,?,?,?,?,?)",
+                                [(session, channel) + r for r in _rollup(t, v)])
+            con.executemany("INSERT INTO events VALUES (?,?,?)", [(session, t, txt) for t, txt in events])
+            con.execute("UPDATE sessions SET samples = samples + ?, duration = MAX(duration, ?) WHERE session = ?",
+                        (samples, duration, session))
+            con.commit()
+        finally:
+            con.close()
+
+    # ---------- retención ----------
+
+    def set_retention(self, channel, raw_days):
+        with self._connect() as con:
+            con.execute("INSERT OR REPLACE INTO retention VALUES (?,?)", (channel, raw_days))
+
+    def apply_retention(self, now=None):
+        """
+        Borra los datos crudos de los chunks más viejos que la política de su
+        canal. Los agregados (chunk y por segundo) se conservan. Devuelve
+        cuántos chunks perdieron los datos crudos.
+        """
+        now = now or time.time()
+        with self._connect() as con:
+            expired = 0
+            for row in con.execute("SELECT channel, raw_days FROM retention").fetchall():
+                cur = con.execute("UPDATE chunks SET file = NULL, offset = NULL, length = NULL "
+                                  "WHERE channel = ? AND file IS NOT NULL AND wall_start < ?",
+                                  (row["channel"], now - row["raw_days"] * 86400))
+                expired += cur.rowcount
+            live = {r["file"] for r in con.execute("SELECT DISTINCT file FROM chunks WHERE file IS NOT NULL")}
+        # Los archivos de partición sin chunks vivos se borran enteros
+        chunks_dir = os.path.join(self.root, "chunks")
+        for dirpath, _, files in os.walk(chunks_dir, topdown=False):
+            for name in files:
+                rel = os.path.relpath(os.path.join(dirpath, name), self.root)
+                if name.endswith(".chunks") and rel not in live:
+                    os.remove(os.path.join(dirpath, name))
+            if dirpath != chunks_dir and not os.listdir(dirpath):
+                os.rmdir(dirpath)
+        return expired
+
+    # ---------- consultas ----------
+
+    def sessions(self):
+        with self._connect() as con:
+            return [dict(r) for r in con.execute("SELECT * FROM sessions ORDER BY wall_start")]
+
+    def events(self, session):
+        with self._connect() as con:
+            rows = con.execute("SELECT t, text FROM events WHERE session = ? ORDER BY t", (session,)).fetchall()
+        return pd.DataFrame([tuple(r) for r in rows], columns=["Time", "Event"])
+
+    def _chunks(self, channel, t_start, t_end, sessions):
+        query = "SELECT * FROM chunks WHERE channel = ?"
+        args = [channel]
+        if t_start is not None:
+            query += " AND t_end >= ?"
+            args.append(t_start)
+        if t_end is not None:
+            query += " AND t_start <= ?"
+            args.append(t_end)
+        if sessions:
+            query += f" AND session IN ({','.join('?' * len(sessions))})"
+            args.extend(sessions)
+        query += " ORDER BY session, t_start"
+        with self._connect() as con:
+            return [dict(r) for r in con.execute(query, args)]
+
+    def _decode(self, chunks):
+        """Decodifica chunks (abriendo cada archivo de partición una sola vez)."""
+        out = {}
+        by_file = {}
+        for c in chunks:
+            if c["file"] is not None:
+                by_file.setdefault(c["file"], []).append(c)
+        for rel, items in by_file.items():
+            with open(os.path.join(self.root, rel), "rb") as f:
+                for c in sorted(items, key=lambda c: c["offset"]):
+                    f.seek(c["offset"])
+                    out[c["id"]] = decode_series(f.read(c["length"]), c["count"])
+        return out
+
+    def count(self, channel, t_start=None, t_end=None, sessions=None):
+        """Muestras aproximadas en el rango, solo con el índice."""
+        return sum(c["count"] for c in self._chunks(channel, t_start, t_end, sessions))
+
+    def query(self, channel, t_start=None, t_end=None, sessions=None, bucket=None):
+        """
+        Sin bucket: muestras crudas (session, t, value). Con bucket (s):
+        (session, t, mean, min, max, count) por intervalo. Si bucket es
+        múltiplo de ROLLUP_SECONDS la agregación se resuelve entera en SQLite
+        sobre los agregados por segundo, sin descomprimir chunks.
+        """
+        if bucket is not None and bucket >= ROLLUP_SECONDS and \
+                abs(bucket / ROLLUP_SECONDS - round(bucket / ROLLUP_SECONDS)) < 1e-9:
+            return self._query_rollups(channel, t_start, t_end, sessions, bucket)
+
+        chunks = self._chunks(channel, t_start, t_end, sessions)
+        decoded = self._decode(chunks)
+        parts = []
+        for c in chunks:
+            if c["id"] not in decoded:
+                continue  # datos crudos vencidos: solo quedan los agregados
+            t, v = decoded[c["id"]]
+            mask = np.ones(len(t), dtype=bool)
+            if t_start is not None:
+                mask &= t >= t_start
+            if t_end is not None:
+                mask &= t <= t_end
+            parts.append(pd.DataFrame({"session": c["session"], "t": t[mask], "value": v[mask]}))
+        raw = pd.concat(parts, ignore_index=True) if parts else \
+            pd.DataFrame({"session": pd.Series(dtype=str), "t": pd.Series(dtype=float),
+                          "value": pd.Series(dtype=float)})
+        if bucket is None:
+            return raw
+        raw["t"] = np.floor(raw["t"] / bucket) * bucket
+        out = raw.groupby(["session", "t"], sort=True)["value"].agg(["mean", "min", "max", "count"])
+        return out.reset_index()
+
+    def _query_rollups(self, channel, t_start, t_end, sessions, bucket):
+        query = ("SELECT session, CAST(t / ? AS INTEGER) * ? AS t, SUM(sum) / SUM(count) AS mean, "
+                 "MIN(min) AS min, MAX(max) AS max, SUM(count) AS count FROM rollups WHERE channel = ?")
+        args = [bucket, bucket, channel]
+        if t_start is not None:
+            query += " AND t >= ?"
+            args.append(np.floor(t_start / ROLLUP_SECONDS) * ROLLUP_SECONDS)
+        if t_end is not None:
+            query += " AND t <= ?"
+            args.append(t_end)
+        if sessions:
+            query += f" AND session IN ({','.join('?' * len(sessions))})"
+            args.extend(sessions)
+        query += " GROUP BY session, CAST(t / ? AS INTEGER) ORDER BY session, t"
+        args.append(bucket)
+        with self._connect() as con:
+            rows = con.execute(query, args).fetchall()
+        return pd.DataFrame([tuple(r) for r in rows], columns=["session", "t", "mean", "min", "max", "count"])
+
+
+# ===========================================================
+# ===             ESCRITOR (GRABACIÓN / IMPORTACIÓN)      ===
+# ===========================================================
+
+class TSStoreWriter:
+    """
+    Sumidero del WriterThread: acumula cada bloque y entrega al almacén un
+    chunk por canal cada CHUNK_SECONDS. Empalma los resets del equipo para
+    que el tiempo de la sesión sea continuo.
+    """
+
+    def __init__(self, store, session, device=None, wall_start=None):
+        self.store = store
+        self.session = session
+        self.device = device
+        self.wall_start = wall_start
+        self.t_first = None
+        self.last_t = None
+        self.offset = 0.0   # suma de los saltos por reset
+        self.step = 0.0     # último período visto (para empalmar un reset al inicio del bloque)
+        self.buffer = []
+        self.events = []
+        self.samples = 0
+
+    def _continuous(self, t):
+        out, self.offset, self.step = continuous_time(t, self.last_t, self.offset, self.step)
+        self.last_t = float(t[-1])
+        return out
+
+    def write_block(self, df):
+        if df.empty:
+            return
+        t = self._continuous(df.iloc[:, 0].to_numpy(dtype=float))
+        if self.t_first is None:
+            self.t_first = float(t[0])
+            if self.wall_start is None:
+                # hora real de la primera muestra del bloque (llega ~1 bloque tarde)
+                self.wall_start = time.time() - float(t[-1] - t[0])
+            self.store.register_session(self.session, self.device, self.wall_start)
+        elapsed = np.round(t - self.t_first, 3)
+        values = {name: df.iloc[:, i + 1].to_numpy(dtype=float) for i, name in enumerate(CHANNELS)}
+        self.buffer.append((elapsed, values))
+        if df.shape[1] > 4:
+            ev = df.iloc[:, 4].fillna("").astype(str).to_numpy()
+            self.events.extend((float(elapsed[i]), ev[i]) for i in np.flatnonzero(ev != ""))
+        self.samples += len(df)
+        if elapsed[-1] - self.buffer[0][0][0] >= CHUNK_SECONDS:
+            self.flush()
+
+    def flush(self, final=False):
+        """Entrega chunks de CHUNK_SECONDS; el resto queda en el buffer salvo al cerrar."""
+        if not self.buffer:
+            return
+        t = np.concatenate([b[0] for b in self.buffer])
+        values = {name: np.concatenate([b[1][name] for b in self.buffer]) for name in CHANNELS}
+        edges = np.searchsorted(t, np.arange(t[0] + CHUNK_SECONDS, t[-1] + CHUNK_SECONDS, CHUNK_SECONDS))
+        bounds = [0] + [int(e) for e in edges if 0 < e < len(t)] + [len(t)]
+        if not final:
+            bounds = bounds[:-1]  # el último tramo (incompleto) espera más datos
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            events = [e for e in self.events if t[a] <= e[0] <= t[b - 1]]
+            self.store.append(self.session, self.device, self.wall_start,
+                              {name: (t[a:b], v[a:b]) for name, v in values.items()}, events,
+                              samples=b - a, duration=float(t[b - 1]))
+        rest = bounds[-1]
+        self.buffer = [(t[rest:], {name: v[rest:] for name, v in values.items()})] if rest < len(t) else []
+        self.events = [e for e in self.events if rest < len(t) and e[0] >= t[rest]]
+
+    def close(self):
+        self.flush(final=True)
+
+
+def session_wall_start(folder):
+    """Hora real de inicio de una sesión grabada (manifiesto, o mtime de patient_info.txt)."""
+    start = iso_to_epoch(SessionManifest.load(folder).timing.get("start"))
+    legacy = os.path.join(folder, LEGACY_PATIENT_FILE)
+    if start is None and os.path.exists(legacy):
+        start = os.path.getmtime(legacy)
+    return start
+
+
+def import_session(store, folder, device=None):
+    """Carga una sesión ya grabada en el almacén (una sola vez por carpeta). Devuelve las filas."""
+    session = store.session_key(folder)
+    if store.has_session(session):
+        return 0
+    if not any(os.path.exists(os.path.join(folder, f)) for f in DATA_FILES):
+        return 0
+    df = read_range(folder)
+    if df.empty:
+        return 0
+    writer = TSStoreWriter(store, session, device, wall_start=session_wall_start(folder))
+    for start in range(0, len(df), 20000):
+        writer.write_block(df.iloc[start:start + 20000])
+    writer.close()
+    return len(df)
+
+
+# ===========================================================
+# ===              NIVEL DE DETALLE (VISOR)               ===
+# ===========================================================
+
+class StoreLOD:
+    """Misma interfaz que storage.SessionLOD, pero consultando el almacén."""
+
+    def __init__(self, store, session):
+        self.store = store
+        self.session = session
+        self.events = store.events(session)
+        info = next((s for s in store.sessions() if s["session"] == session), None)
+        self.levels = {"store": info} if info and store.has_session(session) else {}
+
+    def full_range(self):
+        return 0.0, float(self.levels["store"]["duration"])
+
+    def query(self, t_start, t_end, max_points):
+        budget = max(2 * max_points, 2000)
+        sessions = [self.session]
+        if self.store.count(CHANNELS[0], t_start, t_end, sessions) <= budget:
+            out = {"kind": "raw"}
+            for name in CHANNELS:
+                raw = self.store.query(name, t_start, t_end, sessions)
+                out["t"] = raw["t"].to_numpy()
+                y = raw["value"].to_numpy()
+                out[name] = (y, y, y)
+            return out
+        bucket = max((t_end - t_start) / max_points, ROLLUP_SECONDS)
+        bucket = np.ceil(bucket / ROLLUP_SECONDS) * ROLLUP_SECONDS
+        out = {"kind": "envelope"}
+        for name in CHANNELS:
+            agg = self.store.query(name, t_start, t_end, sessions, bucket=bucket)
+            out["t"] = agg["t"].to_numpy() + bucket / 2
+            out[name] = (agg["mean"].to_numpy(), agg["min"].to_numpy(), agg["max"].to_numpy())
+        return out
+
+
+# ===========================================================
+# ===                       CLI                           ===
+# ===========================================================
+
+if __name__ == "__main__":
+    # python tsstore.py import [carpeta de sesiones]
+    # python tsstore.py query <canal> <t0> <t1> [bucket]   -> p. ej. query pressure 0 1800 1
+    # python tsstore.py retention <canal> <días>           -> fija la política y la aplica
+    args = sys.argv[1:]
+    root = "tests"
+    store = TSStore(os.path.join(root, TSSTORE_DIR))
+    if args and args[0] == "import":
+        root = args[1] if len(args) > 1 else root
+        store = TSStore(os.path.join(root, TSSTORE_DIR))
+        t0 = time.perf_counter()
+        folders = [f for f in find_sessions(root) if os.path.basename(f) != TSSTORE_DIR]
+        rows = sum(import_session(store, f) for f in folders)
+        print(f"{len(folders)} sesiones, {rows} filas importadas en {time.perf_counter() - t0:.1f} s")
+    elif len(args) >= 4 and args[0] == "query":
+        bucket = float(args[4]) if len(args) > 4 else None
+        t0 = time.perf_counter()
+        df = store.query(args[1], float(args[2]), float(args[3]), bucket=bucket)
+        elapsed = time.perf_counter() - t0
+        print(df.to_string(index=False, max_rows=40))
+        print(f"{len(df)} filas en {elapsed * 1000:.1f} ms")
+    elif len(args) == 3 and args[0] == "retention":
+        store.set_retention(args[1], float(args[2]))
+        print(f"{store.apply_retention()} chunks sin datos crudos")
+    else:
+        print("Uso: python tsstore.py import [carpeta] | query <canal> <t0> <t1> [bucket] | "
+              "retention <canal> <días>")
@@ -46,6 +46,8 @@ def build_exe(source_file):
         "--onefile",
         "--windowed",
         "--exclude-module", "PyQt5",
+        # storage.py y demás módulos compartidos viven en la carpeta superior
+        "--paths", os.path.dirname(base_dir),
     ] + add_data_args + [source_file]
 
     print("\nEjecutando:")
@@ -2,12 +2,20 @@ import sys
 import os
 from PyQt6.QtWidgets import ( QApplication, QWidget, QPushButton, 
                              QLabel, QVBoxLayout, QFileDialog, QHBoxLayout)
-from PyQt6.QtCore import Qt
+from PyQt6.QtCore import Qt, QTimer
 import pyqtgraph as pg
 import numpy as np
 from PyQt6.QtGui import QPixmap
 from PyQt6.QtGui import QPalette, QColor, QIcon
 
+# Módulos compartidos con el grabador (carpeta superior)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import session_files, open_text, read_binary, read_events, read_range, SessionLOD, COLUMNAR_FILES
+from historian import HISTORIAN_FILES
+from tsstore import TSStore, StoreLOD
+from stitch import append_runs
+from markers import EventMarkers
+
 def resource_path(filename):
     if hasattr(sys, "_MEIPASS"):
         return os.path.join(sys._MEIPASS, filename)
@@ -78,7 +86,7 @@ def set_dark_mode(app):
 
 class PlotWindow(QWidget):
 
-    def __init__(self, t, pressure, temp, flow, events, path):
+    def __init__(self, t, pressure, temp, flow, events, path, lod=None):
         super().__init__()
         self.setWindowTitle(f"Visualicer -- {path}")
         self.setWindowIcon(QIcon(resource_path("ico2.png")))
@@ -121,6 +129,49 @@ class PlotWindow(QWidget):
         # EVENTOS
         self.add_events()
 
+        # PIRÁMIDE: envolvente min/max según zoom, crudo solo al acercarse
+        self.lod = lod
+        if self.lod is not None:
+            self._setup_lod()
+
+    # --------------------------------------------------------
+    def _setup_lod(self):
+        self.lod_plots = {"pressure": self.press_plot, "temperature": self.temp_plot, "flow": self.flow_plot}
+        for d in self.lod_plots.values():
+            color = d["curve"].opts["pen"].color()
+            color.setAlpha(70)
+            d["min"] = pg.PlotDataItem(pen=None)
+            d["max"] = pg.PlotDataItem(pen=None)
+            d["fill"] = pg.FillBetweenItem(d["min"], d["max"], brush=pg.mkBrush(color))
+            d["plot"].addItem(d["fill"])
+
+        # Un solo refresco tras terminar de hacer zoom/pan
+        self.lod_timer = QTimer(self)
+        self.lod_timer.setSingleShot(True)
+        self.lod_timer.setInterval(100)
+        self.lod_timer.timeout.connect(self.refresh_lod)
+        self.press_plot["plot"].sigXRangeChanged.connect(lambda *_: self.lod_timer.start())
+
+        t0, t1 = self.lod.full_range()
+        self.press_plot["plot"].setXRange(t0, t1, padding=0.02)
+        for d in self.lod_plots.values():
+            d["plot"].enableAutoRange(axis=pg.ViewBox.XAxis, enable=False)
+        self.refresh_lod()
+
+    def refresh_lod(self):
+        x0, x1 = self.press_plot["plot"].viewRange()[0]
+        width = max(self.press_plot["widget"].width(), 500)
+        data = self.lod.query(x0, x1, max_points=width)
+        for name, d in self.lod_plots.items():
+            mean, mn, mx = data[name]
+            d["curve"].setData(data["t"], mean)
+            if data["kind"] == "raw":
+                d["fill"].hide()
+            else:
+                d["min"].setData(data["t"], mn)
+                d["max"].setData(data["t"], mx)
+                d["fill"].show()
+
     # --------------------------------------------------------
     def create_plot(self, title, color):
         glw = pg.GraphicsLayoutWidget()
@@ -133,17 +184,23 @@ class PlotWindow(QWidget):
             connect='all'
         )
 
-        return {"widget": glw, "plot": plt, "curve": curve}
+        # Todos los hitos en un solo ítem (líneas en un path, etiquetas que no se pisan)
+        markers = EventMarkers(pen=pg.mkPen((180, 180, 180), style=Qt.PenStyle.DashLine))
+        plt.addItem(markers)
+
+        return {"widget": glw, "plot": plt, "curve": curve, "markers": markers}
 
     # --------------------------------------------------------
-    def add_events(self):
-        for i, txt in enumerate(self.events):
-            if txt and isinstance(txt, str):
-                t_event = self.t[i]
-                for d in [self.press_plot, self.flow_plot, self.temp_plot]:
-                    line = pg.InfiniteLine(t_event, angle=90,
-                                           pen=pg.mkPen((180, 180, 180), style=Qt.PenStyle.DashLine))
-                    d["plot"].addItem(line)
+    def add_events(self, t=None, events=None):
+        if t is None:
+            t, events = self.t, self.events
+        idx = [i for i, txt in enumerate(events) if txt and isinstance(txt, str)]
+        if not idx:
+            return
+        times = np.asarray(t)[idx]
+        labels = [events[i] for i in idx]
+        for d in [self.press_plot, self.flow_plot, self.temp_plot]:
+            d["markers"].extend(times, labels)
 
 class CSVSelector(QWidget):
     def __init__(self):
@@ -189,7 +246,7 @@ class CSVSelector(QWidget):
             self,
             "Seleccionar archivo CSV",
             "",
-            "CSV Files (*.csv)"
+            "Registros (*.csv *.csv.gz *.csv.zst *.bin *.npz *.parquet *.qdc)"
         )
         if file:
             self.csv_path = file
@@ -201,17 +258,61 @@ class CSVSelector(QWidget):
         if not self.csv_path:
             return
 
+        # Sesiones en el almacén compartido o con pirámide: no se cargan los datos crudos completos
+        folder = os.path.dirname(self.csv_path) or "."
+        if TSStore.available(folder):
+            store = TSStore.for_session(folder)
+            lod = StoreLOD(store, store.session_key(folder))
+            if lod.levels:
+                ev = lod.events
+                self.plot_window = PlotWindow(np.array([]), np.array([]), np.array([]), np.array([]), [],
+                                              path=self.csv_path, lod=lod)
+                self.plot_window.add_events(ev["Time"].to_numpy(), list(ev["Event"]))
+                self.plot_window.show()
+                return
+        if SessionLOD.available(folder):
+            lod = SessionLOD(folder)
+            if lod.levels:
+                ev = lod.events
+                self.plot_window = PlotWindow(np.array([]), np.array([]), np.array([]), np.array([]), [],
+                                              path=self.csv_path, lod=lod)
+                self.plot_window.add_events(ev["Time"].to_numpy(), list(ev["Event"]))
+                self.plot_window.show()
+                return
+
+        # Sesiones convertidas (convert.py) o grabadas en modo historiador
+        if os.path.basename(self.csv_path) in COLUMNAR_FILES + HISTORIAN_FILES:
+            df = read_range(folder)
+            data = df.iloc[:, :4].to_numpy(dtype=float)
+            events = list(df.iloc[:, 4].fillna("").astype(str)) if df.shape[1] > 4 else [""] * len(df)
+            self.plot_window = PlotWindow(append_runs(data[:, 0]), data[:, 1], data[:, 2], data[:, 3],
+                                          events, path=self.csv_path)
+            self.plot_window.show()
+            return
+
+        # Registro binario: columnas float64 + hitos en events.csv
+        if self.csv_path.endswith(".bin"):
+            data = read_binary(self.csv_path).to_numpy()
+            ev = read_events(folder)
+            self.plot_window = PlotWindow(data[:, 0], data[:, 1], data[:, 2], data[:, 3],
+                                          [""] * len(data), path=self.csv_path)
+            self.plot_window.add_events(ev["Time"].to_numpy(), list(ev["Event"]))
+            self.plot_window.show()
+            return
+
         t = []
         p = []
         temp = []
         flow = []
         events = []
 
-        with open(self.csv_path, "r", encoding="utf-8") as f:
-            lines = f.readlines()
+        # Si la sesión está segmentada se leen todos sus segmentos en orden
+        lines = []
+        for path in session_files(self.csv_path):
+            with open_text(path) as f:
+                lines.extend(f.readlines()[1:])  # Saltar el header de cada segmento
 
-        # Saltar la primera (header real)
-        for line in lines[1:]:
+        for line in lines:
             line = line.strip()
 
             # Saltar líneas vacías
@@ -239,7 +340,9 @@ class CSVSelector(QWidget):
             # Event puede venir vacío
             events.append(parts[4] if len(parts) > 4 else "")
 
-        t = np.array(t)
+        # Un reset del equipo reinicia el tiempo: los tramos se ponen uno
+        # detrás del otro en vez de mezclarse al ordenar (ver stitch.py)
+        t = append_runs(t)
         p = np.array(p)
         temp = np.array(temp)
         flow = np.array(flow)